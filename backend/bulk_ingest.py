@@ -0,0 +1,452 @@
+"""Bulk ingestion of a directory or archive of documents into the knowledge base.
+
+    python bulk_ingest.py statutes/ [--uploader-id seed] [--checkpoint statutes.sqlite3]
+    python bulk_ingest.py templates.zip --workers 8 --embed-batch 512
+
+PDFs and text files are extracted in a process pool, deduplicated by content
+hash (against the store and within the load), chunked, and streamed through
+the ingestion pipeline with chunks of many documents sharing each embedding
+batch and each vector store upsert. Every file's outcome is checkpointed, so
+running the same command again after an interruption skips finished files
+and resumes a partly written one under the same document_id. Prints a
+throughput report in documents and chunks per second at the end.
+"""
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import tarfile
+import zipfile
+import argparse
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    HYBRID_RETRIEVAL,
+    BULK_INGEST_WORKERS,
+    BULK_INGEST_EMBED_BATCH,
+    BULK_INGEST_WRITE_BATCH,
+    BULK_INGEST_DIR,
+)
+from ingest_pipeline import IngestProgress, run_pipeline
+from pdf_extraction import PDF_DOC_TIMEOUT_SECONDS, UPLOAD_SPOOL_DIR, extract_document_pages, new_extraction_pool
+from rag_utils import (
+    compute_doc_hash,
+    complete_document,
+    document_metadata,
+    embed_document_chunks,
+    find_document_by_hash,
+    iter_document_chunks,
+    sync_document_index,
+    sync_lexical_index,
+    write_chunks,
+)
+from lexical_index import get_lexical_index
+from vector_store import VectorStoreLocked, get_vector_store
+
+SUPPORTED_SUFFIXES = (".pdf", ".txt", ".md")
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+STARTED = "started"
+DONE = "done"
+DUPLICATE = "duplicate"
+FAILED = "failed"
+
+
+# ------------- corpus -------------
+
+def archive_suffix(name: str) -> Optional[str]:
+    lowered = name.lower()
+    return next((suffix for suffix in ARCHIVE_SUFFIXES if lowered.endswith(suffix)), None)
+
+
+@contextmanager
+def unpacked(source: str):
+    """The directory to read documents from: `source` itself, or an archive extracted to a temp dir"""
+    if os.path.isdir(source):
+        yield source
+        return
+    if not archive_suffix(source):
+        raise ValueError(f"Expected a directory or a {', '.join(ARCHIVE_SUFFIXES)} archive: {source}")
+
+    target = tempfile.mkdtemp(prefix="bulk-ingest-", dir=UPLOAD_SPOOL_DIR)
+    try:
+        if source.lower().endswith(".zip"):
+            with zipfile.ZipFile(source) as archive:
+                root = os.path.realpath(target)
+                for member in archive.namelist():
+                    if not os.path.realpath(os.path.join(target, member)).startswith(root + os.sep):
+                        raise ValueError(f"Archive member escapes the extraction directory: {member}")
+                archive.extractall(target)
+        else:
+            with tarfile.open(source) as archive:
+                # "data" rejects absolute paths, links out of the tree and device files
+                archive.extractall(target, filter="data")
+        yield target
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+
+
+def corpus_files(root: str) -> List[Tuple[str, str]]:
+    """(name relative to `root`, path) of every supported file under `root`, in a stable order"""
+    files = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.startswith(".") or not filename.lower().endswith(SUPPORTED_SUFFIXES):
+                continue
+            path = os.path.join(directory, filename)
+            files.append((os.path.relpath(path, root).replace(os.sep, "/"), path))
+    return files
+
+
+def checkpoint_path_for(source_key: str) -> str:
+    """Default checkpoint file of a source (an absolute path, or the hash of an uploaded archive)"""
+    digest = hashlib.sha256(source_key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(BULK_INGEST_DIR, f"{digest}.sqlite3")
+
+
+# ------------- checkpoint -------------
+
+class BulkCheckpoint:
+    """SQLite record of what happened to each file of a bulk load.
+
+    A file is `started` once its document_id is chosen and chunks may have
+    been written, then `done`, `duplicate` or `failed`. A rerun skips done
+    and duplicate files and reuses a started file's document_id, so its
+    chunks are overwritten rather than left behind.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                document_id TEXT,
+                doc_hash TEXT,
+                chunks INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )"""
+        )
+
+    def get(self, name: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute("SELECT * FROM files WHERE name = ?", (name,)).fetchone()
+
+    def mark(self, name: str, status: str, **fields: Any):
+        fields = {"status": status, **fields, "updated_at": time.time()}
+        columns = ", ".join(fields)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO files (name, {columns}) VALUES (?, {', '.join('?' for _ in fields)}) "
+                f"ON CONFLICT(name) DO UPDATE SET {updates}",
+                (name, *fields.values()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ------------- report -------------
+
+class BulkIngestReport:
+    """Counters of one bulk load, safe to read from other threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.files = 0
+        self.already_done = 0
+        self.ingested = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.extract_seconds = 0.0
+        self.progress = IngestProgress()
+
+    def add(self, **counts: float):
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def finish(self, error: Optional[str] = None):
+        with self._lock:
+            self.status = "failed" if error else "done"
+            self.error = error
+            self.finished_at = time.time()
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            chunks = self.progress.chunks_stored
+            return {
+                "status": self.status,
+                "error": self.error,
+                "files": self.files,
+                "already_done": self.already_done,
+                "ingested": self.ingested,
+                "duplicates": self.duplicates,
+                "failed": self.failed,
+                "chunks_stored": chunks,
+                "elapsed_seconds": round(elapsed, 2),
+                "extract_seconds": round(self.extract_seconds, 2),
+                "docs_per_sec": round(self.ingested / elapsed, 2) if elapsed > 0 else 0.0,
+                "chunks_per_sec": round(chunks / elapsed, 1) if elapsed > 0 else 0.0,
+            }
+
+    def summary(self) -> str:
+        r = self.as_dict()
+        return (
+            f"{r['files']} files: {r['ingested']} ingested, {r['duplicates']} duplicates, {r['failed']} failed, "
+            f"{r['already_done']} already done; {r['chunks_stored']} chunks in {r['elapsed_seconds']:.1f}s "
+            f"({r['docs_per_sec']:.2f} docs/s, {r['chunks_per_sec']:.1f} chunks/s)"
+        )
+
+
+# ------------- bulk load -------------
+
+def _extracted(
+    files: List[Tuple[str, str]], workers: int, report: BulkIngestReport
+) -> Iterator[Tuple[str, Optional[list], Optional[str]]]:
+    """(name, pages, error) per file, in order, extracting up to 2 x `workers` files ahead"""
+    pool = new_extraction_pool(workers)
+    window: deque = deque()
+    pending = iter(files)
+
+    def submit(name: str, path: str):
+        window.append((name, path, pool.submit(extract_document_pages, path)))
+
+    def refill():
+        while len(window) < 2 * workers:
+            item = next(pending, None)
+            if item is None:
+                return
+            submit(*item)
+
+    try:
+        refill()
+        while window:
+            name, path, future = window.popleft()
+            started = time.perf_counter()
+            try:
+                pages, error = future.result(timeout=PDF_DOC_TIMEOUT_SECONDS), None
+            except FutureTimeout:
+                pages, error = None, f"extraction exceeded {PDF_DOC_TIMEOUT_SECONDS:.0f}s"
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); give the files still queued a fresh pool
+                pages, error = None, "extraction worker crashed"
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_extraction_pool(workers)
+                queued = [(n, p) for n, p, _ in window]
+                window.clear()
+                for item in queued:
+                    submit(*item)
+            except Exception as e:
+                pages, error = None, str(e) or type(e).__name__
+            report.add(extract_seconds=time.perf_counter() - started)
+            refill()
+            yield name, pages, error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_bulk_ingest(
+    source: str,
+    checkpoint_path: Optional[str] = None,
+    uploader_id: Optional[str] = None,
+    report: Optional[BulkIngestReport] = None,
+    workers: int = BULK_INGEST_WORKERS,
+    embed_batch: int = BULK_INGEST_EMBED_BATCH,
+    write_batch: int = BULK_INGEST_WRITE_BATCH,
+) -> BulkIngestReport:
+    """Ingest every document in a directory or archive (see the module docstring)"""
+    report = report or BulkIngestReport()
+    checkpoint = BulkCheckpoint(checkpoint_path or checkpoint_path_for(os.path.abspath(source)))
+    # Duplicate checks then hit the local index instead of the vector store
+    sync_document_index()
+    sync_lexical_index()
+    collection = get_vector_store()
+    seen: Dict[str, str] = {}  # doc_hash -> document_id within this load
+    last_chunks: Dict[int, Tuple[str, str, str, int]] = {}  # position of a document's last chunk -> its file
+    lock = threading.Lock()
+
+    def skip(name: str, status: str, **fields: Any):
+        checkpoint.mark(name, status, **fields)
+        report.add(**{"duplicates" if status == DUPLICATE else "failed": 1})
+        if status == FAILED:
+            print(f"✗ {name}: {fields.get('error')}")
+
+    def chunks(files: List[Tuple[str, str]], resume_ids: Dict[str, str]):
+        position = 0
+        for name, pages, error in _extracted(files, workers, report):
+            if error:
+                skip(name, FAILED, error=error)
+                continue
+            texts = [page.text for page in pages]
+            doc_hash = compute_doc_hash("\n".join(texts))
+            doc_id = resume_ids.get(name)
+            owner = seen.get(doc_hash) or find_document_by_hash(doc_hash)
+            if owner and owner == doc_id:
+                # Completed by an earlier run that stopped before recording it
+                checkpoint.mark(name, DONE, document_id=doc_id, doc_hash=doc_hash)
+                report.add(ingested=1)
+                continue
+            if owner:
+                skip(name, DUPLICATE, document_id=owner, doc_hash=doc_hash)
+                continue
+
+            if doc_id and HYBRID_RETRIEVAL:
+                get_lexical_index().remove_document(doc_id)
+            doc_id = doc_id or str(uuid.uuid4())
+            base_meta = document_metadata(doc_id, "admin", uploader_id, {"source_filename": name, "source": "bulk_ingest"})
+            doc_chunks = list(iter_document_chunks(texts, base_meta))
+            if not doc_chunks:
+                skip(name, FAILED, error="Could not read any text from this file.")
+                continue
+            seen[doc_hash] = doc_id
+            checkpoint.mark(name, STARTED, document_id=doc_id, doc_hash=doc_hash, error=None)
+            report.progress.add(pages_extracted=len(pages))
+            with lock:
+                last_chunks[position + len(doc_chunks) - 1] = (name, doc_id, doc_hash, len(doc_chunks))
+            for _, text, metadata in doc_chunks:
+                yield position, text, metadata
+                position += 1
+
+    def write(positions, texts, metadatas, embeddings):
+        write_chunks(collection, texts, metadatas, embeddings)
+        # Writes land in order, so a document is complete once its last chunk is written
+        for position in positions:
+            with lock:
+                finished = last_chunks.pop(position, None)
+            if finished is None:
+                continue
+            name, doc_id, doc_hash, total = finished
+            owner = complete_document(collection, doc_id, doc_hash, total)
+            if owner is not None:
+                skip(name, DUPLICATE, document_id=owner, doc_hash=doc_hash)
+            else:
+                checkpoint.mark(name, DONE, chunks=total)
+                report.add(ingested=1)
+
+    try:
+        with unpacked(source) as root:
+            files = corpus_files(root)
+            report.add(files=len(files))
+            todo, resume_ids = [], {}
+            for name, path in files:
+                entry = checkpoint.get(name)
+                if entry is not None and entry["status"] in (DONE, DUPLICATE):
+                    report.add(already_done=1)
+                    continue
+                if entry is not None and entry["status"] == STARTED and entry["document_id"]:
+                    resume_ids[name] = entry["document_id"]
+                todo.append((name, path))
+            print(f"⏳ Bulk ingest of {len(todo)} files ({report.already_done} already done) from {source}")
+
+            run_pipeline(
+                chunks(todo, resume_ids),
+                embed_fn=lambda batch: embed_document_chunks(collection, batch),
+                write_fn=write,
+                progress=report.progress,
+                embed_batch=embed_batch,
+                write_batch=write_batch,
+            )
+    except Exception as e:
+        report.finish(error=str(e))
+        print(f"✗ Bulk ingest stopped: {e}. Run it again to resume. {report.summary()}")
+        raise
+    finally:
+        checkpoint.close()
+
+    report.finish()
+    print(f"✓ Bulk ingest finished: {report.summary()}")
+    return report
+
+
+# ------------- background runs (admin endpoint) -------------
+
+_runs: Dict[str, BulkIngestReport] = {}
+_runs_lock = threading.Lock()
+
+
+def start_bulk_ingest(
+    source: str,
+    checkpoint_path: str,
+    uploader_id: Optional[str] = None,
+    on_finish: Optional[Callable[[], None]] = None,
+) -> str:
+    """Run a bulk load in a background thread and return its run id. One load runs at a time."""
+    with _runs_lock:
+        if any(r.status == "running" for r in _runs.values()):
+            raise RuntimeError("A bulk ingest is already running")
+        run_id = str(uuid.uuid4())
+        report = _runs[run_id] = BulkIngestReport()
+
+    def run():
+        try:
+            run_bulk_ingest(source, checkpoint_path, uploader_id, report)
+        except Exception:
+            pass  # recorded in the report
+        finally:
+            if on_finish:
+                on_finish()
+
+    threading.Thread(target=run, name="bulk-ingest", daemon=True).start()
+    return run_id
+
+
+def bulk_ingest_status(run_id: str) -> Optional[Dict[str, Any]]:
+    report = _runs.get(run_id)
+    return None if report is None else {"run_id": run_id, **report.as_dict()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="directory or .zip/.tar/.tar.gz archive of PDF and text files")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: one per source under BULK_INGEST_DIR)")
+    parser.add_argument("--uploader-id")
+    parser.add_argument("--workers", type=int, default=BULK_INGEST_WORKERS, help="extraction processes")
+    parser.add_argument("--embed-batch", type=int, default=BULK_INGEST_EMBED_BATCH)
+    parser.add_argument("--write-batch", type=int, default=BULK_INGEST_WRITE_BATCH)
+    args = parser.parse_args()
+
+    try:
+        # The local store belongs to one process; fail before any work if the server has it open
+        get_vector_store()
+    except VectorStoreLocked as e:
+        print(f"✗ {e}. Stop the server first, or load the corpus through POST /admin/bulk-ingest.")
+        raise SystemExit(1)
+
+    try:
+        run_bulk_ingest(
+            args.source,
+            checkpoint_path=args.checkpoint,
+            uploader_id=args.uploader_id,
+            workers=max(1, args.workers),
+            embed_batch=max(1, args.embed_batch),
+            write_batch=max(1, args.write_batch),
+        )
+    except Exception:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
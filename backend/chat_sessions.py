@@ -0,0 +1,179 @@
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, NamedTuple, Optional
+
+from config import (
+    CHAT_SESSION_MAX,
+    CHAT_SESSION_TTL_SECONDS,
+    CHAT_HISTORY_TURNS,
+    CHAT_REUSE_SIMILARITY,
+)
+from vector_ops import cosine_similarities
+
+_MAX_ANSWER_CHARS = 1500  # per answer quoted back into the prompt
+
+SUMMARY_PROMPT = """Update the summary of a conversation about a legal document.
+Keep what the user asked about, the facts and clauses the answers relied on, and anything the user said about themselves. At most 150 words.
+
+Summary so far:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+
+class ChatTurn(NamedTuple):
+    question: str
+    answer: str
+
+
+def _format_turns(turns) -> str:
+    return "\n".join(f"User: {t.question}\nAssistant: {t.answer[:_MAX_ANSWER_CHARS]}" for t in turns)
+
+
+class ChatSession:
+    """One conversation about one document.
+
+    The last `CHAT_HISTORY_TURNS` turns are kept verbatim; older ones are
+    folded into `summary` by compact(). The chunks retrieved for the
+    previous turn are kept so a follow-up on the same topic can skip the
+    vector store.
+    """
+
+    def __init__(self, session_id: str, document_id: str):
+        self.session_id = session_id
+        self.document_id = document_id
+        self.summary = ""
+        self.turns: Deque[ChatTurn] = deque()
+        self.updated_at = time.time()
+        self.last_query_embedding = None
+        self.last_retrieved = None  # rag_utils.RetrievedContext
+        self._compacting = False
+        self._lock = threading.Lock()
+
+    @property
+    def last_question(self) -> Optional[str]:
+        with self._lock:
+            return self.turns[-1].question if self.turns else None
+
+    def history_text(self) -> str:
+        """Summary of earlier turns plus the recent ones, for the prompt ("" for a new session)"""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation: {self.summary}")
+            if self.turns:
+                parts.append(_format_turns(self.turns))
+            return "\n".join(parts)
+
+    def add_turn(self, question: str, answer: str):
+        with self._lock:
+            self.turns.append(ChatTurn(question, answer))
+            # Hard cap in case compaction keeps failing
+            while len(self.turns) > 2 * CHAT_HISTORY_TURNS:
+                self.turns.popleft()
+            self.updated_at = time.time()
+
+    def remember_retrieval(self, query_embedding, retrieved):
+        with self._lock:
+            self.last_query_embedding = query_embedding
+            self.last_retrieved = retrieved
+
+    def reusable_retrieval(self, query_embedding, threshold: float = CHAT_REUSE_SIMILARITY):
+        """The previous turn's chunks if this query embedding is within `threshold` cosine of its query"""
+        with self._lock:
+            previous, retrieved = self.last_query_embedding, self.last_retrieved
+        if previous is None or retrieved is None:
+            return None, None
+        similarity = float(cosine_similarities(query_embedding, [previous])[0])
+        return (retrieved if similarity >= threshold else None), similarity
+
+    async def compact(self, llm: Callable[[str], Awaitable[str]]):
+        """Fold turns beyond CHAT_HISTORY_TURNS into the running summary with one LLM call"""
+        with self._lock:
+            if self._compacting or len(self.turns) <= CHAT_HISTORY_TURNS:
+                return
+            self._compacting = True
+            old = list(self.turns)[: len(self.turns) - CHAT_HISTORY_TURNS]
+            summary = self.summary
+        try:
+            prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", turns=_format_turns(old))
+            new_summary = (await llm(prompt)).strip()
+            with self._lock:
+                # Only the turns that were summarized are dropped; newer ones may have arrived
+                for turn in old:
+                    if self.turns and self.turns[0] is turn:
+                        self.turns.popleft()
+                self.summary = new_summary
+        except Exception as e:
+            print(f"✗ Failed to summarize chat history for session {self.session_id}: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+
+class ChatSessionStore:
+    """In-memory chat sessions: LRU bounded by `max_sessions`, idle ones expire after `ttl` seconds"""
+
+    def __init__(self, max_sessions: int = CHAT_SESSION_MAX, ttl: float = CHAT_SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if session.updated_at + self.ttl <= time.time():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id: Optional[str], document_id: str) -> ChatSession:
+        """The session `session_id`, or a new one if it is unknown, expired or about another document"""
+        session = self.get(session_id) if session_id else None
+        if session is not None and session.document_id == document_id:
+            return session
+
+        session = ChatSession(str(uuid.uuid4()), document_id)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            now = time.time()
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if len(self._sessions) <= self.max_sessions and oldest.updated_at + self.ttl > now:
+                    break
+                del self._sessions[oldest_id]
+                self.evictions += 1
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "evictions": self.evictions}
+
+
+# Global store for /chat
+chat_sessions = ChatSessionStore()
+
+# The event loop only keeps weak references to tasks
+_compactions = set()
+
+
+def compact_in_background(session: ChatSession, llm: Callable[[str], Awaitable[str]]):
+    """Summarize older turns without holding up the response"""
+    task = asyncio.get_running_loop().create_task(session.compact(llm))
+    _compactions.add(task)
+    task.add_done_callback(_compactions.discard)
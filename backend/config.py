@@ -1,20 +1,24 @@
 import os
+import threading
 from dotenv import load_dotenv
 
-import google.generativeai as genai
-from groq import Groq
+# google.generativeai and groq are imported on first use (see get_genai / get_groq_client):
+# together they take about a second to import, which every startup and --reload would pay
 
 load_dotenv()
 
 # GEMINI_API_KEY is optional - only needed for embedding fallback if local embeddings fail
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# "chroma" = Chroma Cloud; "local" = in-process store (see LOCAL_VECTOR_STORE_DIR below)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma").strip().lower()
+
 CHROMA_API_KEY = os.getenv("CHROMA_API_KEY")
 CHROMA_TENANT = os.getenv("CHROMA_TENANT")
 CHROMA_DATABASE = os.getenv("CHROMA_DATABASE", "").strip()  # Remove spaces
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "legalease_docs")
 
-if not (CHROMA_API_KEY and CHROMA_TENANT and CHROMA_DATABASE):
+if VECTOR_STORE_BACKEND == "chroma" and not (CHROMA_API_KEY and CHROMA_TENANT and CHROMA_DATABASE):
     raise RuntimeError("Chroma Cloud env vars missing (CHROMA_API_KEY, CHROMA_TENANT, CHROMA_DATABASE)")
 
 ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
@@ -35,20 +39,97 @@ else:
 
 # ---------- Gemini setup (for embedding fallback only) ----------
 # Only configure if API key is provided (needed for embedding fallback)
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# GEMINI_API_ENDPOINT points the client at another host (e.g. a local fake embedding server)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """google.generativeai, imported and configured on first call"""
+    global _genai
+    if _genai is not None:
+        return _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+
+            if GEMINI_API_KEY:
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(
+                        api_key=GEMINI_API_KEY,
+                        transport="rest",
+                        client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+                    )
+                else:
+                    genai.configure(api_key=GEMINI_API_KEY)
+            _genai = genai
+    return _genai
+
 
 EMBED_MODEL_NAME = "models/gemini-embedding-001"
 
+# Remote embedding engine: chunks are sent in multi-content requests (max 100 per request),
+# several requests in flight at once, all drawing from one token-bucket budget.
+GEMINI_EMBED_BATCH_SIZE = int(os.getenv("GEMINI_EMBED_BATCH_SIZE", "100"))
+GEMINI_EMBED_CONCURRENCY = int(os.getenv("GEMINI_EMBED_CONCURRENCY", "4"))
+GEMINI_EMBED_CALLS_PER_MINUTE = float(os.getenv("GEMINI_EMBED_CALLS_PER_MINUTE", "30"))
+GEMINI_EMBED_BURST = int(os.getenv("GEMINI_EMBED_BURST", "4"))
+GEMINI_EMBED_MAX_RETRIES = int(os.getenv("GEMINI_EMBED_MAX_RETRIES", "4"))
+
 # ---------- Groq LLM setup ----------
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise RuntimeError("GROQ_API_KEY is missing in environment/.env")
 
-groq_client = Groq(api_key=GROQ_API_KEY)
+_groq_clients = None
+_groq_lock = threading.Lock()
+
+
+def _get_groq_clients():
+    global _groq_clients
+    if _groq_clients is None:
+        with _groq_lock:
+            if _groq_clients is None:
+                from groq import Groq, AsyncGroq
+
+                _groq_clients = (Groq(api_key=GROQ_API_KEY), AsyncGroq(api_key=GROQ_API_KEY))
+    return _groq_clients
+
+
+def get_groq_client():
+    """Blocking Groq client, created on first call"""
+    return _get_groq_clients()[0]
+
+
+def get_async_groq_client():
+    """Async Groq client, created on first call"""
+    return _get_groq_clients()[1]
+
+
 GROQ_MODEL_NAME = "llama-3.3-70b-versatile"
 
+# Groq chat budget. Requests that would wait longer than GROQ_MAX_WAIT_SECONDS are rejected (HTTP 429).
+GROQ_CALLS_PER_MINUTE = float(os.getenv("GROQ_CALLS_PER_MINUTE", "30"))
+GROQ_BURST = int(os.getenv("GROQ_BURST", "5"))
+GROQ_MAX_WAIT_SECONDS = float(os.getenv("GROQ_MAX_WAIT_SECONDS", "30"))
+
+# ---------- Local vector store ----------
+# Used when VECTOR_STORE_BACKEND=local: an in-process store persisted under LOCAL_VECTOR_STORE_DIR.
+# The local store searches a document's chunks exactly and, when hnswlib is installed, uses an HNSW
+# index for broader queries once it holds LOCAL_VECTOR_ANN_MIN_ROWS chunks.
+LOCAL_VECTOR_STORE_DIR = os.getenv(
+    "LOCAL_VECTOR_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_store"),
+)
+LOCAL_VECTOR_ANN_MIN_ROWS = int(os.getenv("LOCAL_VECTOR_ANN_MIN_ROWS", "50000"))
+LOCAL_VECTOR_FLAT_MAX = int(os.getenv("LOCAL_VECTOR_FLAT_MAX", "20000"))
+
 # ---------- Chroma Cloud client (v2 API) - Lazy Loading ----------
+# The Chroma client is blocking; async handlers run its calls on a dedicated pool of this size
+# so retrieval is not capped by the (much smaller) default threadpool.
+CHROMA_MAX_CONCURRENCY = int(os.getenv("CHROMA_MAX_CONCURRENCY", "64"))
+
 # Global variables for lazy loading
 client = None
 collection = None
@@ -92,4 +173,176 @@ def get_chroma_client():
             print(f"✗ Failed: {e2}")
             raise
     
-    return client, collection
\ No newline at end of file
+    return client, collection
+
+
+# ---------- Query embedding cache ----------
+# Question embeddings are kept in an in-memory LRU of QUERY_EMBED_CACHE_ENTRIES; the fixed task
+# questions are embedded once at startup and never evicted.
+QUERY_EMBED_CACHE_ENTRIES = int(os.getenv("QUERY_EMBED_CACHE_ENTRIES", "2048"))
+
+
+# ---------- Analysis result cache ----------
+# In-memory LRU, plus an optional SQLite tier (set RESULT_CACHE_DISK_PATH) shared by workers.
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_CACHE_DISK_PATH = os.getenv("RESULT_CACHE_DISK_PATH", "").strip() or None
+RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+# ---------- Batch analysis ----------
+# POST /analyze runs several analyses of one document; at most ANALYSIS_MAX_CONCURRENCY of its
+# LLM calls are in flight at once.
+ANALYSIS_MAX_CONCURRENCY = max(1, int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4")))
+
+# ---------- /chat relevance gate ----------
+# Questions are scored locally by cosine similarity to the retrieved chunks. Scores at or above
+# the accept threshold pass, scores below the reject threshold are refused, and anything in
+# between goes to the LLM check (if RELEVANCE_LLM_FALLBACK) or passes. Defaults depend on the
+# embedding model; the env vars override them.
+RELEVANCE_ACCEPT_THRESHOLD = os.getenv("RELEVANCE_ACCEPT_THRESHOLD")
+RELEVANCE_REJECT_THRESHOLD = os.getenv("RELEVANCE_REJECT_THRESHOLD")
+RELEVANCE_LLM_FALLBACK = os.getenv("RELEVANCE_LLM_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+
+# ---------- Prompt context packing ----------
+# Retrieved chunks are deduplicated, merged where they are consecutive, and cut to
+# CONTEXT_TOKEN_BUDGET tokens before they go into the prompt. CONTEXT_PACKING=false sends all of them.
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() in ("1", "true", "yes")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2400"))
+
+
+# ---------- Whole-document summaries ----------
+# full_document=true on /summary and /simplify summarizes every chunk: groups of about
+# SUMMARY_GROUP_CHUNKS chunks (at most SUMMARY_GROUP_TOKENS tokens) are summarized in parallel,
+# SUMMARY_MAX_CONCURRENCY at a time, and the partial summaries are combined until they fit
+# CONTEXT_TOKEN_BUDGET. Partials are cached by content, so an edited document only redoes
+# the groups that changed.
+SUMMARY_GROUP_CHUNKS = int(os.getenv("SUMMARY_GROUP_CHUNKS", "8"))
+SUMMARY_GROUP_TOKENS = int(os.getenv("SUMMARY_GROUP_TOKENS", "4000"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "4096"))
+
+
+# ---------- Chat sessions ----------
+# /chat keeps each conversation in memory (LRU of CHAT_SESSION_MAX, idle sessions expire after
+# CHAT_SESSION_TTL_SECONDS). The last CHAT_HISTORY_TURNS turns go into the prompt verbatim and
+# older ones as an LLM-written summary. A follow-up whose query embedding has cosine similarity
+# of at least CHAT_REUSE_SIMILARITY with the previous turn's reuses that turn's chunks.
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "3600"))
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "4"))
+CHAT_REUSE_SIMILARITY = float(os.getenv("CHAT_REUSE_SIMILARITY", "0.92"))
+
+
+# ---------- Local embeddings ----------
+# USE_LOCAL_EMBEDDINGS embeds with a sentence-transformers model in-process (Gemini stays the
+# fallback). LOCAL_EMBED_BACKEND: "torch" (full precision), "int8" (dynamically quantized Linear
+# layers, CPU) or "onnx" (ONNX Runtime; needs `pip install optimum[onnxruntime]`). One worker
+# thread runs the model: concurrent requests arriving within LOCAL_EMBED_MAX_WAIT_MS of each
+# other are encoded together, up to LOCAL_EMBED_MAX_BATCH texts per batch.
+USE_LOCAL_EMBEDDINGS = os.getenv("USE_LOCAL_EMBEDDINGS", "false").lower() in ("1", "true", "yes")
+LOCAL_EMBED_MODEL_NAME = os.getenv("LOCAL_EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+LOCAL_EMBED_BACKEND = os.getenv("LOCAL_EMBED_BACKEND", "torch").strip().lower()
+LOCAL_EMBED_MAX_BATCH = int(os.getenv("LOCAL_EMBED_MAX_BATCH", "64"))
+LOCAL_EMBED_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBED_MAX_WAIT_MS", "5"))
+
+
+# ---------- Embedding storage ----------
+# EMBEDDING_STORAGE_DTYPE: how the local vector store and the hot document cache hold vectors:
+# "float32", "float16" (half the memory) or "int8" (a quarter, plus one scale per row). Scores
+# are computed from the compact matrices directly. An existing local store keeps the dtype it
+# was created with. GEMINI_EMBED_DIM < 3072 asks Gemini for Matryoshka-truncated embeddings
+# (768 and 1536 are the recommended sizes); changing it means re-ingesting documents.
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32").strip().lower()
+GEMINI_EMBED_DIM = int(os.getenv("GEMINI_EMBED_DIM", "3072"))
+if EMBEDDING_STORAGE_DTYPE not in ("float32", "float16", "int8"):
+    raise RuntimeError("EMBEDDING_STORAGE_DTYPE must be float32, float16 or int8")
+
+
+# ---------- Startup ----------
+# STARTUP_WARMUP=background: the app serves /health at once while clients, the vector store and
+# the local encoder are loaded in a background thread; /ready answers 503 until that is done.
+# blocking: warm up before serving. off: load everything on first use.
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").strip().lower()
+
+
+# ---------- Chunking ----------
+# "legal" = clause/section-aware chunks of up to CHUNK_MAX_TOKENS with no overlap;
+# "window" = the original 1000-character sliding window with 200 characters of overlap.
+CHUNKER = os.getenv("CHUNKER", "legal").strip().lower()
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+
+
+# ---------- Ingestion pipeline ----------
+# Chunks are embedded in micro-batches and written to the vector store in bounded batches;
+# queues between stages hold at most INGEST_QUEUE_BATCHES batches (backpressure).
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "256"))
+INGEST_QUEUE_BATCHES = int(os.getenv("INGEST_QUEUE_BATCHES", "4"))
+INGEST_WRITE_RETRIES = int(os.getenv("INGEST_WRITE_RETRIES", "3"))
+
+
+# ---------- Background ingestion jobs ----------
+# Uploads sent with background=true are spooled under INGEST_JOBS_DIR and ingested by worker
+# threads; the queue lives in a SQLite file there so jobs survive a restart. A running job
+# whose heartbeat is older than INGEST_JOB_STALE_SECONDS is picked up again and resumed.
+INGEST_JOBS_DIR = os.getenv(
+    "INGEST_JOBS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_jobs"),
+)
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+INGEST_JOB_STALE_SECONDS = float(os.getenv("INGEST_JOB_STALE_SECONDS", "60"))
+
+
+# ---------- Hot document cache ----------
+# Task routes load a document's chunk embeddings into memory on first use and rank them with a
+# single matmul afterwards, skipping the vector store. LRU, bounded by HOT_DOC_CACHE_MAX_BYTES.
+HOT_DOC_CACHE_ENABLED = os.getenv("HOT_DOC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+HOT_DOC_CACHE_MAX_BYTES = int(os.getenv("HOT_DOC_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+# ---------- Bulk ingestion ----------
+# bulk_ingest.py / POST /admin/bulk-ingest load a directory or archive of documents. Files are
+# extracted in BULK_INGEST_WORKERS processes; chunks of many documents are embedded together in
+# batches of BULK_INGEST_EMBED_BATCH and upserted BULK_INGEST_WRITE_BATCH at a time (keep this
+# within the vector store's per-request limit). Per-file progress is checkpointed in SQLite files
+# under BULK_INGEST_DIR so an interrupted load resumes. The admin endpoint only reads server-side
+# paths under BULK_INGEST_ROOT (unset = uploaded archives only).
+BULK_INGEST_WORKERS = int(os.getenv("BULK_INGEST_WORKERS", str(min(8, os.cpu_count() or 1))))
+BULK_INGEST_EMBED_BATCH = int(os.getenv("BULK_INGEST_EMBED_BATCH", "256"))
+BULK_INGEST_WRITE_BATCH = int(os.getenv("BULK_INGEST_WRITE_BATCH", "300"))
+BULK_INGEST_DIR = os.getenv(
+    "BULK_INGEST_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "bulk_checkpoints"),
+)
+BULK_INGEST_ROOT = os.getenv("BULK_INGEST_ROOT", "").strip() or None
+
+# ---------- Document index ----------
+# Local SQLite index of doc_hash -> document_id (duplicate checks) and chunk SimHash fingerprints.
+# With NEAR_DUPLICATE_REUSE, a new chunk whose text equals a stored chunk's apart from whitespace
+# (found by SimHash) reuses that chunk's embedding instead of being embedded again. Chunks a few
+# SimHash bits apart are not reused: an inserted "not" or swapped parties land within 3 bits.
+DOCUMENT_INDEX_PATH = os.getenv(
+    "DOCUMENT_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "document_index", "index.sqlite3"),
+)
+NEAR_DUPLICATE_REUSE = os.getenv("NEAR_DUPLICATE_REUSE", "false").lower() in ("1", "true", "yes")
+
+
+# ---------- Hybrid retrieval ----------
+# Chunks are also indexed for BM25 in a local SQLite inverted index at ingest time. Retrieval
+# takes the top RETRIEVAL_CANDIDATES from both the vector store and BM25, fuses the two rankings
+# with reciprocal rank fusion (constant RRF_K) and keeps RETRIEVAL_TOP_K chunks.
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexical_index", "index.sqlite3"),
+)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8" if HYBRID_RETRIEVAL else "12"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "24"))
+RRF_K = int(os.getenv("RRF_K", "60"))
@@ -0,0 +1,192 @@
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import CONTEXT_TOKEN_BUDGET
+from tokens import count_tokens
+
+_MIN_OVERLAP = 20  # shorter suffix/prefix matches are treated as coincidence
+_MIN_TRIMMED_TOKENS = 48  # below this, the last chunk is dropped rather than cut
+
+
+class PackedContext(NamedTuple):
+    sections: List[str]  # merged runs of chunks, in document order
+    chunks_in: int
+    chunks_used: int
+    duplicates: int
+    tokens_in: int
+    tokens_out: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_in - self.tokens_out)
+
+
+class _Candidate:
+    __slots__ = ("rank", "text", "document_id", "index", "normalized", "tokens", "trimmed")
+
+    def __init__(self, rank: int, text: str, metadata: Dict[str, Any]):
+        self.rank = rank
+        self.text = text
+        self.document_id = metadata.get("document_id")
+        self.index = metadata.get("chunk_index")
+        self.normalized = " ".join(text.split())
+        self.tokens = count_tokens(text)
+        self.trimmed = False
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (window chunks share 200 chars)"""
+    if len(a) < _MIN_OVERLAP or len(b) < _MIN_OVERLAP:
+        return 0
+    probe = b[:_MIN_OVERLAP]
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _trim(text: str, max_tokens: int) -> str:
+    """Longest word prefix of `text` within `max_tokens`"""
+    words = text.split(" ")
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+def _adjacent(a: _Candidate, b: _Candidate) -> bool:
+    return (
+        a.document_id is not None
+        and a.document_id == b.document_id
+        and a.index is not None
+        and b.index == a.index + 1
+        and not a.trimmed
+    )
+
+
+def _is_duplicate(candidate: _Candidate, accepted: Sequence[_Candidate]) -> bool:
+    for other in accepted:
+        # Only within one document: near-identical clauses of two contracts are what a comparison is about
+        if other.document_id != candidate.document_id:
+            continue
+        # Only real overlap: clauses a few words apart (mirrored parties, a negation) differ in meaning
+        if candidate.normalized in other.normalized:
+            return True
+    return False
+
+
+def _marginal_tokens(candidate: _Candidate, neighbours: Dict[Tuple[str, int], _Candidate]) -> int:
+    """Tokens `candidate` adds given the accepted chunks it would be merged with"""
+    if candidate.index is None:
+        return candidate.tokens
+    start, end = 0, len(candidate.text)
+    before = neighbours.get((candidate.document_id, candidate.index - 1))
+    after = neighbours.get((candidate.document_id, candidate.index + 1))
+    if before is not None and _adjacent(before, candidate):
+        start = _overlap(before.text, candidate.text)
+    if after is not None:
+        end -= _overlap(candidate.text, after.text)
+    if start == 0 and end == len(candidate.text):
+        return candidate.tokens
+    return count_tokens(candidate.text[start:max(start, end)])
+
+
+def _merge_runs(accepted: List[_Candidate]) -> List[str]:
+    # Documents in order of their best-ranked chunk, chunks in document order within each
+    first_rank: Dict[Optional[str], int] = {}
+    for c in accepted:
+        first_rank.setdefault(c.document_id, c.rank)
+    ordered = sorted(
+        accepted,
+        key=lambda c: (first_rank[c.document_id], c.index if c.index is not None else float("inf"), c.rank),
+    )
+
+    sections: List[str] = []
+    previous: Optional[_Candidate] = None
+    for c in ordered:
+        if previous is not None and _adjacent(previous, c):
+            cut = _overlap(sections[-1], c.text)
+            sections[-1] += c.text[cut:] if cut else "\n" + c.text
+        else:
+            sections.append(c.text)
+        previous = c
+    return sections
+
+
+def pack_context(
+    texts: Sequence[str],
+    metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+) -> PackedContext:
+    """Fit retrieved chunks into `token_budget` tokens of prompt context.
+
+    Chunks are taken in retrieval (relevance) order. Duplicate chunks (text
+    contained in a kept chunk of the same document, ignoring whitespace) are
+    dropped, and a chunk is charged only for the tokens it adds beyond the
+    overlap with neighbouring kept chunks. The chunk that crosses the budget
+    is cut to fit, and the rest are dropped. Kept chunks are then put back in
+    document order and runs of consecutive `chunk_index` values are merged
+    into one section, with their shared overlap written once.
+    """
+    metadatas = metadatas or [{} for _ in texts]
+    candidates = [_Candidate(rank, text, metadata or {}) for rank, (text, metadata) in enumerate(zip(texts, metadatas))]
+    tokens_in = sum(c.tokens for c in candidates)
+
+    accepted: List[_Candidate] = []
+    neighbours: Dict[Tuple[str, int], _Candidate] = {}
+    used = 0
+    duplicates = 0
+    for c in candidates:
+        if not c.text.strip() or _is_duplicate(c, accepted):
+            duplicates += 1
+            continue
+        cost = _marginal_tokens(c, neighbours)
+        if used + cost > token_budget:
+            remaining = token_budget - used
+            if remaining >= _MIN_TRIMMED_TOKENS:
+                c.text = _trim(c.text, remaining)
+                c.trimmed = True
+                accepted.append(c)
+            break
+        accepted.append(c)
+        if c.index is not None:
+            neighbours[(c.document_id, c.index)] = c
+        used += cost
+
+    sections = _merge_runs(accepted)
+    tokens_out = sum(count_tokens(s) for s in sections)
+    return PackedContext(sections, len(candidates), len(accepted), duplicates, tokens_in, tokens_out)
+
+
+class PackingStats:
+    """Running totals of what context packing saved, for /admin/cache-stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def record(self, packed: PackedContext):
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += packed.tokens_in
+            self.tokens_out += packed.tokens_out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": max(0, self.tokens_in - self.tokens_out),
+            }
+
+
+packing_stats = PackingStats()
@@ -0,0 +1,185 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import HOT_DOC_CACHE_MAX_BYTES, EMBEDDING_STORAGE_DTYPE
+from vector_ops import dequantize, quantize, row_sq_norms, squared_l2_distances, top_k_smallest
+
+
+class HotDocument:
+    """One document's chunks, with their embeddings as a contiguous matrix.
+
+    The matrix is stored as EMBEDDING_STORAGE_DTYPE (int8 with per-row
+    scales), so a float16 or int8 cache holds two or four times as many
+    documents in the same HOT_DOC_CACHE_MAX_BYTES.
+    """
+
+    def __init__(
+        self,
+        document_id: str,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings,
+        dtype: str = EMBEDDING_STORAGE_DTYPE,
+    ):
+        self.document_id = document_id
+        self.texts = texts
+        self.metadatas = metadatas
+        self.matrix, self.scales = quantize(embeddings, dtype)
+        self.positions = {m.get("chunk_index", i): i for i, m in enumerate(metadatas)}
+        self.sq_norms = row_sq_norms(self.matrix, self.scales)
+        self.nbytes = (
+            self.matrix.nbytes
+            + (self.scales.nbytes if self.scales is not None else 0)
+            + self.sq_norms.nbytes
+            + sum(len(t) for t in texts)
+            + 200 * len(texts)  # rough per-chunk overhead for metadata and list slots
+        )
+
+    def vectors(self, rows) -> np.ndarray:
+        """float32 embeddings of `rows`"""
+        return dequantize(self.matrix[rows], self.scales[rows] if self.scales is not None else None)
+
+    def distances(self, query: np.ndarray) -> np.ndarray:
+        return squared_l2_distances(query, self.matrix, self.sq_norms, self.scales)
+
+
+def load_hot_document(collection, document_id: str) -> Optional[HotDocument]:
+    """Fetch every chunk of a document from the vector store.
+
+    Returns None for an unknown document or one still being ingested (its
+    chunks get their doc_hash only once all of them are stored), so a partial
+    document is never cached.
+    """
+    found = collection.get(
+        where={"document_id": document_id},
+        include=["documents", "metadatas", "embeddings"],
+    )
+    metadatas = found.get("metadatas") or []
+    if not metadatas or not all(m.get("doc_hash") for m in metadatas):
+        return None
+
+    texts = found.get("documents") or []
+    embeddings = found.get("embeddings")
+    if embeddings is None or len(embeddings) != len(metadatas) or len(texts) != len(metadatas):
+        return None
+
+    order = sorted(range(len(metadatas)), key=lambda i: metadatas[i].get("chunk_index", i))
+    return HotDocument(
+        document_id, [texts[i] for i in order], [metadatas[i] for i in order], [embeddings[i] for i in order]
+    )
+
+
+def top_k_chunks(
+    documents: Sequence[HotDocument], query_embedding: Sequence[float], k: int
+) -> Tuple[List[str], List[Dict[str, Any]], np.ndarray]:
+    """Exact top-k by squared L2 across one or more cached documents"""
+    q = np.asarray(query_embedding, dtype=np.float32)
+    if len(documents) == 1:
+        doc = documents[0]
+        top = top_k_smallest(doc.distances(q), k)
+        return [doc.texts[i] for i in top], [doc.metadatas[i] for i in top], doc.vectors(top)
+
+    distances = np.concatenate([d.distances(q) for d in documents])
+    owners = np.concatenate([np.full(len(d.texts), n) for n, d in enumerate(documents)])
+    offsets = np.concatenate([np.arange(len(d.texts)) for d in documents])
+    top = top_k_smallest(distances, k)
+    picked = [(documents[owners[i]], offsets[i]) for i in top]
+    texts = [doc.texts[i] for doc, i in picked]
+    metadatas = [doc.metadatas[i] for doc, i in picked]
+    matrix = np.stack([doc.vectors(i) for doc, i in picked]) if picked else np.zeros((0, 0), dtype=np.float32)
+    return texts, metadatas, matrix
+
+
+class DocumentMatrixCache:
+    """LRU cache of hot documents, bounded by bytes.
+
+    Task routes query one or two documents of tens to hundreds of chunks, so
+    once a document is loaded, top-k is a single matmul plus argpartition with
+    no vector store round trip. Concurrent first accesses to the same
+    document share a single load.
+    """
+
+    def __init__(self, max_bytes: int = HOT_DOC_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._docs: "OrderedDict[str, HotDocument]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._generation: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, document_id: str) -> Optional[HotDocument]:
+        with self._lock:
+            doc = self._docs.get(document_id)
+            if doc is not None:
+                self._docs.move_to_end(document_id)
+                self.hits += 1
+            return doc
+
+    def put(self, doc: HotDocument, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self._generation.get(doc.document_id, 0):
+                return  # invalidated while it was loading
+            if doc.nbytes > self.max_bytes:
+                return
+            old = self._docs.pop(doc.document_id, None)
+            if old:
+                self._bytes -= old.nbytes
+            self._docs[doc.document_id] = doc
+            self._bytes += doc.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._docs.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_or_load(self, collection, document_id: str) -> Optional[HotDocument]:
+        doc = self.get(document_id)
+        if doc is not None:
+            return doc
+
+        with self._lock:
+            lock = self._loading.setdefault(document_id, threading.Lock())
+        with lock:
+            doc = self.get(document_id)
+            if doc is not None:
+                return doc
+            with self._lock:
+                self.misses += 1
+                generation = self._generation.get(document_id, 0)
+            try:
+                doc = load_hot_document(collection, document_id)
+                if doc is not None:
+                    self.put(doc, generation)
+            finally:
+                with self._lock:
+                    self._loading.pop(document_id, None)
+            return doc
+
+    def invalidate(self, document_id: str):
+        """Drop a document, e.g. after it was (re-)ingested or deleted"""
+        with self._lock:
+            self._generation[document_id] = self._generation.get(document_id, 0) + 1
+            doc = self._docs.pop(document_id, None)
+            if doc:
+                self._bytes -= doc.nbytes
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Global cache for the documents task routes are working on
+hot_documents = DocumentMatrixCache()
@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import DOCUMENT_INDEX_PATH
+
+SIMHASH_BITS = 64
+_BANDS = 4  # 16-bit bands: any two fingerprints within 3 bits agree on at least one band
+_BAND_MASK = (1 << (SIMHASH_BITS // _BANDS)) - 1
+_SHINGLE = 3  # words per shingle
+
+
+# ------------- SimHash -------------
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of a text's word 3-grams (0 for empty text).
+
+    Texts that differ by a few words get fingerprints a few bits apart, so
+    near-duplicate chunks can be found by Hamming distance.
+    """
+    words = text.lower().split()
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + _SHINGLE]) for i in range(max(1, len(words) - _SHINGLE + 1))]
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), SIMHASH_BITS)
+    # Majority vote per bit position
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+def _bands(fingerprint: int) -> List[int]:
+    return [(fingerprint >> (16 * i)) & _BAND_MASK for i in range(_BANDS)]
+
+
+# ------------- index -------------
+
+class DocumentIndex:
+    """Local SQLite index of ingested documents and chunk fingerprints.
+
+    - documents: doc_hash -> document_id, so duplicate checks are a primary-key
+      lookup instead of a metadata scan of the vector store. claim() inserts
+      atomically, so two concurrent uploads of the same file cannot both win.
+    - chunk_fingerprints: SimHash of every stored chunk, banded for lookup, so
+      a lightly edited re-upload can reuse the embeddings of chunks that are
+      nearly unchanged.
+    - versions: the version history of revised documents. Each revision is a
+      document of its own, linked to the one it replaces; all versions of a
+      document share the root_document_id of the first.
+
+    The vector store stays the source of truth; rebuild() fills the index
+    from it. Until a rebuild has completed, lookups that miss fall back to the
+    vector store.
+    """
+
+    def __init__(self, path: str = DOCUMENT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_id ON documents(document_id)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunk_fingerprints (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                simhash INTEGER NOT NULL,
+                band0 INTEGER NOT NULL,
+                band1 INTEGER NOT NULL,
+                band2 INTEGER NOT NULL,
+                band3 INTEGER NOT NULL
+            )"""
+        )
+        for i in range(_BANDS):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS fingerprints_band{i} ON chunk_fingerprints(band{i})")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_document ON chunk_fingerprints(document_id)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS versions (
+                document_id TEXT PRIMARY KEY,
+                previous_document_id TEXT,
+                root_document_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                changes TEXT,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS versions_root ON versions(root_document_id, version)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @property
+    def synced(self) -> bool:
+        """True once the index has been built from (or has tracked) the whole vector store"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'synced'").fetchone()
+        return bool(row and row[0] == "1")
+
+    # ---- documents ----
+
+    def lookup(self, doc_hash: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT document_id FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone()
+        return row[0] if row else None
+
+    def claim(self, doc_hash: str, document_id: str) -> str:
+        """Record document_id as the owner of doc_hash unless another document already is.
+
+        Returns the owner: `document_id` if it won, the existing id otherwise.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO documents (doc_hash, document_id, created_at) VALUES (?, ?, ?)",
+                (doc_hash, document_id, time.time()),
+            )
+            return self._conn.execute("SELECT document_id FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone()[0]
+
+    def release(self, doc_hash: str, document_id: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM documents WHERE doc_hash = ? AND document_id = ?", (doc_hash, document_id)
+            )
+
+    def remove_document(self, document_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            self._conn.execute("DELETE FROM chunk_fingerprints WHERE document_id = ?", (document_id,))
+            self._conn.execute("DELETE FROM versions WHERE document_id = ?", (document_id,))
+            self._conn.execute("COMMIT")
+
+    # ---- versions ----
+
+    def version_of(self, document_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM versions WHERE document_id = ?", (document_id,)).fetchone()
+        return _version_dict(row) if row else None
+
+    def add_version(self, document_id: str, previous_document_id: str, changes: Dict[str, Any]) -> int:
+        """Record `document_id` as the next version of `previous_document_id`. Returns its version number."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A document uploaded without a previous version is version 1 of its own history
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO versions "
+                    "(document_id, previous_document_id, root_document_id, version, created_at) "
+                    "VALUES (?, NULL, ?, 1, COALESCE((SELECT MIN(created_at) FROM documents WHERE document_id = ?), ?))",
+                    (previous_document_id, previous_document_id, previous_document_id, now),
+                )
+                root, version = self._conn.execute(
+                    "SELECT root_document_id, version FROM versions WHERE document_id = ?", (previous_document_id,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO versions "
+                    "(document_id, previous_document_id, root_document_id, version, changes, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (document_id, previous_document_id, root, version + 1, json.dumps(changes), now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return version + 1
+
+    def history(self, document_id: str) -> List[Dict[str, Any]]:
+        """Every version of the document `document_id` belongs to, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM versions WHERE root_document_id = "
+                "(SELECT root_document_id FROM versions WHERE document_id = ?) ORDER BY version, created_at",
+                (document_id,),
+            ).fetchall()
+        return [_version_dict(row) for row in rows]
+
+    # ---- chunk fingerprints ----
+
+    def add_fingerprints(self, rows: Iterable[Tuple[str, str, str, int]]):
+        """rows: (chunk_id, document_id, model, simhash)"""
+        values = [
+            (chunk_id, document_id, model, _to_signed(fp), *_bands(fp))
+            for chunk_id, document_id, model, fp in rows
+            if fp
+        ]
+        if not values:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_fingerprints "
+                "(chunk_id, document_id, model, simhash, band0, band1, band2, band3) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+
+    def find_near_duplicates(
+        self,
+        fingerprints: Sequence[int],
+        model: str,
+        max_distance: int = 3,
+    ) -> List[Optional[str]]:
+        """For each fingerprint, the id of a stored chunk within `max_distance` bits (or None).
+
+        Candidates come from exact band matches, which is complete for
+        max_distance < 4 (pigeonhole over four 16-bit bands).
+        """
+        wanted: Dict[int, List[int]] = {}
+        for i, fp in enumerate(fingerprints):
+            if fp:
+                for band, value in enumerate(_bands(fp)):
+                    wanted.setdefault(band, []).append(value)
+        if not wanted:
+            return [None] * len(fingerprints)
+
+        candidates: Dict[str, int] = {}
+        with self._lock:
+            for band, values in wanted.items():
+                unique = sorted(set(values))
+                for start in range(0, len(unique), 500):
+                    part = unique[start:start + 500]
+                    marks = ", ".join("?" for _ in part)
+                    query = (
+                        f"SELECT chunk_id, simhash FROM chunk_fingerprints WHERE model = ? AND band{band} IN ({marks})"
+                    )
+                    for chunk_id, fp in self._conn.execute(query, [model, *part]):
+                        candidates[chunk_id] = fp & ((1 << 64) - 1)
+
+        by_band: Dict[Tuple[int, int], List[Tuple[str, int]]] = {}
+        for chunk_id, fp in candidates.items():
+            for band, value in enumerate(_bands(fp)):
+                by_band.setdefault((band, value), []).append((chunk_id, fp))
+
+        matches: List[Optional[str]] = []
+        for fp in fingerprints:
+            best, best_distance = None, max_distance + 1
+            if fp:
+                for band, value in enumerate(_bands(fp)):
+                    for chunk_id, other in by_band.get((band, value), ()):
+                        distance = hamming_distance(fp, other)
+                        if distance < best_distance:
+                            best, best_distance = chunk_id, distance
+            matches.append(best)
+        return matches
+
+    # ---- rebuild ----
+
+    def _add_lineage(self, previous: Dict[str, str]):
+        """Versions rows for documents found in the store; change summaries are not recoverable"""
+        def chain(document_id: str) -> List[str]:
+            lineage = [document_id]
+            while lineage[-1] in previous and previous[lineage[-1]] not in lineage:
+                lineage.append(previous[lineage[-1]])
+            return lineage[::-1]  # root first
+
+        now = time.time()
+        values = {}
+        for document_id in previous:
+            lineage = chain(document_id)
+            for version, doc in enumerate(lineage, start=1):
+                values[doc] = (doc, previous.get(doc) if version > 1 else None, lineage[0], version, now)
+        if values:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO versions "
+                    "(document_id, previous_document_id, root_document_id, version, created_at) VALUES (?, ?, ?, ?, ?)",
+                    list(values.values()),
+                )
+
+    def rebuild(self, collection, default_model: str, page_size: int = 1000, fingerprints: bool = True):
+        """Fill the index from the vector store's chunk metadata (and text, for fingerprints)."""
+        started = time.perf_counter()
+        include = ["metadatas", "documents"] if fingerprints else ["metadatas"]
+        documents: Dict[str, str] = {}
+        previous: Dict[str, str] = {}  # document_id -> the version it revised
+        rows = []
+        offset = 0
+        while True:
+            page = collection.get(include=include, limit=page_size, offset=offset)
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            texts = page.get("documents") or [None] * len(ids)
+            for chunk_id, metadata, text in zip(ids, page.get("metadatas") or [], texts):
+                metadata = metadata or {}
+                document_id = metadata.get("document_id")
+                if not document_id or not metadata.get("doc_hash"):
+                    continue  # incomplete ingestion
+                documents.setdefault(metadata["doc_hash"], document_id)
+                if metadata.get("previous_document_id"):
+                    previous[document_id] = metadata["previous_document_id"]
+                if fingerprints and text:
+                    model = metadata.get("embedding_model") or default_model
+                    rows.append((chunk_id, document_id, model, simhash(text)))
+            offset += len(ids)
+
+        # Merge rather than replace, so claims made by ingestions running meanwhile are kept
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO documents (doc_hash, document_id, created_at) VALUES (?, ?, ?)",
+                [(doc_hash, document_id, time.time()) for doc_hash, document_id in documents.items()],
+            )
+        if fingerprints:
+            self.add_fingerprints(rows)
+        self._add_lineage(previous)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced', '1')")
+        print(
+            f"✓ Document index rebuilt: {len(documents)} documents, {len(rows)} chunk fingerprints "
+            f"from {offset} chunks in {time.perf_counter() - started:.1f}s"
+        )
+
+
+def _version_dict(row: Tuple) -> Dict[str, Any]:
+    document_id, previous_document_id, root_document_id, version, changes, created_at = row
+    return {
+        "document_id": document_id,
+        "version": version,
+        "previous_document_id": previous_document_id,
+        "root_document_id": root_document_id,
+        "changes": json.loads(changes) if changes else None,
+        "created_at": created_at,
+    }
+
+
+_document_index: Optional[DocumentIndex] = None
+_document_index_lock = threading.Lock()
+
+
+def get_document_index() -> DocumentIndex:
+    global _document_index
+    with _document_index_lock:
+        if _document_index is None:
+            _document_index = DocumentIndex()
+        return _document_index
@@ -0,0 +1,110 @@
+import hashlib
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from document_index import get_document_index
+
+
+def chunk_key(text: str) -> str:
+    """Identity of a chunk's content, ignoring whitespace"""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class ChunkDiff(NamedTuple):
+    unchanged: int
+    added: int
+    removed: int
+    # (old [start, end), new [start, end)) chunk ranges that differ, in document order
+    hunks: List[Tuple[range, range]]
+
+
+def diff_chunks(old_keys: Sequence[str], new_keys: Sequence[str]) -> ChunkDiff:
+    """Align two versions' chunk sequences and report what changed between them"""
+    matcher = SequenceMatcher(None, list(old_keys), list(new_keys), autojunk=False)
+    unchanged = sum(block.size for block in matcher.get_matching_blocks())
+    hunks = [
+        (range(i1, i2), range(j1, j2))
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+    return ChunkDiff(unchanged, len(new_keys) - unchanged, len(old_keys) - unchanged, hunks)
+
+
+class PreviousVersion:
+    """The stored chunks of the version a revised upload replaces.
+
+    Chunks of the new version whose text is unchanged take their embedding
+    from here instead of being embedded again. Only embeddings made with
+    `model` are reused.
+    """
+
+    def __init__(self, document_id: str, keys: List[str], embeddings: Dict[str, np.ndarray]):
+        self.document_id = document_id
+        self.keys = keys
+        self._embeddings = embeddings
+        self.reused = 0
+
+    @classmethod
+    def load(cls, collection, document_id: str, model: str) -> "PreviousVersion":
+        found = collection.get(where={"document_id": document_id}, include=["documents", "metadatas", "embeddings"])
+        texts = found.get("documents") or []
+        metadatas = found.get("metadatas") or [{} for _ in texts]
+        stored = found.get("embeddings")
+        stored = stored if stored is not None else [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: (metadatas[i] or {}).get("chunk_index", i))
+
+        keys, embeddings = [], {}
+        for i in order:
+            key = chunk_key(texts[i])
+            keys.append(key)
+            if stored[i] is not None and (metadatas[i] or {}).get("embedding_model") == model:
+                embeddings.setdefault(key, np.asarray(stored[i], dtype=np.float32))
+        return cls(document_id, keys, embeddings)
+
+    def embeddings_for(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        embeddings = [self._embeddings.get(chunk_key(text)) for text in texts]
+        self.reused += sum(1 for emb in embeddings if emb is not None)
+        return embeddings
+
+
+def change_summary(diff: ChunkDiff, new_sections: Sequence[Optional[str]], reused: int) -> Dict[str, Any]:
+    """What a revision changed, as stored in the version history"""
+    sections = []
+    for _, new in diff.hunks:
+        for i in new:
+            section = new_sections[i] if i < len(new_sections) else None
+            if section and section not in sections:
+                sections.append(section)
+    return {
+        "chunks_unchanged": diff.unchanged,
+        "chunks_added": diff.added,
+        "chunks_removed": diff.removed,
+        "embeddings_reused": reused,
+        "changed_sections": sections,
+    }
+
+
+# ------------- comparing revisions -------------
+
+def revision_order(document_id_1: str, document_id_2: str) -> Optional[Tuple[str, str]]:
+    """(older, newer) if the two documents are versions of the same document, else None"""
+    index = get_document_index()
+    first, second = index.version_of(document_id_1), index.version_of(document_id_2)
+    if not first or not second or first["root_document_id"] != second["root_document_id"]:
+        return None
+    if (first["version"], first["created_at"]) <= (second["version"], second["created_at"]):
+        return document_id_1, document_id_2
+    return document_id_2, document_id_1
+
+
+def revision_hunks(old_texts: Sequence[str], new_texts: Sequence[str]) -> List[str]:
+    """One context passage per changed region: its earlier and its revised wording"""
+    diff = diff_chunks([chunk_key(t) for t in old_texts], [chunk_key(t) for t in new_texts])
+    passages = []
+    for n, (old, new) in enumerate(diff.hunks, start=1):
+        earlier = "\n".join(old_texts[i] for i in old) or "(not present)"
+        revised = "\n".join(new_texts[i] for i in new) or "(removed)"
+        passages.append(f"Change {n}\nEarlier version:\n{earlier}\n\nRevised version:\n{revised}")
+    return passages
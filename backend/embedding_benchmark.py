@@ -0,0 +1,135 @@
+"""Local embedding backend benchmark.
+
+    python embedding_benchmark.py --pdf contract.pdf [--backends torch,int8,onnx] [--concurrency 16] [--k 10]
+
+For each backend it reports bulk encoding throughput; single-question
+throughput and latency with concurrent callers, each running the model
+inline or going through the micro-batching service; and how closely
+retrieval matches the full-precision torch model: recall@k of every query's
+top-k chunks, and the mean cosine between the two models' embeddings of the
+same chunk.
+"""
+import argparse
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from config import LOCAL_EMBED_MODEL_NAME, LOCAL_EMBED_MAX_BATCH, LOCAL_EMBED_MAX_WAIT_MS
+from legal_chunker import iter_legal_chunks
+from local_embeddings import LocalEmbeddingService, load_encoder
+from pdf_extraction import iter_pdf_pages
+
+
+def _normalized(embs) -> np.ndarray:
+    embs = np.asarray(embs, dtype=np.float32)
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    return embs / np.maximum(norms, 1e-12)
+
+
+def _load_corpus(args) -> List[str]:
+    if args.pdf:
+        return [chunk.text for chunk in iter_legal_chunks(page.text for page in iter_pdf_pages(args.pdf))]
+    with open(args.texts, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _default_queries(corpus: Sequence[str], n: int = 50) -> List[str]:
+    # First sentence of chunks spread over the document: each has at least one right answer
+    step = max(1, len(corpus) // n)
+    queries = []
+    for text in corpus[::step][:n]:
+        sentence = re.split(r"(?<=[.;:?!])\s", text, maxsplit=1)[0]
+        queries.append(" ".join(sentence.split()[:30]))
+    return queries
+
+
+def _concurrent(embed_one: Callable[[str], object], queries: Sequence[str], concurrency: int, rounds: int) -> Dict[str, float]:
+    work = [q for _ in range(rounds) for q in queries]
+    latencies = []
+
+    def run(query: str):
+        started = time.perf_counter()
+        embed_one(query)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, work))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "qps": len(work) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def _recall_at_k(reference: np.ndarray, candidate: np.ndarray, ref_corpus: np.ndarray, corpus: np.ndarray, k: int) -> float:
+    ref_top = np.argsort(-(reference @ ref_corpus.T), axis=1)[:, :k]
+    top = np.argsort(-(candidate @ corpus.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, top)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pdf", help="PDF to chunk with the legal chunker")
+    source.add_argument("--texts", help="text file, one chunk per line")
+    parser.add_argument("--queries", help="text file, one question per line (default: sentences from the corpus)")
+    parser.add_argument("--model", default=LOCAL_EMBED_MODEL_NAME)
+    parser.add_argument("--backends", default="torch,int8,onnx")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3, help="times each query is sent in the concurrency test")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = _load_corpus(args)
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = _default_queries(corpus)
+    k = min(args.k, len(corpus))
+    print(f"{len(corpus)} chunks, {len(queries)} queries, model '{args.model}', concurrency {args.concurrency}\n")
+
+    reference = None  # (corpus, queries) embeddings from the torch model
+    rows = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        try:
+            encoder = load_encoder(args.model, backend)
+        except Exception as e:
+            print(f"✗ {backend}: could not load ({e})")
+            continue
+        encoder.encode(["warm-up"], convert_to_numpy=True)
+
+        started = time.perf_counter()
+        corpus_embs = _normalized(encoder.encode(corpus, batch_size=LOCAL_EMBED_MAX_BATCH, convert_to_numpy=True))
+        bulk = len(corpus) / (time.perf_counter() - started)
+        query_embs = _normalized(encoder.encode(queries, batch_size=LOCAL_EMBED_MAX_BATCH, convert_to_numpy=True))
+
+        inline = _concurrent(lambda q: encoder.encode([q], convert_to_numpy=True), queries, args.concurrency, args.rounds)
+        service = LocalEmbeddingService(args.model, backend, LOCAL_EMBED_MAX_BATCH, LOCAL_EMBED_MAX_WAIT_MS)
+        service.encoder, service.dim = encoder, encoder.get_sentence_embedding_dimension()
+        batched = _concurrent(lambda q: service.embed([q]), queries, args.concurrency, args.rounds)
+
+        if backend == "torch" or reference is None:
+            reference = (corpus_embs, query_embs, backend)
+        recall = _recall_at_k(reference[1], query_embs, reference[0], corpus_embs, k)
+        cosine = float(np.mean(np.sum(reference[0] * corpus_embs, axis=1)))
+        rows.append((backend, bulk, inline, batched, service.stats()["mean_batch_size"], recall, cosine))
+
+    print(f"{'backend':8} {'bulk/s':>8} {'inline q/s':>11} {'p95 ms':>8} {'batched q/s':>12} {'p95 ms':>8} "
+          f"{'batch':>6} {'recall@' + str(k):>10} {'cosine':>7}")
+    for backend, bulk, inline, batched, batch_size, recall, cosine in rows:
+        print(f"{backend:8} {bulk:8.1f} {inline['qps']:11.1f} {inline['p95_ms']:8.1f} {batched['qps']:12.1f} "
+              f"{batched['p95_ms']:8.1f} {batch_size:6.1f} {recall:10.3f} {cosine:7.4f}")
+    if reference is not None:
+        print(f"\nrecall@{k} and cosine are against the {reference[2]} backend")
+
+
+if __name__ == "__main__":
+    main()
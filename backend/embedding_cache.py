@@ -1,35 +1,281 @@
-import json
 import os
+import re
+import mmap
 import hashlib
-from typing import List, Dict
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Sequence, Tuple
 
-CACHE_FILE = "embedding_cache.json"
+import numpy as np
 
-def get_cache():
-    """Load embedding cache from file"""
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
-    return {}
+from config import QUERY_EMBED_CACHE_ENTRIES
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; single-worker only
+    fcntl = None
+
+# One append-only file per (embedding model, dimension). Layout:
+#   header (HEADER_SIZE bytes): magic | dim (uint32) | name length (uint32) | model name
+#   records: sha256 digest of the text (32 bytes) | embedding (dim x float32)
+# Records are fixed-size, so the file is a float32 matrix with a hash column that
+# can be memory-mapped and indexed without parsing anything.
+CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache"),
+)
+
+MAGIC = b"LEVEC001"
+HEADER_SIZE = 512
+HASH_SIZE = 32
 
-def save_cache(cache: Dict):
-    """Save embedding cache to file"""
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f)
 
 def get_text_hash(text: str) -> str:
     """Get hash of text"""
     return hashlib.sha256(text.encode()).hexdigest()
 
-def get_cached_embedding(text: str):
+
+def _text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+def _store_path(model_name: str, dim: int) -> str:
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_")
+    return os.path.join(CACHE_DIR, f"{slug}_{dim}.vec")
+
+
+class EmbeddingStore:
+    """Memory-mapped, append-only embedding cache for a single model/dimension.
+
+    Lookups go through an in-process digest -> row index, so they are O(1) and
+    never parse the file. Appends are serialized across processes with flock and
+    other workers pick up new rows the next time they look something up.
+    """
+
+    def __init__(self, path: str, model_name: str, dim: int):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        self.record_dtype = np.dtype([("hash", f"V{HASH_SIZE}"), ("vec", "<f4", (dim,))])
+        self.record_size = self.record_dtype.itemsize
+
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._rows = 0
+        self._mm: Optional[mmap.mmap] = None
+        self._records: Optional[np.ndarray] = None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # "a+b" creates the file if missing without truncating it
+        self._fh = open(path, "a+b")
+        self._init_header()
+        self._refresh()
+
+    # ---- file locking ----
+
+    def _flock(self, exclusive: bool):
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _funlock(self):
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+
+    def _init_header(self):
+        self._flock(exclusive=True)
+        try:
+            size = os.fstat(self._fh.fileno()).st_size
+            if size == 0:
+                name = self.model_name.encode("utf-8")
+                header = MAGIC + np.array([self.dim, len(name)], dtype="<u4").tobytes() + name
+                if len(header) > HEADER_SIZE:
+                    raise ValueError(f"Model name too long for embedding cache header: {self.model_name}")
+                self._fh.write(header.ljust(HEADER_SIZE, b"\0"))
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                return
+
+            self._fh.seek(0)
+            header = self._fh.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[:8] != MAGIC:
+                raise ValueError(f"Not an embedding cache file: {self.path}")
+            dim, name_len = np.frombuffer(header[8:16], dtype="<u4")
+            name = header[16:16 + int(name_len)].decode("utf-8")
+            if int(dim) != self.dim or name != self.model_name:
+                raise ValueError(
+                    f"Embedding cache {self.path} belongs to {name} (dim={int(dim)}), "
+                    f"not {self.model_name} (dim={self.dim})"
+                )
+        finally:
+            self._funlock()
+
+    # ---- mapping / index ----
+
+    def _refresh(self):
+        """Map and index any complete records appended since the last refresh."""
+        size = os.fstat(self._fh.fileno()).st_size
+        rows = max(0, (size - HEADER_SIZE) // self.record_size)
+        if rows == self._rows:
+            return
+
+        # The previous mapping is left to the GC: closing it would fail while any
+        # numpy view still references it.
+        self._mm = mmap.mmap(self._fh.fileno(), HEADER_SIZE + rows * self.record_size, access=mmap.ACCESS_READ)
+        self._records = np.frombuffer(self._mm, dtype=self.record_dtype, count=rows, offset=HEADER_SIZE)
+
+        hashes = self._records["hash"]
+        for row in range(self._rows, rows):
+            self._index.setdefault(hashes[row].tobytes(), row)
+        self._rows = rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._rows
+
+    def get_many(self, digests: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            if any(d not in self._index for d in digests):
+                # Another worker may have appended the missing rows
+                self._refresh()
+            # Rows are read-only float32 views into the map, not copies
+            results: List[Optional[np.ndarray]] = []
+            for d in digests:
+                row = self._index.get(d)
+                results.append(None if row is None else self._records["vec"][row])
+            return results
+
+    def put_many(self, digests: Sequence[bytes], embeddings: Sequence[Sequence[float]]):
+        """Append new embeddings with a single write + fsync."""
+        with self._lock:
+            self._flock(exclusive=True)
+            try:
+                self._refresh()
+                fresh: Dict[bytes, Sequence[float]] = {}
+                for d, emb in zip(digests, embeddings):
+                    if d not in self._index:
+                        fresh[d] = emb
+                if not fresh:
+                    return
+
+                records = np.zeros(len(fresh), dtype=self.record_dtype)
+                records["hash"] = [np.void(d) for d in fresh]
+                records["vec"] = np.asarray(list(fresh.values()), dtype="<f4")
+
+                # Drop a torn record left behind by a crashed writer before appending
+                size = os.fstat(self._fh.fileno()).st_size
+                complete = HEADER_SIZE + max(0, (size - HEADER_SIZE) // self.record_size) * self.record_size
+                if size != complete:
+                    self._fh.truncate(complete)
+
+                self._fh.seek(0, os.SEEK_END)
+                self._fh.write(records.tobytes())
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._refresh()
+            finally:
+                self._funlock()
+
+
+_stores: Dict[Tuple[str, int], EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(model_name: str, dim: int) -> EmbeddingStore:
+    """Return the (process-wide) cache store for a model/dimension pair."""
+    key = (model_name, dim)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = EmbeddingStore(_store_path(model_name, dim), model_name, dim)
+            _stores[key] = store
+        return store
+
+
+def get_cached_embeddings(texts: Sequence[str], model_name: str, dim: int) -> List[Optional[np.ndarray]]:
+    """Get embeddings from cache; None for texts that are not cached"""
+    return get_store(model_name, dim).get_many([_text_digest(t) for t in texts])
+
+
+def get_cached_embedding(text: str, model_name: str, dim: int) -> Optional[np.ndarray]:
     """Get embedding from cache if exists"""
-    cache = get_cache()
-    text_hash = get_text_hash(text)
-    return cache.get(text_hash)
+    return get_cached_embeddings([text], model_name, dim)[0]
+
+
+def cache_embeddings(texts: Sequence[str], embeddings: Sequence[Sequence[float]], model_name: str):
+    """Cache a batch of embeddings (one fsync for the whole batch)"""
+    if not texts:
+        return
+    dim = len(embeddings[0])
+    get_store(model_name, dim).put_many([_text_digest(t) for t in texts], embeddings)
 
-def cache_embedding(text: str, embedding: List[float]):
+
+def cache_embedding(text: str, embedding: List[float], model_name: str):
     """Cache an embedding"""
-    cache = get_cache()
-    text_hash = get_text_hash(text)
-    cache[text_hash] = embedding
-    save_cache(cache)
+    cache_embeddings([text], [embedding], model_name)
+
+
+# ------------- query embeddings -------------
+
+class QueryEmbeddingCache:
+    """In-memory LRU of query embeddings, keyed by model, task_type and text.
+
+    Questions are embedded with task_type="retrieval_query", which the disk
+    cache above does not distinguish from document embeddings, so they are
+    kept here instead. Pinned entries (the fixed task questions, embedded at
+    startup) are never evicted.
+    """
+
+    def __init__(self, max_entries: int = QUERY_EMBED_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], List[float]]" = OrderedDict()
+        self._pinned: Dict[Tuple[str, str, str], List[float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model_name: str, task_type: str, text: str) -> Tuple[str, str, str]:
+        return model_name, task_type, " ".join(text.split())
+
+    def get(self, model_name: str, task_type: str, text: str) -> Optional[List[float]]:
+        key = self._key(model_name, task_type, text)
+        with self._lock:
+            embedding = self._pinned.get(key)
+            if embedding is None:
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)
+            if embedding is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return embedding
+
+    def put(self, model_name: str, task_type: str, text: str, embedding: List[float], pinned: bool = False):
+        key = self._key(model_name, task_type, text)
+        with self._lock:
+            if pinned:
+                self._pinned[key] = embedding
+                self._entries.pop(key, None)
+                return
+            if key in self._pinned:
+                return
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "pinned": len(self._pinned),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Global cache for the query path (rag_utils.embed_query / embed_query_async)
+query_embeddings = QueryEmbeddingCache()
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from config import (
+    INGEST_JOBS_DIR,
+    INGEST_JOB_WORKERS,
+    INGEST_JOB_MAX_ATTEMPTS,
+    INGEST_JOB_STALE_SECONDS,
+)
+from ingest_pipeline import IngestProgress, PipelineError
+from pdf_extraction import UploadTooLarge, spill_to_file
+from rag_utils import ingest_document, iter_file_pages, upload_suffix
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_PROGRESS_INTERVAL = 0.5  # seconds between progress writes
+
+
+class JobStore:
+    """SQLite table of ingestion jobs, safe to share between threads and worker processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                params TEXT NOT NULL,
+                document_id TEXT,
+                stored INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                heartbeat_at REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+
+    def create(self, job_id: str, file_path: str, filename: str, params: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, file_path, filename, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, file_path, filename, json.dumps(params), now, now),
+            )
+
+    def claim(self, stale_after: float) -> Optional[sqlite3.Row]:
+        """Atomically take the oldest queued job, or a running one whose worker went away."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND heartbeat_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now - stale_after),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, heartbeat_at = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (RUNNING, now, now, row["id"]),
+                )
+                job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+                return job
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update(self, job_id: str, **fields: Any):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def heartbeat(self, job_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def get(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _job_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "filename": row["filename"],
+        "document_id": row["document_id"],
+        "attempts": row["attempts"],
+        "progress": json.loads(row["progress"]) if row["progress"] else IngestProgress().as_dict(),
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+class IngestJobQueue:
+    """Runs ingest_document for spooled uploads on a pool of worker threads.
+
+    Jobs are rows in a SQLite file next to their spooled uploads, so queued
+    work survives a restart. While a job runs its worker refreshes a heartbeat;
+    a job left RUNNING with an old heartbeat (the process died) is claimed
+    again and resumes after the chunks it had already stored. PDF extraction
+    already runs in a process pool, so threads are enough here.
+    """
+
+    def __init__(
+        self,
+        directory: str = INGEST_JOBS_DIR,
+        workers: int = INGEST_JOB_WORKERS,
+        max_attempts: int = INGEST_JOB_MAX_ATTEMPTS,
+        stale_after: float = INGEST_JOB_STALE_SECONDS,
+        ingest_fn: Callable[..., dict] = ingest_document,
+    ):
+        self.directory = directory
+        self.uploads_dir = os.path.join(directory, "uploads")
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.stale_after = stale_after
+        self.ingest_fn = ingest_fn
+        self._store: Optional[JobStore] = None
+        self._store_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    @property
+    def store(self) -> JobStore:
+        # Created on first use so importing this module touches no files
+        with self._store_lock:
+            if self._store is None:
+                os.makedirs(self.uploads_dir, exist_ok=True)
+                self._store = JobStore(os.path.join(self.directory, "jobs.sqlite3"))
+            return self._store
+
+    # ---- API ----
+
+    def submit_upload(
+        self,
+        file: UploadFile,
+        uploader_type: str,
+        uploader_id: Optional[str] = None,
+        extra_metadata: Optional[dict] = None,
+        previous_document_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Spool an upload to disk and queue it. Returns the new job's status."""
+        store = self.store
+        try:
+            path = spill_to_file(file.file, suffix=upload_suffix(file), directory=self.uploads_dir)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        job_id = str(uuid.uuid4())
+        params = {
+            "uploader_type": uploader_type,
+            "uploader_id": uploader_id,
+            "extra_metadata": extra_metadata or {},
+            "previous_document_id": previous_document_id,
+        }
+        store.create(job_id, path, file.filename or "", params)
+        self._wake.set()
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.store.get(job_id)
+        return _job_dict(row) if row else None
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"ingest-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"✓ Ingestion job workers started ({self.workers})")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    # ---- workers ----
+
+    def _worker_loop(self):
+        # Poll now and then as well, for jobs queued by other processes or left stale
+        poll = max(1.0, min(5.0, self.stale_after / 4))
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.stale_after)
+            except sqlite3.Error as e:
+                print(f"✗ Ingestion job queue error: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(poll)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: sqlite3.Row):
+        job_id = job["id"]
+        store = self.store
+
+        if job["attempts"] > self.max_attempts:
+            self._finish(job, FAILED, error=job["error"] or "Worker stopped while running this job")
+            return
+
+        document_id = job["document_id"] or str(uuid.uuid4())
+        resume_from = job["stored"]
+        store.update(job_id, document_id=document_id)
+        if resume_from:
+            print(f"↻ Resuming ingestion job {job_id} from chunk {resume_from}")
+
+        last_write = [0.0]
+
+        def save_progress(progress: IngestProgress, force: bool = False):
+            now = time.monotonic()
+            if not force and now - last_write[0] < _PROGRESS_INTERVAL:
+                return
+            last_write[0] = now
+            counts = progress.as_dict()
+            # Chunks below resume_from were handled by an earlier attempt
+            for name in ("chunks_produced", "chunks_embedded", "chunks_stored"):
+                counts[name] += resume_from
+            # Writes land in chunk order, so this is also where a crashed run can resume
+            store.update(
+                job_id,
+                progress=json.dumps(counts),
+                stored=counts["chunks_stored"],
+                heartbeat_at=time.time(),
+            )
+
+        progress = IngestProgress(on_update=save_progress)
+        beating = threading.Event()
+
+        def heartbeat():
+            # Embedding can wait on the rate limit for a while without progress
+            while not beating.wait(self.stale_after / 4):
+                store.heartbeat(job_id)
+
+        beat = threading.Thread(target=heartbeat, name="ingest-job-heartbeat", daemon=True)
+        beat.start()
+        params = json.loads(job["params"])
+        try:
+            result = self.ingest_fn(
+                pages=(page.text for page in iter_file_pages(job["file_path"], job["filename"])),
+                uploader_type=params["uploader_type"],
+                uploader_id=params["uploader_id"],
+                extra_metadata=params["extra_metadata"],
+                previous_document_id=params.get("previous_document_id"),
+                document_id=document_id,
+                resume_from=resume_from,
+                progress=progress,
+            )
+        except PipelineError as e:
+            if job["attempts"] < self.max_attempts:
+                print(f"⏳ Ingestion job {job_id} failed ({e}); will retry from chunk {e.stored}")
+                store.update(job_id, status=QUEUED, stored=e.stored, error=str(e))
+                self._wake.set()
+            else:
+                self._finish(job, FAILED, error=str(e), stored=e.stored)
+            return
+        except HTTPException as e:
+            self._finish(job, FAILED, error=str(e.detail))
+            return
+        except ValueError:
+            self._finish(job, FAILED, error="Could not read any text from uploaded file.")
+            return
+        except Exception as e:
+            self._finish(job, FAILED, error=f"Failed to ingest document: {e}")
+            return
+        finally:
+            beating.set()
+            save_progress(progress, force=True)
+
+        self._finish(job, DONE, result=json.dumps(result), document_id=result["document_id"])
+
+    def _finish(self, job: sqlite3.Row, status: str, **fields: Any):
+        self.store.update(job["id"], status=status, **fields)
+        try:
+            os.unlink(job["file_path"])
+        except OSError:
+            pass
+        if status == DONE:
+            print(f"✓ Ingestion job {job['id']} done")
+        else:
+            print(f"✗ Ingestion job {job['id']} failed: {fields.get('error')}")
+
+
+# Global queue; workers are started with the app
+ingest_jobs = IngestJobQueue()
@@ -0,0 +1,196 @@
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import INGEST_EMBED_BATCH, INGEST_WRITE_BATCH, INGEST_QUEUE_BATCHES, INGEST_WRITE_RETRIES
+
+# (chunk_index, text, metadata)
+Chunk = Tuple[int, str, Dict[str, Any]]
+EmbedFn = Callable[[List[str]], List[Optional[List[float]]]]
+# write_fn(indices, texts, metadatas, embeddings)
+WriteFn = Callable[[List[int], List[str], List[Dict[str, Any]], List[List[float]]], None]
+
+_DONE = object()
+
+
+class IngestProgress:
+    """Counters for one ingestion run, safe to read from other threads"""
+
+    def __init__(self, on_update: Optional[Callable[["IngestProgress"], None]] = None):
+        self.pages_extracted = 0
+        self.chunks_produced = 0
+        self.chunks_embedded = 0
+        self.chunks_stored = 0
+        self._on_update = on_update
+
+    def add(self, **counts: int):
+        for name, n in counts.items():
+            setattr(self, name, getattr(self, name) + n)
+        if self._on_update:
+            self._on_update(self)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "pages_extracted": self.pages_extracted,
+            "chunks_produced": self.chunks_produced,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_stored": self.chunks_stored,
+        }
+
+
+class PipelineError(RuntimeError):
+    """Ingestion stopped part-way. Chunks [0, stored) are safely written, so a
+    retry can resume from `stored` instead of starting over."""
+
+    def __init__(self, message: str, stored: int):
+        super().__init__(message)
+        self.stored = stored
+
+
+class _Stop(Exception):
+    pass
+
+
+def run_pipeline(
+    chunks: Iterable[Chunk],
+    embed_fn: EmbedFn,
+    write_fn: WriteFn,
+    progress: Optional[IngestProgress] = None,
+    resume_from: int = 0,
+    embed_batch: int = INGEST_EMBED_BATCH,
+    write_batch: int = INGEST_WRITE_BATCH,
+    queue_batches: int = INGEST_QUEUE_BATCHES,
+    write_retries: int = INGEST_WRITE_RETRIES,
+) -> int:
+    """Stream chunks through embedding and storage with bounded queues between stages.
+
+    Stage 1 (thread) pulls chunks from `chunks` - which may itself be pulling
+    pages from the extractor - stage 2 (thread) embeds them in micro-batches,
+    and stage 3 (the calling thread) writes them in bounded batches. Each
+    queue holds at most `queue_batches` batches, so a slow stage makes the
+    earlier ones wait instead of buffering the whole document.
+
+    Writes happen in chunk order and must be idempotent (upserts by chunk id),
+    so after a failure every chunk below PipelineError.stored is in the store
+    and a rerun with resume_from=stored skips straight to the rest.
+    Returns the total number of chunks in the document.
+    """
+    progress = progress or IngestProgress()
+    chunk_q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_batches) * embed_batch)
+    write_q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_batches))
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    total = [resume_from]
+
+    def put(q: "queue.Queue", item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Stop()
+
+    def get(q: "queue.Queue"):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise _Stop()
+
+    def fail(e: BaseException):
+        if not isinstance(e, _Stop):
+            errors.append(e)
+        stop.set()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                index = chunk[0]
+                total[0] = index + 1
+                if index < resume_from:
+                    continue
+                progress.add(chunks_produced=1)
+                put(chunk_q, chunk)
+            put(chunk_q, _DONE)
+        except BaseException as e:
+            fail(e)
+
+    def embed():
+        try:
+            done = False
+            while not done:
+                batch = []
+                while len(batch) < embed_batch:
+                    item = get(chunk_q)
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+                if not batch:
+                    continue
+                embeddings = embed_fn([text for _, text, _ in batch])
+                failed = sum(1 for emb in embeddings if emb is None)
+                if failed:
+                    raise RuntimeError(f"Failed to embed {failed} of {len(batch)} chunks")
+                progress.add(chunks_embedded=len(batch))
+                put(write_q, (batch, embeddings))
+            put(write_q, _DONE)
+        except BaseException as e:
+            fail(e)
+
+    threads = [
+        threading.Thread(target=produce, name="ingest-produce", daemon=True),
+        threading.Thread(target=embed, name="ingest-embed", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    pending: List[Tuple[Chunk, List[float]]] = []
+
+    def flush():
+        if not pending:
+            return
+        indices = [c[0] for c, _ in pending]
+        texts = [c[1] for c, _ in pending]
+        metadatas = [c[2] for c, _ in pending]
+        embeddings = [emb for _, emb in pending]
+        for attempt in range(write_retries + 1):
+            try:
+                write_fn(indices, texts, metadatas, embeddings)
+                break
+            except Exception as e:
+                if attempt >= write_retries:
+                    raise
+                delay = 2 ** attempt
+                print(f"⏳ Vector store write failed ({e}); retrying in {delay}s...")
+                time.sleep(delay)
+        progress.add(chunks_stored=len(pending))
+        pending.clear()
+
+    try:
+        while True:
+            item = get(write_q)
+            if item is _DONE:
+                break
+            batch, embeddings = item
+            pending.extend(zip(batch, embeddings))
+            while len(pending) >= write_batch:
+                head, rest = pending[:write_batch], pending[write_batch:]
+                pending[:] = head
+                flush()
+                pending.extend(rest)
+        flush()
+    except BaseException as e:
+        fail(e)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+    if errors:
+        stored = resume_from + progress.chunks_stored
+        raise PipelineError(f"Ingestion stopped after {stored} chunks: {errors[0]}", stored) from errors[0]
+    return total[0]
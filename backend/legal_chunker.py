@@ -0,0 +1,221 @@
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from config import CHUNK_MAX_TOKENS, CHUNK_MIN_TOKENS
+from tokens import count_tokens
+
+# A line that starts a new unit. Order matters only for the reported kind.
+_SCHEDULE = re.compile(r"^(schedule|annex|annexure|appendix|exhibit)\s+[\w.-]+\b", re.IGNORECASE)
+_ARTICLE = re.compile(r"^(article|section|clause|part)\s+[\dIVXLC]+[\w.]*\b", re.IGNORECASE)
+_NUMBERED = re.compile(r"^(\d+(\.\d+)*\.?|\(?[a-z]\)|\(?[ivx]+\)|[A-Z]\.)\s+\S")
+# Top-level labels that may just be a title ("1. DEFINITIONS", "Article 5 - Termination"); sub-clauses never are
+_TITLED = re.compile(r"^(\d+\.?|[A-Z]\.|(article|section|clause|part)\s+[\dIVXLC]+\.?)(\s+|$)", re.IGNORECASE)
+_DEFINITION = re.compile(r'^["“][^"”]{1,80}["”]\s+(means|shall mean|has the meaning|includes|refers to)\b', re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.;:!?])\s+")
+_WS = re.compile(r"\s+")
+
+HEADING = "heading"
+SCHEDULE = "schedule"
+CLAUSE = "clause"
+DEFINITION = "definition"
+TEXT = "text"
+
+
+class LegalChunk(NamedTuple):
+    text: str
+    char_start: int  # offsets into "\n".join(pages)
+    char_end: int
+    page_start: int  # 1-based
+    page_end: int
+    section: Optional[str]  # nearest heading / clause label at the chunk start
+
+
+class _Line(NamedTuple):
+    text: str  # whitespace-normalized
+    start: int
+    end: int
+    page: int
+    kind: str
+
+
+def _is_heading(line: str) -> bool:
+    # Short, no terminal punctuation, and either ALL CAPS or Title Case
+    if len(line) > 80 or line[-1] in ".;,:" or not any(c.isalpha() for c in line):
+        return False
+    letters = [c for c in line if c.isalpha()]
+    if all(c.isupper() for c in letters):
+        return len(letters) > 2
+    words = [w for w in line.split() if w[0].isalpha()]
+    return 0 < len(words) <= 8 and all(w[0].isupper() or w.lower() in ("of", "and", "the", "to", "in", "for", "or") for w in words)
+
+
+def _is_numbered_heading(line: str) -> bool:
+    # A label followed by a title and no sentence body; the label alone also counts
+    label = _TITLED.match(line)
+    if not label:
+        return False
+    title = line[label.end():].lstrip(" -–—:")
+    return not title or _is_heading(title)
+
+
+def classify_line(line: str) -> str:
+    if _SCHEDULE.match(line):
+        return SCHEDULE
+    if _ARTICLE.match(line) or _NUMBERED.match(line):
+        return HEADING if _is_numbered_heading(line) else CLAUSE
+    if _DEFINITION.match(line):
+        return DEFINITION
+    if _is_heading(line):
+        return HEADING
+    return TEXT
+
+
+def _lines(pages: Iterable[str]) -> Iterator[_Line]:
+    offset = 0
+    for page_number, page in enumerate(pages, start=1):
+        if page_number > 1:
+            offset += 1  # the "\n" between pages
+        line_start = offset
+        for raw in page.split("\n"):
+            text = _WS.sub(" ", raw).strip()
+            if text:
+                lead = len(raw) - len(raw.lstrip())
+                yield _Line(text, line_start + lead, line_start + len(raw.rstrip()), page_number, classify_line(text))
+            line_start += len(raw) + 1
+        offset += len(page)
+
+
+class _Unit:
+    """A clause, definition, heading or paragraph: lines up to the next boundary"""
+
+    __slots__ = ("lines", "kind")
+
+    def __init__(self, first: _Line):
+        self.lines = [first]
+        self.kind = first.kind
+
+    @property
+    def text(self) -> str:
+        return " ".join(line.text for line in self.lines)
+
+
+def _units(lines: Iterable[_Line]) -> Iterator[_Unit]:
+    unit: Optional[_Unit] = None
+    for line in lines:
+        starts_unit = line.kind != TEXT or unit is None or unit.kind == HEADING
+        # A paragraph break in the extracted text (a sentence ended) also starts a unit
+        if not starts_unit and unit.lines[-1].text[-1] in ".;:" and line.text[0].isupper():
+            starts_unit = True
+        if starts_unit:
+            if unit is not None:
+                yield unit
+            unit = _Unit(line)
+        else:
+            unit.lines.append(line)
+    if unit is not None:
+        yield unit
+
+
+def _split_long(unit: _Unit, max_tokens: int) -> Iterator[List[_Line]]:
+    """Split an oversized unit at sentence ends (or words, as a last resort), keeping offsets."""
+    pieces: List[_Line] = []
+    for line in unit.lines:
+        pos = 0
+        for part in _SENTENCE_END.split(line.text):
+            idx = line.text.find(part, pos)
+            pos = idx + len(part)
+            # Offsets are approximate inside a line whose whitespace was normalized
+            start = min(line.start + idx, line.end)
+            pieces.append(_Line(part, start, min(start + len(part), line.end), line.page, line.kind))
+
+    group: List[_Line] = []
+    tokens = 0
+    for piece in pieces:
+        n = count_tokens(piece.text)
+        if n > max_tokens:
+            if group:
+                yield group
+                group, tokens = [], 0
+            words = piece.text.split(" ")
+            step = max(1, len(words) * max_tokens // n)
+            for i in range(0, len(words), step):
+                yield [piece._replace(text=" ".join(words[i:i + step]))]
+            continue
+        if group and tokens + n > max_tokens:
+            yield group
+            group, tokens = [], 0
+        group.append(piece)
+        tokens += n
+    if group:
+        yield group
+
+
+def iter_legal_chunks(
+    pages: Iterable[str],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    min_tokens: int = CHUNK_MIN_TOKENS,
+) -> Iterator[LegalChunk]:
+    """Clause-aware chunks of a document given page by page.
+
+    Lines are classified once (schedule / article / numbered clause /
+    definition / heading / text) and grouped into units that start at those
+    boundaries. Units are packed whole into chunks of up to `max_tokens`, with
+    no overlap; a heading or schedule starts a new chunk once the current one
+    has `min_tokens`, and a unit too large for one chunk is split at sentence
+    ends. Every line and unit is visited a constant number of times, so the
+    cost is linear in the document size, and pages are consumed lazily.
+    """
+    units: List[_Unit] = []
+    sizes: List[int] = []
+    section: Optional[str] = None
+    chunk_section: Optional[str] = None
+
+    def emit(group: List[_Line], label: Optional[str]) -> LegalChunk:
+        return LegalChunk(
+            " ".join(line.text for line in group),
+            group[0].start,
+            group[-1].end,
+            group[0].page,
+            group[-1].page,
+            label,
+        )
+
+    def flush() -> Iterator[LegalChunk]:
+        nonlocal units, sizes, chunk_section
+        # A heading belongs with what follows it, not at the end of the previous chunk
+        carried = []
+        while len(units) > 1 and units[-1].kind == HEADING:
+            carried.insert(0, (units.pop(), sizes.pop()))
+        if units:
+            yield emit([line for unit in units for line in unit.lines], chunk_section)
+        units = [unit for unit, _ in carried]
+        sizes = [n for _, n in carried]
+        if units:
+            chunk_section = units[0].lines[0].text[:80]
+
+    for unit in _units(_lines(pages)):
+        if unit.kind in (HEADING, SCHEDULE, CLAUSE):
+            section = unit.lines[0].text[:80]
+        n = count_tokens(unit.text)
+
+        tokens = sum(sizes)
+        hard_break = unit.kind in (HEADING, SCHEDULE) and tokens >= min_tokens and units[-1].kind != HEADING
+        if units and (hard_break or tokens + n > max_tokens):
+            yield from flush()
+
+        if n > max_tokens:
+            # Anything still pending is a carried heading; it goes out with the first piece
+            prefix = [line for pending in units for line in pending.lines]
+            units, sizes = [], []
+            for group in _split_long(unit, max_tokens):
+                yield emit(prefix + group, section)
+                prefix = []
+            continue
+
+        if not units:
+            chunk_section = section
+        units.append(unit)
+        sizes.append(n)
+
+    if units:
+        yield emit([line for unit in units for line in unit.lines], chunk_section)
@@ -0,0 +1,298 @@
+import os
+import re
+import math
+import time
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import LEXICAL_INDEX_PATH
+
+# Keeps section numbers ("12.3"), hyphenated and possessive terms together
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-'][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "shall any all such not no may".split()
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        # Light plural folding so "indemnities" finds "indemnity" and "parties" finds "party"
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss") and token[-2].isalpha():
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+# ------------- postings encoding -------------
+
+def _encode(postings: Sequence[Tuple[int, int]]) -> bytes:
+    """(chunk_index, tf) pairs sorted by chunk_index, as varint deltas"""
+    out = bytearray()
+    previous = 0
+    for chunk_index, tf in postings:
+        for value in (chunk_index - previous, tf):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        previous = chunk_index
+    return bytes(out)
+
+
+def _decode(data: bytes) -> Iterable[Tuple[int, int]]:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    chunk_index = 0
+    for i in range(0, len(values), 2):
+        chunk_index += values[i]
+        yield chunk_index, values[i + 1]
+
+
+# ------------- index -------------
+
+class LexicalIndex:
+    """BM25 inverted index over chunk texts, in SQLite.
+
+    Postings are stored per (term, document, write batch) as varint-encoded
+    (chunk_index delta, term frequency) pairs, so ingesting a batch is a
+    handful of inserts and a query reads only the rows for its terms and
+    documents. Retrieval is always scoped to a few documents, so document
+    frequencies and average chunk length are computed over those documents'
+    chunks at query time and no global statistics need updating.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER NOT NULL,
+                document_id TEXT NOT NULL,
+                first_chunk INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (term_id, document_id, first_chunk)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_document ON postings(document_id)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunk_lengths (
+                document_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (document_id, chunk_index)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._term_ids: Dict[str, int] = dict(self._conn.execute("SELECT term, id FROM terms"))
+
+    @property
+    def synced(self) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'synced'").fetchone()
+        return bool(row and row[0] == "1")
+
+    def has_document(self, document_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM chunk_lengths WHERE document_id = ? LIMIT 1", (document_id,)
+            ).fetchone() is not None
+
+    def _term_id(self, term: str) -> int:
+        # Called with the lock held
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            # Another worker process may have added the term meanwhile
+            self._conn.execute("INSERT OR IGNORE INTO terms (term) VALUES (?)", (term,))
+            term_id = self._conn.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()[0]
+            self._term_ids[term] = term_id
+        return term_id
+
+    def add_chunks(self, document_id: str, chunk_indices: Sequence[int], texts: Sequence[str]):
+        """Index one write batch of a document's chunks"""
+        if not texts:
+            return
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for chunk_index, text in sorted(zip(chunk_indices, texts)):
+            counts = Counter(tokenize(text))
+            lengths.append((document_id, chunk_index, sum(counts.values())))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((chunk_index, tf))
+        first_chunk = min(chunk_indices)
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                rows = [
+                    (self._term_id(term), document_id, first_chunk, len(items), _encode(items))
+                    for term, items in postings.items()
+                ]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO postings (term_id, document_id, first_chunk, count, data) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_lengths (document_id, chunk_index, length) VALUES (?, ?, ?)",
+                    lengths,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # Ids handed out inside the rolled back transaction are gone from the table
+                self._term_ids = dict(self._conn.execute("SELECT term, id FROM terms"))
+                raise
+
+    def remove_document(self, document_id: str, from_chunk: int = 0):
+        """Drop a document's postings (or those of batches starting at `from_chunk` or later, for a resumed ingest)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM postings WHERE document_id = ? AND first_chunk >= ?", (document_id, from_chunk)
+            )
+            self._conn.execute(
+                "DELETE FROM chunk_lengths WHERE document_id = ? AND chunk_index >= ?", (document_id, from_chunk)
+            )
+            self._conn.execute("COMMIT")
+
+    def search(self, document_ids: Sequence[str], query: str, k: int) -> List[Tuple[str, int, float]]:
+        """Top-k (document_id, chunk_index, BM25 score) within `document_ids`"""
+        terms = sorted(set(tokenize(query)))
+        if not terms or not document_ids:
+            return []
+        doc_marks = ", ".join("?" for _ in document_ids)
+
+        with self._lock:
+            missing = [t for t in terms if t not in self._term_ids]
+            if missing:
+                # Terms added by another worker process
+                marks = ", ".join("?" for _ in missing)
+                self._term_ids.update(self._conn.execute(f"SELECT term, id FROM terms WHERE term IN ({marks})", missing))
+            term_ids = {self._term_ids[t]: t for t in terms if t in self._term_ids}
+            if not term_ids:
+                return []
+            n_chunks, total_length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunk_lengths WHERE document_id IN ({doc_marks})",
+                list(document_ids),
+            ).fetchone()
+            if not n_chunks:
+                return []
+            term_marks = ", ".join("?" for _ in term_ids)
+            rows = self._conn.execute(
+                f"SELECT term_id, document_id, count, data FROM postings "
+                f"WHERE term_id IN ({term_marks}) AND document_id IN ({doc_marks})",
+                [*term_ids, *document_ids],
+            ).fetchall()
+
+        df: Counter = Counter()
+        tfs: Dict[Tuple[str, int], List[Tuple[int, int]]] = {}
+        for term_id, document_id, count, data in rows:
+            df[term_id] += count
+            for chunk_index, tf in _decode(data):
+                tfs.setdefault((document_id, chunk_index), []).append((term_id, tf))
+        if not tfs:
+            return []
+
+        with self._lock:
+            lengths = {}
+            keys = list(tfs)
+            for start in range(0, len(keys), 400):
+                part = keys[start:start + 400]
+                where = " OR ".join("(document_id = ? AND chunk_index = ?)" for _ in part)
+                params = [value for key in part for value in key]
+                for document_id, chunk_index, length in self._conn.execute(
+                    f"SELECT document_id, chunk_index, length FROM chunk_lengths WHERE {where}", params
+                ):
+                    lengths[(document_id, chunk_index)] = length
+
+        avg_length = total_length / n_chunks or 1.0
+        idf = {t: math.log(1 + (n_chunks - n + 0.5) / (n + 0.5)) for t, n in df.items()}
+        scores = []
+        for key, hits in tfs.items():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths.get(key, avg_length) / avg_length)
+            score = sum(idf[t] * tf * (BM25_K1 + 1) / (tf + norm) for t, tf in hits)
+            scores.append((key[0], key[1], score))
+        scores.sort(key=lambda item: -item[2])
+        return scores[:k]
+
+    # ---- rebuild ----
+
+    def rebuild(self, collection, page_size: int = 1000):
+        """Index every complete document in the vector store that is not indexed yet.
+
+        Works page by page, so memory stays bounded by `page_size` chunks.
+        """
+        started = time.perf_counter()
+        indexed: Dict[str, bool] = {}  # whether a document was already indexed before this run
+        offset = 0
+        added = 0
+        while True:
+            page = collection.get(include=["metadatas", "documents"], limit=page_size, offset=offset)
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            pending: Dict[str, List[Tuple[int, str]]] = {}
+            for metadata, text in zip(page.get("metadatas") or [], page.get("documents") or []):
+                metadata = metadata or {}
+                document_id = metadata.get("document_id")
+                if not document_id or not metadata.get("doc_hash") or text is None:
+                    continue  # incomplete ingestion
+                if document_id not in indexed:
+                    indexed[document_id] = self.has_document(document_id)
+                if not indexed[document_id]:
+                    pending.setdefault(document_id, []).append((metadata.get("chunk_index", 0), text))
+            for document_id, items in pending.items():
+                self.add_chunks(document_id, [i for i, _ in items], [t for _, t in items])
+                added += len(items)
+            offset += len(ids)
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced', '1')")
+        new_documents = sum(1 for was_indexed in indexed.values() if not was_indexed)
+        print(
+            f"✓ Lexical index synced: {new_documents} documents ({added} chunks) added "
+            f"from {offset} stored chunks in {time.perf_counter() - started:.1f}s"
+        )
+
+
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex()
+        return _lexical_index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], k: int = 60) -> List:
+    """Fuse ranked lists of keys: score(key) = sum over lists of 1 / (k + rank)"""
+    scores: Dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: -scores[key])
@@ -0,0 +1,180 @@
+"""Concurrent load benchmark of the task routes against stubbed backends.
+
+    python load_benchmark.py [--concurrency 10,50,100,200] [--requests 400]
+                             [--store-ms 30] [--embed-ms 50] [--llm-ms 500]
+
+The vector store, Gemini and Groq are replaced with stubs that only wait
+(`--store-ms`, `--embed-ms`, `--llm-ms` per call), so what is measured is
+how many requests one worker keeps in flight. For every concurrency level,
+`--requests` POST /simplify calls go through the ASGI app twice:
+
+  sync   a blocking `def` handler (retrieve_context + call_llm), which
+         Starlette runs on its threadpool of 40 threads
+  async  the real async route (retrieve_chunks_async + call_llm_async)
+
+and the throughput and latency percentiles of both are reported.
+"""
+import os
+
+# Stubbed run: no Chroma / Groq credentials, no caching between requests, no rate limiting
+os.environ.setdefault("VECTOR_STORE_BACKEND", "local")
+os.environ.setdefault("ADMIN_API_KEY", "benchmark")
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ["RESULT_CACHE_ENABLED"] = "false"
+os.environ["HOT_DOC_CACHE_ENABLED"] = "false"
+os.environ["HYBRID_RETRIEVAL"] = "false"
+os.environ["USE_LOCAL_EMBEDDINGS"] = "false"
+os.environ["GROQ_CALLS_PER_MINUTE"] = os.environ["GEMINI_EMBED_CALLS_PER_MINUTE"] = "1e9"
+os.environ["GROQ_BURST"] = os.environ["GEMINI_EMBED_BURST"] = "1000000"
+
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+import rag_utils
+from models import GenericResponse, RAGRequest
+from routes import task_routes
+from routes.task_routes import TASK_QUESTIONS
+
+DOCUMENT_ID = "benchmark-doc"
+DIM = 3072
+
+
+class _StubCollection:
+    def __init__(self, delay: float, k: int = 8):
+        self.delay = delay
+        rng = np.random.default_rng(0)
+        self.texts = [f"Clause {i}. The parties agree to the terms set out in section {i}." for i in range(k)]
+        self.metadatas = [{"document_id": DOCUMENT_ID, "chunk_index": i} for i in range(k)]
+        self.embeddings = rng.standard_normal((k, DIM)).astype(np.float32)
+
+    def query(self, query_embeddings, n_results, where=None, include=None):
+        time.sleep(self.delay)
+        n = len(query_embeddings)
+        return {
+            "documents": [self.texts[:n_results]] * n,
+            "metadatas": [self.metadatas[:n_results]] * n,
+            "embeddings": [self.embeddings[:n_results]] * n,
+        }
+
+
+def _completion(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def _install_stubs(args):
+    collection = _StubCollection(args.store_ms / 1000)
+    rag_utils.get_vector_store = lambda: collection
+
+    def embed(texts, task_type):
+        time.sleep(args.embed_ms / 1000)
+        return np.ones((len(texts), DIM), dtype=np.float32) / np.sqrt(DIM)
+
+    async def embed_async(texts, task_type):
+        await asyncio.sleep(args.embed_ms / 1000)
+        return np.ones((len(texts), DIM), dtype=np.float32) / np.sqrt(DIM)
+
+    rag_utils.gemini_embedding_engine.embed_batch_fn = embed
+    rag_utils.gemini_embedding_engine.embed_batch_async_fn = embed_async
+
+    def create(**kwargs):
+        time.sleep(args.llm_ms / 1000)
+        return _completion("stub answer")
+
+    async def create_async(**kwargs):
+        await asyncio.sleep(args.llm_ms / 1000)
+        return _completion("stub answer")
+
+    sync_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create_async)))
+    rag_utils.get_groq_client = lambda: sync_client
+    rag_utils.get_async_groq_client = lambda: async_client
+
+
+def _build_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(task_routes.router)
+
+    @app.post("/sync/simplify", response_model=GenericResponse)
+    def simplify_sync(payload: RAGRequest):
+        # The blocking request path: one threadpool thread per request for its whole duration
+        question = TASK_QUESTIONS["simplify"]
+        context = rag_utils.retrieve_context([payload.document_id], question)
+        prompt = rag_utils.build_legal_prompt("Simplify Language", question, context)
+        return GenericResponse(result=rag_utils.call_llm(prompt), note="Processing complete!")
+
+    return app
+
+
+async def _run(app: FastAPI, path: str, concurrency: int, total: int) -> Dict[str, float]:
+    transport = httpx.ASGITransport(app=app)
+    latencies: List[float] = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        async def one():
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(path, json={"document_id": DOCUMENT_ID})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "failures": failures,
+    }
+
+
+async def main_async(args):
+    _install_stubs(args)
+    app = _build_app()
+    # Warm the query embedding cache so both paths start from the same state
+    await _run(app, "/simplify", 1, 1)
+
+    print(
+        f"Stub latencies: store {args.store_ms:.0f}ms, embed {args.embed_ms:.0f}ms, LLM {args.llm_ms:.0f}ms; "
+        f"{args.requests} requests per run\n"
+    )
+    print(f"{'concurrency':>11} {'path':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'failed':>7}")
+    for concurrency in args.concurrency:
+        results = {}
+        for name, path in (("sync", "/sync/simplify"), ("async", "/simplify")):
+            results[name] = stats = await _run(app, path, concurrency, args.requests)
+            print(
+                f"{concurrency:>11} {name:>6} {stats['throughput']:>8.1f} {stats['p50_ms']:>8.0f} "
+                f"{stats['p95_ms']:>8.0f} {stats['failures']:>7}"
+            )
+        gain = results["async"]["throughput"] / results["sync"]["throughput"]
+        print(f"{'':>11} {'gain':>6} {gain:>7.1f}x\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="10,50,100,200",
+                        type=lambda s: [int(c) for c in s.split(",") if c.strip()])
+    parser.add_argument("--requests", type=int, default=400, help="requests per run")
+    parser.add_argument("--store-ms", type=float, default=30)
+    parser.add_argument("--embed-ms", type=float, default=50)
+    parser.add_argument("--llm-ms", type=float, default=500)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from vector_ops import as_matrix
+from config import (
+    LOCAL_EMBED_MODEL_NAME,
+    LOCAL_EMBED_BACKEND,
+    LOCAL_EMBED_MAX_BATCH,
+    LOCAL_EMBED_MAX_WAIT_MS,
+)
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+def load_encoder(model_name: str, backend: str = "torch"):
+    """A SentenceTransformer for `backend`: "torch", "int8" or "onnx" (all CPU except plain torch)"""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        # sentence-transformers >= 3.2 exports the model to ONNX on first load
+        return SentenceTransformer(model_name, backend="onnx", device="cpu")
+    if backend == "int8":
+        import torch
+
+        encoder = SentenceTransformer(model_name, device="cpu")
+        # Weights of every Linear layer stored as int8, activations quantized on the fly
+        return torch.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend != "torch":
+        raise ValueError(f"Unknown local embedding backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+    return SentenceTransformer(model_name)
+
+
+def model_id(model_name: str, backend: str) -> str:
+    """Name embeddings are cached and stored under; quantized backends produce slightly different vectors"""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+class _Request(NamedTuple):
+    texts: List[str]
+    future: Future
+    enqueued_at: float
+
+
+class LocalEmbeddingService:
+    """The local embedding model, served by one worker thread.
+
+    Callers submit lists of texts and get a future. The worker takes the
+    oldest request, waits up to `max_wait_ms` for more to arrive, and encodes
+    everything it collected (up to `max_batch` texts) in one forward pass, so
+    concurrent single-question requests share a batch instead of each running
+    the model on its own and competing for cores. A request larger than
+    `max_batch` is encoded on its own.
+
+    The model is loaded on first use (or by the startup warm-up). If the
+    configured backend cannot be loaded, the plain torch model is used.
+    """
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBED_MODEL_NAME,
+        backend: str = LOCAL_EMBED_BACKEND,
+        max_batch: int = LOCAL_EMBED_MAX_BATCH,
+        max_wait_ms: float = LOCAL_EMBED_MAX_WAIT_MS,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.encoder = None
+        self.dim: Optional[int] = None
+        self.failed = False
+
+        self._load_lock = threading.Lock()
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self.queue_wait = 0.0
+        self.encode_seconds = 0.0
+
+    @property
+    def model_id(self) -> str:
+        return model_id(self.model_name, self.backend)
+
+    def load(self):
+        """The encoder, loaded on first call (None if it could not be loaded)"""
+        if self.encoder is not None or self.failed:
+            return self.encoder
+        with self._load_lock:
+            if self.encoder is None and not self.failed:
+                try:
+                    encoder = load_encoder(self.model_name, self.backend)
+                except Exception as e:
+                    if self.backend == "torch":
+                        print(f"✗ Failed to load local sentence-transformers model: {e}")
+                        self.failed = True
+                        return None
+                    print(f"✗ Failed to load '{self.model_name}' with the {self.backend} backend ({e}); using torch")
+                    self.backend = "torch"
+                    try:
+                        encoder = load_encoder(self.model_name, "torch")
+                    except Exception as e2:
+                        print(f"✗ Failed to load local sentence-transformers model: {e2}")
+                        self.failed = True
+                        return None
+                self.dim = encoder.get_sentence_embedding_dimension()
+                self.encoder = encoder
+                print(f"✓ Local embedding enabled using '{self.model_name}' ({self.backend}, dim={self.dim})")
+        return self.encoder
+
+    # ---- requests ----
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        future: Future = Future()
+        if not texts:
+            future.set_result(np.zeros((0, self.dim or 0), dtype=np.float32))
+            return future
+        self._ensure_worker()
+        self._queue.put(_Request(list(texts), future, time.perf_counter()))
+        return future
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    async def embed_async(self, texts: Sequence[str]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    # ---- worker ----
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="local-embeddings", daemon=True)
+                self._worker.start()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [r for r in self._collect(self._queue.get()) if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            texts = [t for r in batch for t in r.texts]
+            try:
+                encoder = self.load()
+                if encoder is None:
+                    raise RuntimeError("Local encoder not available")
+                # encode() returns an (n_texts, dim) numpy array, 2D even for a single text
+                embs = as_matrix(encoder.encode(texts, batch_size=self.max_batch, convert_to_numpy=True))
+            except Exception as e:
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for r in batch:
+                r.future.set_result(embs[offset:offset + len(r.texts)])
+                offset += len(r.texts)
+
+            with self._stats_lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self.texts += len(texts)
+                self.largest_batch = max(self.largest_batch, len(texts))
+                self.queue_wait += sum(started - r.enqueued_at for r in batch)
+                self.encode_seconds += finished - started
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            return {
+                "model": self.model_id,
+                "loaded": self.encoder is not None,
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "mean_queue_wait_ms": round(1000 * self.queue_wait / self.requests, 2) if self.requests else 0.0,
+                "encode_seconds": round(self.encode_seconds, 3),
+            }
+
+
+# Shared service used by rag_utils when USE_LOCAL_EMBEDDINGS is on
+local_embedding_service = LocalEmbeddingService()
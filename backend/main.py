@@ -1,15 +1,28 @@
 import sys
+import time
+import asyncio
+import threading
 from pathlib import Path
 
+_import_started = time.perf_counter()
+
 # Add current directory to path FIRST, before any other imports
 sys.path.insert(0, str(Path(__file__).parent))
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from routes import api_router
-from config import ALLOWED_ORIGINS
+from config import ALLOWED_ORIGINS, STARTUP_WARMUP
+from rate_limiter import RateLimitExceeded
+from ingest_jobs import ingest_jobs
+from rag_utils import sync_document_index, sync_lexical_index, precompute_query_embeddings
+from routes.task_routes import TASK_QUESTIONS
+from warmup import readiness, run_warmup
 
+readiness.import_seconds = round(time.perf_counter() - _import_started, 3)
+print(f"✓ Application modules imported in {readiness.import_seconds:.2f}s")
 
 app = FastAPI(title="LegalEase RAG API (Modular)")
 
@@ -18,6 +31,79 @@ app = FastAPI(title="LegalEase RAG API (Modular)")
 def health_check():
     return {"status": "healthy", "service": "LegalEase RAG API"}
 
+
+@app.get("/ready")
+def ready_check():
+    """200 once the startup warm-up has loaded clients, the vector store and models; 503 until then"""
+    details = readiness.as_dict()
+    return JSONResponse(status_code=200 if details["status"] == "ready" else 503, content=details)
+
+
+@app.on_event("startup")
+def start_warmup():
+    if STARTUP_WARMUP == "blocking":
+        run_warmup()
+    elif STARTUP_WARMUP == "off":
+        readiness.mark_finished()
+    else:
+        threading.Thread(target=run_warmup, name="startup-warmup", daemon=True).start()
+
+
+@app.on_event("startup")
+def start_ingest_jobs():
+    # Also picks up jobs left queued or running by a previous process
+    ingest_jobs.start()
+
+
+@app.on_event("startup")
+def start_document_index_sync():
+    # Duplicate checks fall back to the vector store until the local index is built, and
+    # documents not yet in the BM25 index are retrieved by vector similarity alone
+    def sync():
+        try:
+            sync_document_index()
+        except Exception as e:
+            print(f"✗ Document index sync failed: {e}")
+        try:
+            sync_lexical_index()
+        except Exception as e:
+            print(f"✗ Lexical index sync failed: {e}")
+
+    threading.Thread(target=sync, name="document-index-sync", daemon=True).start()
+
+
+@app.on_event("startup")
+async def start_task_question_embeddings():
+    # In the background so a slow embedding API does not delay startup; until it finishes,
+    # the questions are embedded (and cached) on first use
+    if STARTUP_WARMUP == "off":
+        return
+
+    async def precompute():
+        started = time.perf_counter()
+        try:
+            await precompute_query_embeddings(TASK_QUESTIONS.values())
+            readiness.record("task_question_embeddings", "ok", time.perf_counter() - started, required=False)
+        except Exception as e:
+            print(f"✗ Failed to precompute task question embeddings: {e}")
+            readiness.record("task_question_embeddings", "failed", time.perf_counter() - started, str(e), required=False)
+
+    app.state.question_embeddings_task = asyncio.get_running_loop().create_task(precompute())
+
+
+@app.on_event("shutdown")
+def stop_ingest_jobs():
+    ingest_jobs.stop()
+
+
+@app.exception_handler(RateLimitExceeded)
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)},
+    )
+
 # CORS – only allow origins from ALLOWED_ORIGINS
 app.add_middleware(
     CORSMiddleware,
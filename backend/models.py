@@ -1,33 +1,94 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
 
 
 class TextIngestRequest(BaseModel):
     text: str
     uploader_id: Optional[str] = None
+    previous_document_id: Optional[str] = None  # store as a new version of this document
 
 
 class RAGRequest(BaseModel):
     document_id: str
     output_language: Optional[str] = "English"
+    stream: Optional[bool] = False  # True = Server-Sent Events as tokens arrive
+    full_document: Optional[bool] = False  # /summary and /simplify: map-reduce over every chunk
+
+
+class BatchAnalysisRequest(BaseModel):
+    document_id: str
+    modes: Optional[List[str]] = None  # simplify | summary | key_terms | risk_analysis; omit for all
+    output_language: Optional[str] = "English"
+    stream: Optional[bool] = False  # True = one Server-Sent Event per mode as it finishes
+    full_document: Optional[bool] = False  # simplify and summary: map-reduce over every chunk
+
+
+class BatchAnalysisResponse(BaseModel):
+    results: Dict[str, str]
+    errors: Dict[str, str] = {}  # mode -> why it failed; the other modes are still returned
+    note: Optional[str] = None
 
 
 class CompareRequest(BaseModel):
     document_id_1: str
     document_id_2: str
     output_language: Optional[str] = "English"
+    stream: Optional[bool] = False
 
 
 class GenericResponse(BaseModel):
     result: str
 
 
+class ChatResponse(GenericResponse):
+    session_id: str  # send back with the next message to continue the conversation
+
+
 class IngestResponse(BaseModel):
     document_id: str
     is_new: bool
     message: str
+    # Set when the upload was stored as a new version of previous_document_id
+    version: Optional[int] = None
+    previous_document_id: Optional[str] = None
+    changes: Optional[Dict[str, Any]] = None
+
+
+class DocumentVersion(BaseModel):
+    document_id: str
+    version: int
+    previous_document_id: Optional[str] = None
+    changes: Optional[Dict[str, Any]] = None  # chunk-level diff against the previous version
+    created_at: Optional[float] = None
+
+
+class DocumentVersionsResponse(BaseModel):
+    document_id: str
+    versions: List[DocumentVersion]
 
 class ChatRequest(BaseModel):
     document_id: str
     message: str
-    output_language: Optional[str] = "English"
\ No newline at end of file
+    session_id: Optional[str] = None  # omit to start a new conversation
+    output_language: Optional[str] = "English"
+    stream: Optional[bool] = False
+
+
+class IngestJobProgress(BaseModel):
+    pages_extracted: int = 0
+    chunks_produced: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str  # queued | running | done | failed
+    filename: str
+    document_id: Optional[str] = None
+    attempts: int = 0
+    progress: IngestJobProgress
+    result: Optional[IngestResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
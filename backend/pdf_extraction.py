@@ -0,0 +1,230 @@
+import os
+import time
+import signal
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+from PyPDF2 import PdfReader
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+# Settings are read here rather than from config so pool workers only import PyPDF2.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_PAGE_TIMEOUT_SECONDS = float(os.getenv("PDF_PAGE_TIMEOUT_SECONDS", "20"))
+PDF_DOC_TIMEOUT_SECONDS = float(os.getenv("PDF_DOC_TIMEOUT_SECONDS", "300"))
+PDF_WORKER_MEMORY_MB = int(os.getenv("PDF_WORKER_MEMORY_MB", "1024"))
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "100"))
+MAX_DOCUMENT_CHARS = int(os.getenv("MAX_DOCUMENT_CHARS", str(20_000_000)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None  # None = system temp dir
+
+_COPY_BUFFER = 1024 * 1024
+
+
+class PdfExtractionError(Exception):
+    """The document as a whole could not be extracted within its limits"""
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class PageText(NamedTuple):
+    page_number: int  # 1-based
+    text: str
+    seconds: float
+    error: Optional[str] = None
+
+
+# ------------- uploads -------------
+
+def spill_to_file(
+    src: BinaryIO,
+    suffix: str = "",
+    max_bytes: int = MAX_UPLOAD_MB * 1024 * 1024,
+    directory: Optional[str] = UPLOAD_SPOOL_DIR,
+) -> str:
+    """Copy an upload stream to a temp file in fixed-size chunks. Returns the path."""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            while True:
+                block = src.read(_COPY_BUFFER)
+                if not block:
+                    break
+                written += len(block)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes // (1024 * 1024)} MB limit")
+                dst.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+@contextmanager
+def spilled(src: BinaryIO, suffix: str = ""):
+    """spill_to_file() as a context manager that removes the temp file afterwards"""
+    path = spill_to_file(src, suffix=suffix)
+    try:
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+# ------------- worker side -------------
+
+def _init_worker(memory_mb: int):
+    # Cap the address space so one pathological page cannot take the host down
+    if resource and memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+
+
+class _PageTimeout(Exception):
+    pass
+
+
+def _raise_page_timeout(signum, frame):
+    raise _PageTimeout()
+
+
+def _extract_pages(path: str, start: int, end: int, page_timeout: float) -> List[PageText]:
+    """Extract pages [start, end) of a PDF. Runs in a pool worker process."""
+    use_alarm = hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_page_timeout)
+
+    reader = PdfReader(path)
+    results = []
+    for index in range(start, end):
+        began = time.perf_counter()
+        text, error = "", None
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, page_timeout)
+            text = reader.pages[index].extract_text() or ""
+        except _PageTimeout:
+            error = f"timed out after {page_timeout:.0f}s"
+        except MemoryError:
+            error = "memory limit exceeded"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        results.append(PageText(index + 1, text, time.perf_counter() - began, error))
+    return results
+
+
+def extract_document_pages(path: str, page_timeout: float = PDF_PAGE_TIMEOUT_SECONDS) -> List[PageText]:
+    """Every page of a PDF (or a text file as one page) in one call. Runs in a bulk ingestion worker."""
+    if not path.lower().endswith(".pdf"):
+        with open(path, "rb") as f:
+            pages = [PageText(1, f.read().decode("utf-8", errors="ignore"), 0.0)]
+    else:
+        pages = _extract_pages(path, 0, len(PdfReader(path).pages), page_timeout)
+    if sum(len(page.text) for page in pages) > MAX_DOCUMENT_CHARS:
+        raise PdfExtractionError(f"Document exceeds {MAX_DOCUMENT_CHARS} characters")
+    return pages
+
+
+# ------------- pool side -------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def new_extraction_pool(workers: int = PDF_EXTRACT_WORKERS) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        # spawn: the server process has threads, which fork does not copy safely
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(PDF_WORKER_MEMORY_MB,),
+    )
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = new_extraction_pool()
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def iter_pdf_pages(path: str) -> Iterator[PageText]:
+    """Extract a PDF's pages in a process pool, yielding them in page order as they finish.
+
+    Pages are handed out in runs of PDF_PAGES_PER_TASK. A page that fails or
+    exceeds PDF_PAGE_TIMEOUT_SECONDS comes back with empty text and `error`
+    set; exceeding PDF_DOC_TIMEOUT_SECONDS or MAX_DOCUMENT_CHARS raises
+    PdfExtractionError.
+    """
+    try:
+        page_count = len(PdfReader(path).pages)
+    except Exception as e:
+        raise PdfExtractionError(f"Could not open PDF: {e}")
+
+    pool = _get_pool()
+    deadline = time.monotonic() + PDF_DOC_TIMEOUT_SECONDS
+    futures = [
+        pool.submit(_extract_pages, path, start, min(start + PDF_PAGES_PER_TASK, page_count), PDF_PAGE_TIMEOUT_SECONDS)
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+
+    total_chars = 0
+    try:
+        for future in futures:
+            try:
+                pages = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                raise PdfExtractionError(f"PDF extraction exceeded {PDF_DOC_TIMEOUT_SECONDS:.0f}s")
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool next time
+                _reset_pool()
+                raise PdfExtractionError("PDF extraction worker crashed")
+
+            for page in pages:
+                total_chars += len(page.text)
+                if total_chars > MAX_DOCUMENT_CHARS:
+                    raise PdfExtractionError(f"Document exceeds {MAX_DOCUMENT_CHARS} characters")
+                yield page
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def report_page_timings(pages: List[PageText], label: str = "PDF"):
+    """Log per-page extraction timings and failures."""
+    if not pages:
+        return
+    total = sum(p.seconds for p in pages)
+    failed = [p for p in pages if p.error]
+    slowest = sorted(pages, key=lambda p: p.seconds, reverse=True)[:3]
+    print(
+        f"✓ {label}: extracted {len(pages)} pages in {total:.2f}s of worker time "
+        f"(avg {total / len(pages) * 1000:.0f} ms/page, {len(failed)} failed)"
+    )
+    print("   slowest: " + ", ".join(f"p{p.page_number} {p.seconds * 1000:.0f} ms" for p in slowest))
+    for p in failed:
+        print(f"   ✗ page {p.page_number}: {p.error}")
@@ -1,35 +1,68 @@
 import os
+import asyncio
 import hashlib
 import uuid
 from io import BytesIO
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
 
-from fastapi import UploadFile, HTTPException
-from PyPDF2 import PdfReader
-
-import google.generativeai as genai
-
-from rate_limiter import api_rate_limiter
-from embedding_cache import get_cached_embedding, cache_embedding
-from config import get_chroma_client, groq_client, GROQ_MODEL_NAME, EMBED_MODEL_NAME
+import anyio
+import numpy as np
 
-# Optional local embedding support (sentence-transformers)
-USE_LOCAL_EMBEDDINGS = os.getenv("USE_LOCAL_EMBEDDINGS", "false").lower() in ("1", "true", "yes")
-LOCAL_EMBED_MODEL_NAME = os.getenv("LOCAL_EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
-_local_encoder = None
-_local_embed_dim = None
+from fastapi import UploadFile, HTTPException
 
-if USE_LOCAL_EMBEDDINGS:
-    try:
-        from sentence_transformers import SentenceTransformer
-        _local_encoder = SentenceTransformer(LOCAL_EMBED_MODEL_NAME)
-        # Get the embedding dimension from the model
-        _local_embed_dim = _local_encoder.get_sentence_embedding_dimension()
-        print(f"✓ Local embedding enabled using '{LOCAL_EMBED_MODEL_NAME}' (dim={_local_embed_dim})")
-    except Exception as e:
-        print(f"✗ Failed to load local sentence-transformers model: {e}")
-        _local_encoder = None
-        _local_embed_dim = None
+from rate_limiter import groq_chat_budget
+from vector_store import get_vector_store
+from document_cache import hot_documents, top_k_chunks
+from document_index import get_document_index, simhash
+from document_versions import PreviousVersion, change_summary, chunk_key, diff_chunks
+from lexical_index import get_lexical_index, reciprocal_rank_fusion
+from vector_ops import as_matrix
+from ingest_pipeline import IngestProgress, PipelineError, run_pipeline
+from legal_chunker import LegalChunk, iter_legal_chunks
+from context_packing import pack_context, packing_stats
+from pdf_extraction import (
+    PageText,
+    PdfExtractionError,
+    UploadTooLarge,
+    iter_pdf_pages,
+    report_page_timings,
+    spilled,
+)
+from remote_embeddings import gemini_embedding_engine, GEMINI_MODEL_ID, GEMINI_EMBED_DIM
+from local_embeddings import local_embedding_service
+from embedding_cache import get_cached_embeddings, cache_embeddings, query_embeddings
+from config import (
+    USE_LOCAL_EMBEDDINGS,
+    LOCAL_EMBED_MODEL_NAME,
+    get_groq_client,
+    get_async_groq_client,
+    GROQ_MODEL_NAME,
+    CHROMA_MAX_CONCURRENCY,
+    INGEST_WRITE_BATCH,
+    HOT_DOC_CACHE_ENABLED,
+    NEAR_DUPLICATE_REUSE,
+    CHUNKER,
+    CONTEXT_PACKING,
+    CONTEXT_TOKEN_BUDGET,
+    HYBRID_RETRIEVAL,
+    RETRIEVAL_TOP_K,
+    RETRIEVAL_CANDIDATES,
+    RRF_K,
+)
+
+# Optional local embedding support (sentence-transformers), served by local_embedding_service.
+# The model (and torch) is loaded on first use or by the startup warm-up, not at import.
+
+def get_local_encoder():
+    """The local SentenceTransformer, loaded on first call (None if disabled or it failed to load)"""
+    return local_embedding_service.load() if USE_LOCAL_EMBEDDINGS else None
+
+
+async def _ensure_local_encoder_async():
+    # Loading takes seconds; keep it off the event loop
+    if USE_LOCAL_EMBEDDINGS and local_embedding_service.encoder is None and not local_embedding_service.failed:
+        await asyncio.to_thread(local_embedding_service.load)
 
 
 # ------------- basic text helpers -------------
@@ -44,83 +77,130 @@ def compute_doc_hash(text: str) -> str:
 
 
 def extract_text_from_pdf(file_bytes: bytes) -> str:
-    reader = PdfReader(BytesIO(file_bytes))
-    text = []
-    for page in reader.pages:
-        page_text = page.extract_text() or ""
-        text.append(page_text)
-    return "\n".join(text)
+    with spilled(BytesIO(file_bytes), suffix=".pdf") as path:
+        return "\n".join(page.text for page in iter_pdf_pages(path))
 
 
-def extract_text_from_upload(file: UploadFile) -> str:
-    raw = file.file.read()
-    filename = (file.filename or "").lower()
+def iter_file_pages(path: str, filename: str = "") -> Iterator[PageText]:
+    """Yield the text of a file on disk page by page.
 
-    if filename.endswith(".pdf"):
-        return extract_text_from_pdf(raw)
+    PDFs are extracted in the process pool, in page order as pages finish;
+    anything else is decoded as UTF-8 and yielded as a single page.
+    """
+    if not filename.lower().endswith(".pdf"):
+        with open(path, "rb") as f:
+            yield PageText(1, f.read().decode("utf-8", errors="ignore"), 0.0)
+        return
 
     try:
-        return raw.decode("utf-8", errors="ignore")
-    except Exception:
-        return ""
+        timings = []
+        for page in iter_pdf_pages(path):
+            timings.append(page._replace(text=""))
+            yield page
+        report_page_timings(timings, label=filename or "PDF")
+    except PdfExtractionError as e:
+        raise HTTPException(status_code=422, detail=f"Could not extract PDF text: {e}")
 
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    text = normalize_text(text)
-    chunks = []
-    start = 0
-    n = len(text)
+def upload_suffix(file: UploadFile) -> str:
+    return ".pdf" if (file.filename or "").lower().endswith(".pdf") else ""
+
+
+def iter_upload_pages(file: UploadFile) -> Iterator[PageText]:
+    """Spill an upload to a temp file and yield its text page by page (see iter_file_pages)."""
+    try:
+        with spilled(file.file, suffix=upload_suffix(file)) as path:
+            yield from iter_file_pages(path, file.filename or "")
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def extract_text_from_upload(file: UploadFile) -> str:
+    return "\n".join(page.text for page in iter_upload_pages(file))
+
+
+def hash_pages(pages: Iterable[str], hasher) -> Iterator[str]:
+    """Pass pages through unchanged, feeding `hasher` exactly the normalized
+    text compute_doc_hash("\n".join(pages)) would hash."""
+    started = False
+    for page in pages:
+        piece = normalize_text(page)
+        if piece:
+            hasher.update(((" " if started else "") + piece).encode("utf-8"))
+            started = True
+        yield page
+
+
+def iter_text_chunks(
+    pages: Iterable[str],
+    chunk_size: int = 1000,
+    overlap: int = 200,
+) -> Iterator[str]:
+    """Streaming chunk_text over "\n".join(pages).
+
+    Pages are whitespace-normalized one at a time and each window is emitted as
+    soon as enough text has arrived, so only about one window is held in memory.
+    """
+    buffer = ""
+    started = False
+    for page in pages:
+        piece = normalize_text(page)
+        if not piece:
+            continue
+        if started:
+            piece = " " + piece
+        started = True
 
-    while start < n:
-        end = min(start + chunk_size, n)
-        chunk = text[start:end]
-        chunks.append(chunk)
-        if end == n:
-            break
-        start = end - overlap
+        buffer += piece
+        while len(buffer) > chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[chunk_size - overlap:]
 
-    return chunks
+    if buffer:
+        yield buffer
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    return list(iter_text_chunks([text], chunk_size=chunk_size, overlap=overlap))
 
 
 # ------------- local embedding helper -------------
 
-def _local_embed_batch(texts: List[str]) -> List[List[float]]:
-    if not _local_encoder:
-        raise RuntimeError("Local encoder not available")
-    # SentenceTransformer.encode() returns a numpy array of shape (n_texts, embedding_dim)
-    # Always returns 2D array even for single text: (1, dim) or (n, dim)
-    embs = _local_encoder.encode(texts, convert_to_numpy=True)
-    # Convert numpy array to list of lists - iterate over first dimension (rows)
-    return [emb.tolist() for emb in embs]
+def _local_embed_batch(texts: List[str]) -> np.ndarray:
+    # Queued to the service worker, which may encode it together with other requests
+    return local_embedding_service.embed(texts)
 
 
 # ------------- embeddings -------------
 
-def embed_texts(texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
-    """Embed a list of texts. Uses cache, local encoder (if enabled) or Gemini otherwise.
+def current_embedding_model() -> str:
+    """Name of the model embed_texts uses for uncached texts"""
+    # Use local if available, otherwise Gemini (3072-dim for embedding-001 unless GEMINI_EMBED_DIM truncates it)
+    return local_embedding_service.model_id if get_local_encoder() is not None else GEMINI_MODEL_ID
 
-    Behavior changes made to reduce Gemini API usage:
-    - Check local cache first per text (no API call)
-    - If USE_LOCAL_EMBEDDINGS=True and a local model is available, use it for all uncached texts
-    - Otherwise fall back to genai.embed_content for each uncached text (rate-limited)
+
+def _lookup_cached(texts: List[str]):
+    """First pass of embed_texts: fill from cache where possible.
+
+    Returns (embeddings with None placeholders, uncached indices, uncached texts, using_local).
+    The cache is keyed by model and dimension, so whatever comes back belongs to
+    the current embedding model.
     """
-    embeddings: List[List[float]] = []
+    using_local = get_local_encoder() is not None
+    model_name = current_embedding_model()
+    embed_dim = local_embedding_service.dim if using_local else GEMINI_EMBED_DIM
+
+    embeddings: List[Optional[np.ndarray]] = []
     uncached_texts = []
     uncached_indices = []
 
-    # Determine embedding dimension - use local if available, otherwise Gemini default (3072 for embedding-001)
-    using_local = USE_LOCAL_EMBEDDINGS and _local_encoder
-    embed_dim = _local_embed_dim if using_local else 3072
-    
-    # First pass: fill from cache where possible (only if dimension matches)
-    for i, t in enumerate(texts):
+    cached_embs = get_cached_embeddings(texts, model_name, embed_dim)
+    for i, (t, cached) in enumerate(zip(texts, cached_embs)):
         if not t.strip():
-            embeddings.append([0.0] * embed_dim)
+            embeddings.append(np.zeros(embed_dim, dtype=np.float32))
             continue
 
-        cached = get_cached_embedding(t)
-        # Only use cached embedding if dimension matches current embedding model
-        if cached and len(cached) == embed_dim:
+        if cached is not None:
             print(f"✓ Using cached embedding (no API call) for chunk {i}")
             embeddings.append(cached)
         else:
@@ -129,151 +209,705 @@ def embed_texts(texts: List[str], task_type: str = "retrieval_document") -> List
             uncached_texts.append(t)
             uncached_indices.append(i)
 
+    return embeddings, uncached_indices, uncached_texts, using_local
+
+
+def _fill_embeddings(embeddings, uncached_indices, uncached_texts, fetched, model_name: str):
+    """Put freshly computed embeddings in place and cache the successful ones."""
+    fetched_texts, fetched_embs = [], []
+    for i, t, emb in zip(uncached_indices, uncached_texts, fetched):
+        if emb is None:
+            continue
+        embeddings[i] = emb
+        fetched_texts.append(t)
+        fetched_embs.append(emb)
+    cache_embeddings(fetched_texts, fetched_embs, model_name)
+    return embeddings
+
+
+def embed_texts(texts: List[str], task_type: str = "retrieval_document") -> List[Optional[np.ndarray]]:
+    """Embed a list of texts. Uses cache, local encoder (if enabled) or Gemini otherwise.
+
+    Behavior changes made to reduce Gemini API usage:
+    - Check local cache first per text (no API call)
+    - If USE_LOCAL_EMBEDDINGS=True and a local model is available, use it for all uncached texts
+    - Otherwise fall back to the batched Gemini engine (rate-limited, retried)
+
+    Texts that could not be embedded are returned as None, never as zero vectors.
+    """
+    embeddings, uncached_indices, uncached_texts, using_local = _lookup_cached(texts)
+
     # If no uncached texts, return
     if not uncached_texts:
         return embeddings
 
+    fetched, model_name = _embed_uncached(uncached_texts, task_type, using_local)
+    return _fill_embeddings(embeddings, uncached_indices, uncached_texts, fetched, model_name)
+
+
+def _embed_uncached(texts: List[str], task_type: str, using_local: bool):
+    """Embed without any cache: (embeddings with None for failures, model name)"""
     # If local embeddings are enabled, do a single batch local encode
     if using_local:
         try:
-            local_embs = _local_embed_batch(uncached_texts)
-            for idx, emb in zip(uncached_indices, local_embs):
-                embeddings[idx] = emb
-                cache_embedding(texts[idx], emb)
-            return embeddings
+            return _local_embed_batch(texts), local_embedding_service.model_id
         except Exception as e:
             print(f"⚠️ Local embedding failed, falling back to Gemini: {e}")
-            # If local fails, switch to Gemini dimension (3072 for embedding-001)
-            embed_dim = 3072
 
-    # Otherwise fallback to genai per-text (rate-limited). We do one API call per uncached text.
-    for i, t in zip(uncached_indices, uncached_texts):
-        api_rate_limiter.sync_wait_if_needed()
+    # Otherwise fall back to Gemini: batched multi-content requests under a shared budget.
+    # Texts that still fail after retries stay None so callers can tell them apart.
+    result = gemini_embedding_engine.embed(texts, task_type=task_type)
+    print(f"✓ Fetched {len(texts) - len(result.failures)} embeddings from Gemini ({len(result.failures)} failed)")
+    return result.embeddings, GEMINI_MODEL_ID
+
+
+async def _embed_uncached_async(texts: List[str], task_type: str, using_local: bool):
+    if using_local:
         try:
-            resp = genai.embed_content(
-                model=EMBED_MODEL_NAME,
-                content=t,
-                task_type=task_type,
-            )
-            emb = resp["embedding"] if isinstance(resp, dict) else resp.embedding
-            embeddings[i] = emb
-            cache_embedding(texts[i], emb)
-            print(f"✓ Fetched embedding from Gemini for chunk {i}")
+            return await local_embedding_service.embed_async(texts), local_embedding_service.model_id
         except Exception as e:
-            print(f"✗ Failed to embed with Gemini for chunk {i}: {e}")
-            # Use Gemini dimension (3072 for embedding-001) for error case
-            embeddings[i] = [0.0] * 3072
+            print(f"⚠️ Local embedding failed, falling back to Gemini: {e}")
+
+    result = await gemini_embedding_engine.embed_async(texts, task_type=task_type)
+    return result.embeddings, GEMINI_MODEL_ID
+
+
+# Questions are embedded as task_type="retrieval_query", which the (task-agnostic) disk cache
+# cannot tell apart from documents, so they go through the in-memory query cache instead.
+
+def embed_query(question: str, task_type: str = "retrieval_query") -> np.ndarray:
+    model_name = current_embedding_model()
+    embedding = query_embeddings.get(model_name, task_type, question)
+    if embedding is None:
+        embedding, used_model = _embed_uncached([question], task_type, get_local_encoder() is not None)
+        embedding = embedding[0]
+        if embedding is None:
+            raise RuntimeError("Failed to embed the question.")
+        query_embeddings.put(used_model, task_type, question, embedding)
+    return embedding
+
+
+async def embed_query_async(question: str, task_type: str = "retrieval_query") -> np.ndarray:
+    await _ensure_local_encoder_async()
+    model_name = current_embedding_model()
+    embedding = query_embeddings.get(model_name, task_type, question)
+    if embedding is None:
+        fetched, used_model = await _embed_uncached_async([question], task_type, get_local_encoder() is not None)
+        embedding = fetched[0]
+        if embedding is None:
+            raise RuntimeError("Failed to embed the question.")
+        query_embeddings.put(used_model, task_type, question, embedding)
+    return embedding
+
+
+async def embed_queries_async(questions: Sequence[str], task_type: str = "retrieval_query") -> List[np.ndarray]:
+    """embed_query_async for several questions: cache hits first, the rest in one encode batch"""
+    await _ensure_local_encoder_async()
+    model_name = current_embedding_model()
+    embeddings = [query_embeddings.get(model_name, task_type, q) for q in questions]
+    missing = list(dict.fromkeys(q for q, emb in zip(questions, embeddings) if emb is None))
+    if missing:
+        fetched, used_model = await _embed_uncached_async(missing, task_type, get_local_encoder() is not None)
+        by_question = {}
+        for question, embedding in zip(missing, fetched):
+            if embedding is None:
+                raise RuntimeError("Failed to embed the question.")
+            query_embeddings.put(used_model, task_type, question, embedding)
+            by_question[question] = embedding
+        embeddings = [emb if emb is not None else by_question[q] for q, emb in zip(questions, embeddings)]
+    return embeddings
+
+
+async def precompute_query_embeddings(questions: Iterable[str], task_type: str = "retrieval_query"):
+    """Embed fixed questions in one batch and pin them in the query cache"""
+    await _ensure_local_encoder_async()
+    questions = list(dict.fromkeys(questions))
+    fetched, model_name = await _embed_uncached_async(questions, task_type, get_local_encoder() is not None)
+    pinned = 0
+    for question, embedding in zip(questions, fetched):
+        if embedding is not None:
+            query_embeddings.put(model_name, task_type, question, embedding, pinned=True)
+            pinned += 1
+    print(f"✓ Precomputed {pinned}/{len(questions)} task question embeddings ({model_name})")
+
+
+def embed_document_chunks(collection, texts: List[str]) -> List[Optional[np.ndarray]]:
+    """embed_texts for ingestion that also reuses embeddings of re-spaced stored chunks.
 
+    Exact cache hits come first; chunks that are new but whose text equals a
+    stored chunk's apart from whitespace (found by SimHash, confirmed on the
+    text) take that chunk's embedding from the vector store; only the rest
+    are embedded. A lightly edited chunk is always embedded again, since one
+    inserted word can reverse a clause's meaning.
+    """
+    if not NEAR_DUPLICATE_REUSE:
+        return embed_texts(texts, task_type="retrieval_document")
+
+    embeddings, uncached_indices, uncached_texts, _ = _lookup_cached(texts)
+    if not uncached_texts:
+        return embeddings
+
+    # Equal text after whitespace normalization has the same fingerprint
+    matches = get_document_index().find_near_duplicates(
+        [simhash(t) for t in uncached_texts], current_embedding_model(), max_distance=0
+    )
+    matched_ids = sorted({chunk_id for chunk_id in matches if chunk_id})
+    if matched_ids:
+        found = collection.get(ids=matched_ids, include=["documents", "embeddings"])
+        found_embeddings = found.get("embeddings") if found.get("embeddings") is not None else []
+        stored = {
+            chunk_id: (chunk_key(text or ""), emb)
+            for chunk_id, text, emb in zip(found.get("ids") or [], found.get("documents") or [], found_embeddings)
+        }
+        reused = 0
+        for i, chunk_id in zip(uncached_indices, matches):
+            if chunk_id in stored and stored[chunk_id][0] == chunk_key(texts[i]):
+                embeddings[i] = as_matrix(stored[chunk_id][1])
+                reused += 1
+        if reused:
+            print(f"♻ Reused {reused} embeddings from stored chunks with the same text")
+
+    remaining = [i for i in uncached_indices if embeddings[i] is None]
+    if remaining:
+        for i, emb in zip(remaining, embed_texts([texts[i] for i in remaining], task_type="retrieval_document")):
+            embeddings[i] = emb
     return embeddings
 
 
 # ------------- dedupe & ingest -------------
 
+def find_document_by_hash(doc_hash: str) -> Optional[str]:
+    """Return the document_id of a fully ingested document with this hash, if any."""
+    index = get_document_index()
+    document_id = index.lookup(doc_hash)
+    if document_id or index.synced:
+        return document_id
+
+    # The index is still being built from the vector store; ask the store directly
+    collection = get_vector_store()
+    try:
+        existing = collection.get(where={"doc_hash": doc_hash}, limit=1, include=["metadatas"])
+    except Exception:
+        # If filter fails, allow insertion (safer for demo)
+        return None
+    metadatas = existing.get("metadatas") or []
+    if not metadatas:
+        return None
+    document_id = metadatas[0].get("document_id")
+    if document_id:
+        index.claim(doc_hash, document_id)
+    return document_id
+
+
+def sync_document_index(force: bool = False):
+    """Fill the local document index from the vector store (once, unless forced)."""
+    index = get_document_index()
+    if force or not index.synced:
+        index.rebuild(get_vector_store(), current_embedding_model(), fingerprints=NEAR_DUPLICATE_REUSE)
+
+
+def sync_lexical_index(force: bool = False):
+    """Add documents stored before hybrid retrieval was enabled to the BM25 index (once, unless forced)"""
+    if not HYBRID_RETRIEVAL:
+        return
+    lexical = get_lexical_index()
+    if force or not lexical.synced:
+        lexical.rebuild(get_vector_store())
+
+
 def ensure_not_duplicate(doc_hash: str) -> bool:
     """
     Returns True if we can insert (no existing doc with this hash).
     Returns False if duplicate exists.
     """
-    client, collection = get_chroma_client()
+    return find_document_by_hash(doc_hash) is None
+
+
+def _position_metadata(chunk: LegalChunk) -> dict:
+    metadata = {
+        "char_start": chunk.char_start,
+        "char_end": chunk.char_end,
+        "page_start": chunk.page_start,
+        "page_end": chunk.page_end,
+    }
+    if chunk.section:
+        metadata["section"] = chunk.section
+    return metadata
+
+
+def _duplicate_response(doc_id: str) -> dict:
+    return {
+        "document_id": doc_id,
+        "is_new": False,
+        "message": "Duplicate document detected; not ingested again.",
+    }
+
+
+def chunk_id(document_id: str, chunk_index: int) -> str:
+    return f"{document_id}_chunk_{chunk_index}"
+
+
+def document_metadata(
+    document_id: str,
+    uploader_type: str,
+    uploader_id: Optional[str] = None,
+    extra_metadata: Optional[dict] = None,
+) -> dict:
+    """Metadata shared by every chunk of a document"""
+    metadata = {
+        "document_id": document_id,
+        "uploader_type": uploader_type,
+        "embedding_model": current_embedding_model(),
+    }
+    if uploader_id:
+        metadata["uploader_id"] = uploader_id
+    if extra_metadata:
+        metadata.update(extra_metadata)
+    return metadata
+
+
+def iter_document_chunks(pages: Iterable[str], base_meta: dict) -> Iterator[tuple]:
+    """(chunk_index, text, metadata) for every chunk of a document, with the configured chunker"""
+    if CHUNKER == "window":
+        for i, text in enumerate(iter_text_chunks(pages)):
+            yield i, text, dict(base_meta, chunk_index=i)
+        return
+    for i, chunk in enumerate(iter_legal_chunks(pages)):
+        yield i, chunk.text, dict(base_meta, chunk_index=i, **_position_metadata(chunk))
+
+
+def write_chunks(collection, texts: List[str], metadatas: List[dict], embeddings):
+    """Upsert chunks (of one or several documents) and add them to the local indexes.
+
+    Chunk ids come from each chunk's document_id and chunk_index, so writing
+    the same chunks again overwrites them.
+    """
+    ids = [chunk_id(m["document_id"], m["chunk_index"]) for m in metadatas]
+    collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=as_matrix(embeddings))
+    if NEAR_DUPLICATE_REUSE:
+        get_document_index().add_fingerprints(
+            (i, m["document_id"], m["embedding_model"], simhash(text)) for i, m, text in zip(ids, metadatas, texts)
+        )
+    if HYBRID_RETRIEVAL:
+        by_document: Dict[str, tuple] = {}
+        for m, text in zip(metadatas, texts):
+            indices, doc_texts = by_document.setdefault(m["document_id"], ([], []))
+            indices.append(m["chunk_index"])
+            doc_texts.append(text)
+        lexical = get_lexical_index()
+        for doc_id, (indices, doc_texts) in by_document.items():
+            lexical.add_chunks(doc_id, indices, doc_texts)
+
+
+def complete_document(collection, doc_id: str, doc_hash: str, total: int) -> Optional[str]:
+    """Claim `doc_hash` for a fully stored document and stamp it on its chunks.
+
+    Returns the document_id that already owns the hash if the document turns
+    out to be a duplicate; its chunks are then removed again.
+    """
+    # Claiming the hash is atomic, so of two concurrent uploads of one file only one is kept
+    index = get_document_index()
+    owner = find_document_by_hash(doc_hash) or index.claim(doc_hash, doc_id)
+    if owner != doc_id:
+        collection.delete(where={"document_id": doc_id})
+        index.remove_document(doc_id)
+        if HYBRID_RETRIEVAL:
+            get_lexical_index().remove_document(doc_id)
+        hot_documents.invalidate(doc_id)
+        return owner
+
+    # Mark the document complete
     try:
-        existing = collection.get(where={"doc_hash": doc_hash}, limit=1)
-        ids = existing.get("ids") or []
-        return len(ids) == 0
+        for start in range(0, total, INGEST_WRITE_BATCH):
+            indices = range(start, min(start + INGEST_WRITE_BATCH, total))
+            collection.update(
+                ids=[chunk_id(doc_id, i) for i in indices],
+                # Metadata updates merge, so chunk positions are kept
+                metadatas=[{"doc_hash": doc_hash} for _ in indices],
+            )
     except Exception:
-        # If filter fails, allow insertion (safer for demo)
-        return True
+        index.release(doc_hash, doc_id)
+        raise
+    hot_documents.invalidate(doc_id)
+    return None
 
 
 def ingest_document(
-    full_text: str,
-    uploader_type: str,
+    full_text: Optional[str] = None,
+    uploader_type: str = "user",
     uploader_id: Optional[str] = None,
     extra_metadata: Optional[dict] = None,
+    pages: Optional[Iterable[str]] = None,
+    document_id: Optional[str] = None,
+    resume_from: int = 0,
+    progress: Optional[IngestProgress] = None,
+    previous_document_id: Optional[str] = None,
 ) -> dict:
     """
-    Chunk + embed + store in Chroma Cloud.
+    Chunk + embed + store in the vector store as a streaming pipeline (see ingest_pipeline).
     Uses doc_hash metadata so duplicates are not re-ingested.
-    """
-    client, collection = get_chroma_client()
-    if not full_text or not full_text.strip():
-        raise ValueError("Document text is empty")
 
-    doc_hash = compute_doc_hash(full_text)
-    is_new = ensure_not_duplicate(doc_hash)
+    Pass either `full_text` or an iterable of page texts. With full text the
+    duplicate check happens up front; with pages, chunks are embedded and stored
+    while later pages are still being extracted, and the hash is only known at
+    the end, so a late-detected duplicate is rolled back.
 
-    doc_id = str(uuid.uuid4())
+    doc_hash is stamped on the chunks only once every chunk is stored, so a
+    document that failed part-way is never mistaken for a complete one. Retrying
+    with the same `document_id` and `resume_from=PipelineError.stored` picks up
+    where it stopped.
 
-    if not is_new:
-        # Return existing document_id if known
-        try:
-            existing = collection.get(where={"doc_hash": doc_hash}, limit=1)
-            if existing.get("metadatas"):
-                doc_id = existing["metadatas"][0].get("document_id", doc_id)
-        except Exception:
-            pass
-
-        return {
-            "document_id": doc_id,
-            "is_new": False,
-            "message": "Duplicate document detected; not ingested again.",
-        }
+    With `previous_document_id` the upload is stored as the next version of
+    that document: chunks whose text is unchanged reuse the previous version's
+    embeddings, only changed chunks are embedded, and the chunk-level diff is
+    recorded in the version history.
+    """
+    collection = get_vector_store()
+    progress = progress or IngestProgress()
+
+    previous = None
+    if previous_document_id:
+        if get_doc_hash(previous_document_id) is None:
+            raise HTTPException(status_code=404, detail="previous_document_id not found.")
+        previous = PreviousVersion.load(collection, previous_document_id, current_embedding_model())
+        extra_metadata = {**(extra_metadata or {}), "previous_document_id": previous_document_id}
+
+    if pages is None:
+        if not full_text or not full_text.strip():
+            raise ValueError("Document text is empty")
+        existing_id = find_document_by_hash(compute_doc_hash(full_text))
+        if existing_id and existing_id != document_id:
+            return _duplicate_response(existing_id)
+        pages = [full_text]
+
+    doc_id = document_id or str(uuid.uuid4())
+    hasher = hashlib.sha256()
+
+    if HYBRID_RETRIEVAL and document_id:
+        # A retry re-indexes the batches it writes again
+        get_lexical_index().remove_document(doc_id, from_chunk=resume_from)
+    base_meta = document_metadata(doc_id, uploader_type, uploader_id, extra_metadata)
+
+    def counted_pages():
+        for page in pages:
+            progress.add(pages_extracted=1)
+            yield page
+
+    new_keys, new_sections = [], []
+
+    def chunks():
+        for chunk in iter_document_chunks(hash_pages(counted_pages(), hasher), base_meta):
+            if previous is not None:
+                new_keys.append(chunk_key(chunk[1]))
+                new_sections.append(chunk[2].get("section"))
+            yield chunk
+
+    def embed(texts):
+        if previous is None:
+            return embed_document_chunks(collection, texts)
+        # Unchanged chunks take the previous version's embeddings
+        embeddings = previous.embeddings_for(texts)
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if missing:
+            # Changed chunks are always embedded: their fingerprints are close to the previous version's
+            changed = embed_texts([texts[i] for i in missing], task_type="retrieval_document")
+            for i, emb in zip(missing, changed):
+                embeddings[i] = emb
+        return embeddings
 
-    chunks = chunk_text(full_text)
-    embeddings = embed_texts(chunks, task_type="retrieval_document")
+    try:
+        total = run_pipeline(
+            chunks(),
+            embed_fn=embed,
+            write_fn=lambda indices, texts, metadatas, embeddings: write_chunks(collection, texts, metadatas, embeddings),
+            progress=progress,
+            resume_from=resume_from,
+        )
+    except PipelineError as e:
+        # Upload/extraction problems are the caller's error, not a partial ingest
+        if isinstance(e.__cause__, (HTTPException, ValueError)):
+            raise e.__cause__
+        raise
+
+    if total == 0:
+        raise ValueError("Document text is empty")
 
-    metadatas = []
-    for i in range(len(chunks)):
-        meta = {
-            "document_id": doc_id,
-            "doc_hash": doc_hash,
-            "chunk_index": i,
-            "uploader_type": uploader_type,
-        }
-        if uploader_id:
-            meta["uploader_id"] = uploader_id
-        if extra_metadata:
-            meta.update(extra_metadata)
-        metadatas.append(meta)
-
-    ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
-
-    collection.add(
-        ids=ids,
-        documents=chunks,
-        metadatas=metadatas,
-        embeddings=embeddings,
-    )
+    owner = complete_document(collection, doc_id, hasher.hexdigest(), total)
+    if owner is not None:
+        return _duplicate_response(owner)
 
-    return {
+    result = {
         "document_id": doc_id,
         "is_new": True,
         "message": "Document ingested successfully.",
     }
+    if previous is not None:
+        changes = change_summary(diff_chunks(previous.keys, new_keys), new_sections, previous.reused)
+        version = get_document_index().add_version(doc_id, previous_document_id, changes)
+        print(
+            f"♻ Stored version {version} of {previous_document_id}: {changes['chunks_added']} chunks changed, "
+            f"{changes['chunks_removed']} removed, {previous.reused} embeddings reused"
+        )
+        result.update(version=version, previous_document_id=previous_document_id, changes=changes)
+    return result
+
+
+# document_id -> doc_hash. Documents are immutable once ingested, so entries never go stale.
+_doc_hash_by_id: Dict[str, str] = {}
+
+
+def get_doc_hash(document_id: str) -> Optional[str]:
+    """Look up the content hash of an ingested document (None if unknown)"""
+    if document_id in _doc_hash_by_id:
+        return _doc_hash_by_id[document_id]
+
+    collection = get_vector_store()
+    existing = collection.get(where={"document_id": document_id}, limit=1, include=["metadatas"])
+    metadatas = existing.get("metadatas") or []
+    if not metadatas or not metadatas[0].get("doc_hash"):
+        return None
+
+    _doc_hash_by_id[document_id] = metadatas[0]["doc_hash"]
+    return _doc_hash_by_id[document_id]
+
+
+def get_document_chunks(document_id: str) -> List[str]:
+    """Every chunk text of a document, in document order"""
+    if HOT_DOC_CACHE_ENABLED:
+        doc = hot_documents.get(document_id)
+        if doc is not None:
+            return list(doc.texts)
+
+    collection = get_vector_store()
+    found = collection.get(where={"document_id": document_id}, include=["documents", "metadatas"])
+    texts = found.get("documents") or []
+    metadatas = found.get("metadatas") or [{} for _ in texts]
+    order = sorted(range(len(texts)), key=lambda i: (metadatas[i] or {}).get("chunk_index", i))
+    return [texts[i] for i in order]
 
 
 # ------------- retrieval & prompts -------------
 
-def retrieve_context(document_ids: List[str], question: str, k: int = 12) -> List[str]:
+class RetrievedContext(NamedTuple):
+    """Top-k chunks for a question, with what the relevance gate and packing need"""
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+    embeddings: Any  # (k, dim) array-like, one row per chunk
+    query_embedding: List[float]
+
+
+def retrieve_context(document_ids: List[str], question: str, k: int = RETRIEVAL_TOP_K) -> List[str]:
     """
     Retrieve top-k chunks from given document_ids.
     """
-    client, collection = get_chroma_client()
+    collection = get_vector_store()
     if not document_ids:
         return []
 
     # Embed the question (uses local encoder if enabled)
-    query_embedding = embed_texts([question], task_type="retrieval_query")[0]
+    query_embedding = embed_query(question)
+
+    return _query_chunks(collection, document_ids, query_embedding, k, question).texts
+
+
+def _query_chunks(
+    collection,
+    document_ids: List[str],
+    query_embedding: List[float],
+    k: int,
+    query_text: Optional[str] = None,
+) -> RetrievedContext:
+    """Top-k chunks by vector similarity, fused with BM25 over `query_text` when hybrid retrieval is on"""
+    return _query_chunks_multi(collection, document_ids, [query_embedding], k, [query_text])[0]
+
+
+def _query_chunks_multi(
+    collection,
+    document_ids: List[str],
+    query_embeddings: Sequence[Sequence[float]],
+    k: int,
+    query_texts: Optional[Sequence[Optional[str]]] = None,
+) -> List[RetrievedContext]:
+    """_query_chunks for several queries over the same documents.
+
+    The dense half is one vector store query (or one hot-document load) for
+    all of them, and chunks that only BM25 found are fetched once even when
+    several queries picked them.
+    """
+    query_texts = list(query_texts or [None] * len(query_embeddings))
+    hybrid = HYBRID_RETRIEVAL and any(query_texts)
+    dense_k = max(k, RETRIEVAL_CANDIDATES) if hybrid else k
+    dense = _dense_chunks_multi(collection, document_ids, query_embeddings, dense_k)
+    if not hybrid:
+        return dense
+
+    lexical = []
+    for query_text in query_texts:
+        hits = []
+        if query_text:
+            try:
+                hits = get_lexical_index().search(document_ids, query_text, max(k, RETRIEVAL_CANDIDATES))
+            except Exception as e:
+                print(f"✗ Lexical search failed, using vector results only: {e}")
+        lexical.append(hits)
+
+    found: Dict[Any, tuple] = {}
+    fused_keys: List[Optional[list]] = []
+    for ctx, hits in zip(dense, lexical):
+        if not hits:
+            fused_keys.append(None)
+            continue
+        dense_keys = [(m.get("document_id"), m.get("chunk_index")) for m in ctx.metadatas]
+        for j, key in enumerate(dense_keys):
+            found.setdefault(key, (ctx.texts[j], ctx.metadatas[j], ctx.embeddings[j]))
+        fused_keys.append(reciprocal_rank_fusion([dense_keys, [(d, i) for d, i, _ in hits]], RRF_K)[:k])
+    missing = list(dict.fromkeys(key for keys in fused_keys if keys for key in keys if key not in found))
+    if missing:
+        found.update(_fetch_chunks(collection, missing))
+
+    results = []
+    for ctx, keys in zip(dense, fused_keys):
+        if keys is None:
+            results.append(RetrievedContext(ctx.texts[:k], ctx.metadatas[:k], ctx.embeddings[:k], ctx.query_embedding))
+            continue
+        picked = [found[key] for key in keys if key in found]
+        embeddings = as_matrix([row[2] for row in picked]) if picked else []
+        results.append(
+            RetrievedContext([row[0] for row in picked], [row[1] for row in picked], embeddings, ctx.query_embedding)
+        )
+    return results
+
+
+def _fetch_chunks(collection, keys) -> Dict[Any, tuple]:
+    """(text, metadata, embedding) of chunks by (document_id, chunk_index), from hot documents or the store"""
+    found = {}
+    remaining = []
+    for document_id, chunk_index in keys:
+        doc = hot_documents.get(document_id) if HOT_DOC_CACHE_ENABLED else None
+        position = doc.positions.get(chunk_index) if doc is not None else None
+        if position is None:
+            remaining.append((document_id, chunk_index))
+        else:
+            found[(document_id, chunk_index)] = (doc.texts[position], doc.metadatas[position], doc.vectors(position))
+    if remaining:
+        result = collection.get(
+            ids=[chunk_id(document_id, chunk_index) for document_id, chunk_index in remaining],
+            include=["documents", "metadatas", "embeddings"],
+        )
+        embeddings = result.get("embeddings")
+        if embeddings is None:
+            embeddings = []
+        for text, metadata, embedding in zip(result.get("documents") or [], result.get("metadatas") or [], embeddings):
+            found[(metadata.get("document_id"), metadata.get("chunk_index"))] = (text, metadata, embedding)
+    return found
+
+
+def _dense_chunks(collection, document_ids: List[str], query_embedding: List[float], k: int) -> RetrievedContext:
+    return _dense_chunks_multi(collection, document_ids, [query_embedding], k)[0]
+
+
+def _dense_chunks_multi(
+    collection, document_ids: List[str], query_embeddings: Sequence[Sequence[float]], k: int
+) -> List[RetrievedContext]:
+    if HOT_DOC_CACHE_ENABLED:
+        docs = [hot_documents.get_or_load(collection, document_id) for document_id in document_ids]
+        if all(doc is not None for doc in docs):
+            return [RetrievedContext(*top_k_chunks(docs, q, k), q) for q in query_embeddings]
 
     where_filter = {"document_id": {"$in": document_ids}}
 
     result = collection.query(
-        query_embeddings=[query_embedding],
+        query_embeddings=list(query_embeddings),
         n_results=k,
         where=where_filter,
+        include=["documents", "metadatas", "embeddings"],
     )
 
-    docs = result.get("documents", [[]])[0]
-    return docs
+    # One list per query embedding
+    documents = result.get("documents") or []
+    metadatas = result.get("metadatas") or []
+    embeddings = result.get("embeddings")
+    contexts = []
+    for n, q in enumerate(query_embeddings):
+        docs = documents[n] if n < len(documents) else []
+        metas = (metadatas[n] if n < len(metadatas) else None) or [{} for _ in docs]
+        embs = embeddings[n] if embeddings is not None and n < len(embeddings) else []
+        contexts.append(RetrievedContext(docs, metas, embs, q))
+    return contexts
+
+
+# Blocking vector store calls from async handlers run here instead of on the event loop
+_chroma_executor = ThreadPoolExecutor(max_workers=CHROMA_MAX_CONCURRENCY, thread_name_prefix="chroma")
+
+
+async def run_chroma(fn, *args):
+    """Run a blocking vector store call on the dedicated pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_chroma_executor, fn, *args)
+
+
+async def query_chunks_async(
+    document_ids: List[str],
+    query_embedding: List[float],
+    k: int = RETRIEVAL_TOP_K,
+    query_text: Optional[str] = None,
+) -> RetrievedContext:
+    """Top-k chunks for an already embedded query (`query_text` enables the BM25 half of hybrid retrieval)"""
+    if not document_ids:
+        return RetrievedContext([], [], [], query_embedding)
+    collection = await run_chroma(get_vector_store)
+    return await run_chroma(_query_chunks, collection, document_ids, query_embedding, k, query_text)
+
+
+async def query_chunks_multi_async(
+    document_ids: List[str],
+    query_embeddings: Sequence[Sequence[float]],
+    k: int = RETRIEVAL_TOP_K,
+    query_texts: Optional[Sequence[Optional[str]]] = None,
+) -> List[RetrievedContext]:
+    """query_chunks_async for several already embedded queries, in one vector store round trip"""
+    if not document_ids:
+        return [RetrievedContext([], [], [], q) for q in query_embeddings]
+    collection = await run_chroma(get_vector_store)
+    return await run_chroma(_query_chunks_multi, collection, document_ids, query_embeddings, k, query_texts)
+
+
+async def retrieve_chunks_async(document_ids: List[str], question: str, k: int = RETRIEVAL_TOP_K) -> RetrievedContext:
+    """
+    Async retrieval that keeps the query embedding and chunk embeddings/metadata.
+    Neither the query embedding nor the vector store query blocks the event loop.
+    """
+    if not document_ids:
+        return RetrievedContext([], [], [], [])
+
+    query_embedding = await embed_query_async(question)
+    return await query_chunks_async(document_ids, query_embedding, k, question)
+
+
+async def get_doc_hash_async(document_id: str) -> Optional[str]:
+    if document_id in _doc_hash_by_id:
+        return _doc_hash_by_id[document_id]
+    return await run_chroma(get_doc_hash, document_id)
+
+
+# Bump whenever build_legal_prompt changes so cached analyses are not reused
+PROMPT_TEMPLATE_VERSION = f"2:{CONTEXT_TOKEN_BUDGET if CONTEXT_PACKING else 'unpacked'}"
+
+
+def pack_prompt_context(
+    context_chunks: List[str],
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+) -> List[str]:
+    """Dedupe, merge and trim retrieved chunks to the token budget (see context_packing)"""
+    packed = pack_context(context_chunks, metadatas, token_budget)
+    packing_stats.record(packed)
+    print(
+        f"✓ Context packed: {packed.chunks_in} chunks -> {len(packed.sections)} sections "
+        f"({packed.duplicates} duplicates), {packed.tokens_in} -> {packed.tokens_out} tokens "
+        f"(saved {packed.tokens_saved})"
+    )
+    return packed.sections
 
 
 def build_legal_prompt(
@@ -281,8 +915,18 @@ def build_legal_prompt(
     question: str,
     context_chunks: List[str],
     output_language: str = "English",
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+    history: Optional[str] = None,
 ) -> str:
+    """
+    Pass the chunks' metadatas when available: packing uses document_id and
+    chunk_index to put chunks in document order and merge consecutive ones.
+    `history` is the earlier conversation, for chat follow-ups.
+    """
+    if CONTEXT_PACKING:
+        context_chunks = pack_prompt_context(context_chunks, metadatas)
     context_text = "\n\n---\n\n".join(context_chunks)
+    conversation = f"\nConversation so far:\n{history}\n" if history else ""
 
     system = f"""
 You are LegalEase, an AI-powered legal document assistant.
@@ -296,7 +940,7 @@ If something is missing from the context, say you are unsure instead of inventin
 
 Context from documents and legal knowledge:
 {context_text}
-
+{conversation}
 User request:
 {question}
 
@@ -307,12 +951,59 @@ Answer in {output_language}:
 
 def call_llm(prompt: str) -> str:
     """
-    Call Groq LLM to generate response. No rate limiting applied.
+    Call Groq LLM to generate response, within the 'groq_chat' budget.
     """
-    response = groq_client.chat.completions.create(
+    groq_chat_budget.acquire()
+    response = get_groq_client().chat.completions.create(
         model=GROQ_MODEL_NAME,
         messages=[
             {"role": "user", "content": prompt}
         ],
     )
     return response.choices[0].message.content
+
+
+async def call_llm_async(prompt: str) -> str:
+    """
+    Async version of call_llm using the async Groq client.
+    """
+    await groq_chat_budget.acquire_async()
+    response = await get_async_groq_client().chat.completions.create(
+        model=GROQ_MODEL_NAME,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+    )
+    return response.choices[0].message.content
+
+
+async def stream_llm_async(prompt: str) -> AsyncIterator[str]:
+    """
+    Start a streaming Groq completion and return an async iterator of text deltas.
+
+    The budget is taken and the request opened before this returns, so rate-limit
+    and connection errors surface before any response bytes are sent. Closing the
+    iterator early (e.g. the client disconnected) closes the upstream stream, which
+    stops token generation.
+    """
+    await groq_chat_budget.acquire_async()
+    stream = await get_async_groq_client().chat.completions.create(
+        model=GROQ_MODEL_NAME,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        stream=True,
+    )
+    return _iter_llm_deltas(stream)
+
+
+async def _iter_llm_deltas(stream) -> AsyncIterator[str]:
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    finally:
+        # Shielded so the connection is released even when we are being cancelled
+        with anyio.CancelScope(shield=True):
+            await stream.close()
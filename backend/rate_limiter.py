@@ -1,31 +1,161 @@
 import time
+import threading
 import asyncio
-from typing import Callable, Any
-from functools import wraps
+from typing import Dict, Optional
 
-class RateLimiter:
-    """Rate limiter to prevent exceeding API quotas"""
-    
-    def __init__(self, calls_per_minute: int = 1):
-        """
-        calls_per_minute: How many API calls allowed per minute
-        For Gemini free tier: 1 request per minute is SAFE (60 second wait)
+from config import (
+    GEMINI_EMBED_CALLS_PER_MINUTE,
+    GEMINI_EMBED_BURST,
+    GROQ_CALLS_PER_MINUTE,
+    GROQ_BURST,
+    GROQ_MAX_WAIT_SECONDS,
+)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to wait longer than the budget allows"""
+
+    def __init__(self, budget: str, retry_after: float):
+        super().__init__(f"Rate limit for '{budget}' exceeded; retry in {retry_after:.1f}s")
+        self.budget = budget
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token-bucket rate limiter to prevent exceeding API quotas.
+
+    Allows bursts of up to `burst` calls and refills at `calls_per_minute`.
+    Callers reserve tokens under a lock and then wait outside it, so concurrent
+    threads (or coroutines) are spaced out correctly without serializing on
+    the sleep itself.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        calls_per_minute: float,
+        burst: int = 1,
+        max_wait: Optional[float] = None,
+    ):
+        if not calls_per_minute > 0:
+            raise ValueError(f"Rate limit '{name}' needs calls_per_minute > 0, got {calls_per_minute}")
+        self.name = name
+        self.rate = calls_per_minute / 60.0  # tokens per second
+        self.capacity = float(max(1, burst))
+        self.max_wait = max_wait  # None = wait as long as needed
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        # metrics
+        self.calls = 0
+        self.waited_calls = 0
+        self.rejected_calls = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    def _reserve(self, tokens: float, max_wait: Optional[float]) -> float:
+        """Take tokens (possibly going into debt) and return how long the caller must wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            wait_time = max(0.0, (tokens - self._tokens) / self.rate)
+            if max_wait is not None and wait_time > max_wait:
+                self.rejected_calls += 1
+                raise RateLimitExceeded(self.name, wait_time)
+
+            self._tokens -= tokens
+            self.calls += 1
+            if wait_time > 0:
+                self.waited_calls += 1
+                self.total_wait += wait_time
+                self.max_observed_wait = max(self.max_observed_wait, wait_time)
+            return wait_time
+
+    def _refund(self, tokens: float):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def acquire(self, tokens: float = 1.0, max_wait: Optional[float] = None) -> float:
+        """Block until `tokens` are available. Returns the time spent waiting.
+
+        Raises RateLimitExceeded instead of waiting longer than `max_wait`
+        (defaults to the bucket's own max_wait).
         """
-        self.calls_per_minute = calls_per_minute
-        self.min_interval = 60.0 / calls_per_minute  # seconds between calls
-        self.last_call_time = 0
-    
-    def sync_wait_if_needed(self):
-        """Wait BEFORE making the next API call"""
-        current_time = time.time()
-        time_since_last_call = current_time - self.last_call_time
-        
-        if time_since_last_call < self.min_interval:
-            wait_time = self.min_interval - time_since_last_call
-            print(f"⏳ Rate limit: waiting {wait_time:.1f}s before next API call...")
+        wait_time = self._reserve(tokens, self.max_wait if max_wait is None else max_wait)
+        if wait_time > 0:
+            print(f"⏳ Rate limit '{self.name}': waiting {wait_time:.1f}s before next API call...")
             time.sleep(wait_time)
-        
-        self.last_call_time = time.time()
+        return wait_time
+
+    async def acquire_async(self, tokens: float = 1.0, max_wait: Optional[float] = None) -> float:
+        """Async version of acquire(): waits with asyncio.sleep, never blocking the event loop"""
+        wait_time = self._reserve(tokens, self.max_wait if max_wait is None else max_wait)
+        if wait_time > 0:
+            print(f"⏳ Rate limit '{self.name}': waiting {wait_time:.1f}s before next API call...")
+            try:
+                await asyncio.sleep(wait_time)
+            except asyncio.CancelledError:
+                # The call never happened; give the tokens back
+                self._refund(tokens)
+                raise
+        return wait_time
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "calls_per_minute": self.rate * 60.0,
+                "burst": self.capacity,
+                "calls": self.calls,
+                "waited_calls": self.waited_calls,
+                "rejected_calls": self.rejected_calls,
+                "total_wait_seconds": round(self.total_wait, 3),
+                "max_wait_seconds": round(self.max_observed_wait, 3),
+                "avg_wait_seconds": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+            }
+
+
+# ---------- named budgets ----------
+
+_budgets: Dict[str, TokenBucket] = {}
+_budgets_lock = threading.Lock()
+
+
+def register_budget(
+    name: str,
+    calls_per_minute: float,
+    burst: int = 1,
+    max_wait: Optional[float] = None,
+) -> TokenBucket:
+    """Create (or replace) a named budget shared by everything calling that provider"""
+    bucket = TokenBucket(name, calls_per_minute, burst=burst, max_wait=max_wait)
+    with _budgets_lock:
+        _budgets[name] = bucket
+    return bucket
+
+
+def get_budget(name: str) -> TokenBucket:
+    with _budgets_lock:
+        return _budgets[name]
+
+
+def budget_metrics() -> Dict[str, Dict[str, float]]:
+    with _budgets_lock:
+        budgets = list(_budgets.values())
+    return {b.name: b.metrics() for b in budgets}
+
 
-# Global rate limiter instance - 1 call per minute for free tier
-api_rate_limiter = RateLimiter(calls_per_minute=1)
+# Global budgets, one per provider
+gemini_embed_budget = register_budget(
+    "gemini_embed",
+    calls_per_minute=GEMINI_EMBED_CALLS_PER_MINUTE,
+    burst=GEMINI_EMBED_BURST,
+)
+groq_chat_budget = register_budget(
+    "groq_chat",
+    calls_per_minute=GROQ_CALLS_PER_MINUTE,
+    burst=GROQ_BURST,
+    max_wait=GROQ_MAX_WAIT_SECONDS,
+)
@@ -0,0 +1,78 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import EMBED_MODEL_NAME, RELEVANCE_ACCEPT_THRESHOLD, RELEVANCE_REJECT_THRESHOLD
+from vector_ops import cosine_similarities
+
+RELEVANT = "relevant"
+IRRELEVANT = "irrelevant"
+BORDERLINE = "borderline"
+
+# (reject below, accept at or above), per embedding model. Cosine scores are not comparable
+# across models: Gemini scores sit much higher than MiniLM for the same pair of texts.
+DEFAULT_THRESHOLDS = {
+    "all-MiniLM-L6-v2": (0.15, 0.35),
+    EMBED_MODEL_NAME: (0.55, 0.68),
+}
+FALLBACK_THRESHOLDS = (0.2, 0.4)
+
+
+def thresholds_for(model_name: str) -> Tuple[float, float]:
+    # "all-MiniLM-L6-v2@int8" scores like the full-precision model
+    reject, accept = DEFAULT_THRESHOLDS.get(model_name.split("@")[0], FALLBACK_THRESHOLDS)
+    if RELEVANCE_REJECT_THRESHOLD:
+        reject = float(RELEVANCE_REJECT_THRESHOLD)
+    if RELEVANCE_ACCEPT_THRESHOLD:
+        accept = float(RELEVANCE_ACCEPT_THRESHOLD)
+    return reject, accept
+
+
+def relevance_score(query_embedding: Sequence[float], chunk_embeddings, top_n: int = 3) -> Optional[float]:
+    """Mean cosine similarity between the question and its `top_n` closest chunks.
+
+    Averaging a few chunks is less noisy than the single best match, which a
+    short off-topic question can hit by accident.
+    """
+    if query_embedding is None or chunk_embeddings is None or len(chunk_embeddings) == 0:
+        return None
+    sims = cosine_similarities(query_embedding, chunk_embeddings)
+    top = np.sort(sims)[::-1][:top_n]
+    return float(top.mean())
+
+
+def classify_relevance(score: Optional[float], model_name: str) -> str:
+    if score is None:
+        return BORDERLINE
+    reject, accept = thresholds_for(model_name)
+    if score >= accept:
+        return RELEVANT
+    if score < reject:
+        return IRRELEVANT
+    return BORDERLINE
+
+
+def gate_metrics(scores: Sequence[float], labels: Sequence[bool], reject: float, accept: float) -> Dict[str, Optional[float]]:
+    """How the gate does on labeled questions (True = relevant) at the given thresholds.
+
+    "accept" is answering without an LLM check and "reject" refusing without
+    one; borderline questions go to the LLM fallback. Precision is None when
+    nothing was accepted (rejected).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    relevant = np.asarray(labels, dtype=bool)
+    accepted = scores >= accept
+    rejected = scores < reject
+
+    def ratio(hits, total) -> Optional[float]:
+        return float(hits) / float(total) if total else None
+
+    return {
+        "accept_precision": ratio((accepted & relevant).sum(), accepted.sum()),
+        "accept_recall": ratio((accepted & relevant).sum(), relevant.sum()),
+        "reject_precision": ratio((rejected & ~relevant).sum(), rejected.sum()),
+        "reject_recall": ratio((rejected & ~relevant).sum(), (~relevant).sum()),
+        "borderline_rate": ratio((~accepted & ~rejected).sum(), len(scores)),
+        "relevant_refused": int((rejected & relevant).sum()),
+        "irrelevant_answered": int((accepted & ~relevant).sum()),
+    }
@@ -0,0 +1,91 @@
+"""Precision and recall of the /chat relevance gate on a labeled question set.
+
+    python relevance_benchmark.py [--questions relevance_questions.json] [--reject 0.5 --accept 0.7]
+
+Embeds every document's chunks and questions with the configured model
+(USE_LOCAL_EMBEDDINGS or Gemini, as the server does), scores each question
+against its document the way /chat does, and reports at the model's
+thresholds (relevance.thresholds_for, so RELEVANCE_*_THRESHOLD overrides
+apply, or --reject/--accept):
+
+  accept      precision and recall of answering without an LLM check
+  reject      precision and recall of refusing without an LLM check
+  borderline  share of questions that still cost an LLM call
+
+plus the score range of each label, for recalibrating the thresholds.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import List
+
+import numpy as np
+
+from rag_utils import current_embedding_model, embed_queries_async, embed_texts
+from relevance import gate_metrics, relevance_score, thresholds_for
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "relevance_questions.json")
+
+
+def load_question_set(path: str = DEFAULT_QUESTIONS) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["documents"]
+
+
+def _format(value) -> str:
+    return "n/a" if value is None else f"{value:.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--reject", type=float, help="override the model's reject threshold")
+    parser.add_argument("--accept", type=float, help="override the model's accept threshold")
+    args = parser.parse_args()
+
+    documents = load_question_set(args.questions)
+    scores, labels, score_seconds = [], [], 0.0
+    for document in documents:
+        chunk_embeddings = embed_texts(document["chunks"])
+        if any(emb is None for emb in chunk_embeddings):
+            raise SystemExit(f"Failed to embed the chunks of {document['name']!r}")
+        chunk_matrix = np.stack(chunk_embeddings)
+        questions = [q["question"] for q in document["questions"]]
+        question_embeddings = asyncio.run(embed_queries_async(questions))
+
+        started = time.perf_counter()
+        for embedding in question_embeddings:
+            scores.append(relevance_score(embedding, chunk_matrix))
+        score_seconds += time.perf_counter() - started
+        labels.extend(q["relevant"] for q in document["questions"])
+
+    model = current_embedding_model()
+    reject, accept = thresholds_for(model)
+    reject = reject if args.reject is None else args.reject
+    accept = accept if args.accept is None else args.accept
+    metrics = gate_metrics(scores, labels, reject, accept)
+
+    print(f"Model {model}: {len(scores)} questions ({sum(labels)} relevant), reject < {reject}, accept >= {accept}\n")
+    print(f"accept     precision {_format(metrics['accept_precision'])}  recall {_format(metrics['accept_recall'])}")
+    print(f"reject     precision {_format(metrics['reject_precision'])}  recall {_format(metrics['reject_recall'])}")
+    print(f"borderline {_format(metrics['borderline_rate'])} of questions go to the LLM fallback")
+    print(
+        f"errors     {metrics['relevant_refused']} relevant refused, "
+        f"{metrics['irrelevant_answered']} irrelevant answered without a check"
+    )
+    print(f"scoring    {score_seconds / len(scores) * 1000:.3f} ms per question (vs. one LLM round trip)\n")
+
+    scores = np.asarray(scores)
+    for label, name in ((True, "relevant"), (False, "irrelevant")):
+        picked = np.sort(scores[np.asarray(labels) == label])
+        p10, p50, p90 = np.percentile(picked, [10, 50, 90])
+        print(
+            f"{name:>10} scores: min {picked[0]:.3f}  p10 {p10:.3f}  median {p50:.3f}  "
+            f"p90 {p90:.3f}  max {picked[-1]:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from rate_limiter import TokenBucket, gemini_embed_budget
+from vector_ops import as_matrix, normalize_rows
+from config import (
+    get_genai,
+    GEMINI_API_ENDPOINT,
+    EMBED_MODEL_NAME,
+    GEMINI_EMBED_DIM,
+    GEMINI_EMBED_BATCH_SIZE,
+    GEMINI_EMBED_CONCURRENCY,
+    GEMINI_EMBED_MAX_RETRIES,
+)
+
+# HTTP statuses worth retrying: rate limited or a transient server-side failure
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Full-size embeddings are 3072-dim; smaller ones are Matryoshka prefixes and cached/stored separately
+GEMINI_FULL_DIM = 3072
+GEMINI_EMBED_DIM = min(GEMINI_EMBED_DIM, GEMINI_FULL_DIM)
+GEMINI_MODEL_ID = EMBED_MODEL_NAME if GEMINI_EMBED_DIM == GEMINI_FULL_DIM else f"{EMBED_MODEL_NAME}@{GEMINI_EMBED_DIM}"
+_DIM_ARGS = {} if GEMINI_EMBED_DIM == GEMINI_FULL_DIM else {"output_dimensionality": GEMINI_EMBED_DIM}
+
+EmbedBatchFn = Callable[[List[str], str], np.ndarray]
+AsyncEmbedBatchFn = Callable[[List[str], str], Awaitable[np.ndarray]]
+
+
+def _unpack_batch(resp, texts: List[str]) -> np.ndarray:
+    embs = resp["embedding"] if isinstance(resp, dict) else resp.embedding
+    if len(embs) != len(texts):
+        raise RuntimeError(f"Gemini returned {len(embs)} embeddings for {len(texts)} texts")
+    # Only full-size embeddings come back normalized; truncated ones have to be re-normalized
+    embs = as_matrix(embs)
+    return normalize_rows(embs[:, :GEMINI_EMBED_DIM]) if _DIM_ARGS else embs
+
+
+def _gemini_embed_batch(texts: List[str], task_type: str) -> np.ndarray:
+    """One multi-content embedContent request to Gemini."""
+    resp = get_genai().embed_content(
+        model=EMBED_MODEL_NAME,
+        content=texts,
+        task_type=task_type,
+        **_DIM_ARGS,
+    )
+    return _unpack_batch(resp, texts)
+
+
+async def _gemini_embed_batch_async(texts: List[str], task_type: str) -> np.ndarray:
+    if GEMINI_API_ENDPOINT:
+        # A custom endpoint is configured with the REST transport, which has no async client:
+        # embed_content_async would return a plain response that can't be awaited
+        return await asyncio.to_thread(_gemini_embed_batch, texts, task_type)
+    resp = await get_genai().embed_content_async(
+        model=EMBED_MODEL_NAME,
+        content=texts,
+        task_type=task_type,
+        **_DIM_ARGS,
+    )
+    return _unpack_batch(resp, texts)
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    # google.api_core exceptions expose `.code`; HTTP client errors usually `.status_code`
+    for attr in ("code", "status_code"):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(exc, "response", None)
+    code = getattr(response, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc: Exception) -> bool:
+    code = _status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+    # Connection resets / timeouts have no status code
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class EmbeddingResult:
+    """Embeddings in input order. Failed entries are None and listed in `failures`."""
+
+    def __init__(self, size: int):
+        self.embeddings: List[Optional[np.ndarray]] = [None] * size
+        self.failures: Dict[int, str] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+
+class RemoteEmbeddingEngine:
+    """Batched, concurrent embedding client with a shared token-bucket budget.
+
+    Texts are split into multi-content requests of `batch_size`, up to
+    `concurrency` of them run at once, and every attempt (including retries)
+    takes a token from `bucket`. Retryable errors (429/5xx) are retried with
+    exponential backoff and jitter; batches that still fail are reported in
+    the result instead of being replaced with zero vectors.
+    """
+
+    def __init__(
+        self,
+        embed_batch_fn: EmbedBatchFn = _gemini_embed_batch,
+        embed_batch_async_fn: AsyncEmbedBatchFn = _gemini_embed_batch_async,
+        batch_size: int = GEMINI_EMBED_BATCH_SIZE,
+        concurrency: int = GEMINI_EMBED_CONCURRENCY,
+        bucket: Optional[TokenBucket] = None,
+        max_retries: int = GEMINI_EMBED_MAX_RETRIES,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.embed_batch_fn = embed_batch_fn
+        self.embed_batch_async_fn = embed_batch_async_fn
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.bucket = bucket or gemini_embed_budget
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _embed_with_retry(self, texts: List[str], task_type: str) -> np.ndarray:
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return self.embed_batch_fn(texts, task_type)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"⏳ Embedding request failed ({e}); retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                attempt += 1
+
+    async def _embed_with_retry_async(self, texts: List[str], task_type: str) -> np.ndarray:
+        attempt = 0
+        while True:
+            await self.bucket.acquire_async()
+            try:
+                return await self.embed_batch_async_fn(texts, task_type)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"⏳ Embedding request failed ({e}); retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _batches(self, n: int) -> List[List[int]]:
+        return [
+            list(range(start, min(start + self.batch_size, n)))
+            for start in range(0, n, self.batch_size)
+        ]
+
+    @staticmethod
+    def _record(result: EmbeddingResult, indices: List[int], embs=None, error: Optional[Exception] = None):
+        if error is not None:
+            print(f"✗ Failed to embed {len(indices)} texts with Gemini: {error}")
+            for i in indices:
+                result.failures[i] = str(error)
+            return
+        for i, emb in zip(indices, embs):
+            result.embeddings[i] = emb
+
+    def embed(self, texts: Sequence[str], task_type: str = "retrieval_document") -> EmbeddingResult:
+        result = EmbeddingResult(len(texts))
+        if not texts:
+            return result
+
+        batches = self._batches(len(texts))
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            futures = [
+                pool.submit(self._embed_with_retry, [texts[i] for i in indices], task_type)
+                for indices in batches
+            ]
+            for indices, future in zip(batches, futures):
+                try:
+                    self._record(result, indices, future.result())
+                except Exception as e:
+                    self._record(result, indices, error=e)
+
+        return result
+
+    async def embed_async(self, texts: Sequence[str], task_type: str = "retrieval_document") -> EmbeddingResult:
+        """Same as embed(), but on the event loop: concurrency is bounded by a semaphore."""
+        result = EmbeddingResult(len(texts))
+        if not texts:
+            return result
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(indices: List[int]):
+            async with semaphore:
+                try:
+                    embs = await self._embed_with_retry_async([texts[i] for i in indices], task_type)
+                except Exception as e:
+                    self._record(result, indices, error=e)
+                    return
+                self._record(result, indices, embs)
+
+        await asyncio.gather(*(run(indices) for indices in self._batches(len(texts))))
+        return result
+
+
+# Shared engine; every request draws from the global 'gemini_embed' budget
+gemini_embedding_engine = RemoteEmbeddingEngine()
@@ -0,0 +1,276 @@
+import os
+import time
+import json
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config import (
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_TTL_SECONDS,
+    RESULT_CACHE_DISK_PATH,
+    RESULT_CACHE_DISK_MAX_BYTES,
+)
+
+
+def make_result_key(*parts) -> str:
+    """Stable cache key from the things that determine an answer"""
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed second tier with TTL and size-based (LRU) eviction."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            return row[0], row[1]
+
+    def put(self, key: str, value: str, expires_at: float):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, expires_at, now),
+            )
+            self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT key, size FROM results ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM results WHERE key = ?", (row[0],))
+                total -= row[1]
+
+
+class PendingResult:
+    """A claimed in-flight computation of one cache key (see ResultCache.claim)"""
+
+    def __init__(self, cache: "ResultCache", key: str, future: asyncio.Future):
+        self.cache = cache
+        self.key = key
+        self.future = future
+
+    def _finish(self):
+        if self.cache._inflight.get(self.key) is self.future:
+            del self.cache._inflight[self.key]
+
+    async def complete(self, value: str):
+        """Hand `value` to everyone waiting, then store it"""
+        self._finish()
+        if not self.future.done():
+            self.future.set_result(value)
+        await self.cache.put_async(self.key, value)
+
+    def fail(self, error: BaseException):
+        """Waiters get `error`; if the computation was cancelled, one of them takes over instead"""
+        self._finish()
+        if self.future.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            self.future.cancel()
+        else:
+            self.future.set_exception(error)
+            # Don't warn about an exception nobody else was waiting for
+            self.future.exception()
+
+    def release(self):
+        """Give up without a value (e.g. the streaming client went away); a waiter takes over"""
+        self._finish()
+        if not self.future.done():
+            self.future.cancel()
+
+
+class ResultCache:
+    """Two-tier cache for LLM results.
+
+    Tier 1 is an in-memory LRU bounded by entry count and bytes; tier 2 is an
+    optional SQLite file shared by workers and kept across restarts. Entries
+    expire after `ttl` seconds. get_or_compute() de-duplicates concurrent
+    misses for the same key so they share a single computation; claim() lets
+    a caller that produces the value some other way (e.g. streaming it) take
+    part in the same de-duplication. Async callers use get_async/put_async,
+    which keep the SQLite tier off the event loop.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        ttl: float = RESULT_CACHE_TTL_SECONDS,
+        disk_path: Optional[str] = RESULT_CACHE_DISK_PATH,
+        disk_max_bytes: int = RESULT_CACHE_DISK_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._disk = _DiskTier(disk_path, disk_max_bytes) if disk_path else None
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    # ---- memory tier ----
+
+    def _memory_put(self, key: str, value: str, expires_at: float):
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old:
+                self._memory_bytes -= old[2]
+            self._memory[key] = (value, expires_at, size)
+            self._memory_bytes += size
+            while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, expires_at, size = entry
+            if expires_at <= time.time():
+                del self._memory[key]
+                self._memory_bytes -= size
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    # ---- public API ----
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is None and self._disk:
+            value = self._promote(key, self._disk.get(key))
+        return self._count(value)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get() for the event loop: a memory miss reads the SQLite tier on a worker thread"""
+        value = self._memory_get(key)
+        if value is None and self._disk:
+            value = self._promote(key, await asyncio.to_thread(self._disk.get, key))
+        return self._count(value)
+
+    def _promote(self, key: str, found: Optional[Tuple[str, float]]) -> Optional[str]:
+        if not found:
+            return None
+        value, expires_at = found
+        self._memory_put(key, value, expires_at)
+        return value
+
+    def _count(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        self._memory_put(key, value, expires_at)
+        if self._disk:
+            self._disk.put(key, value, expires_at)
+
+    async def put_async(self, key: str, value: str):
+        """put() for the event loop: the SQLite write runs on a worker thread"""
+        expires_at = time.time() + self.ttl
+        self._memory_put(key, value, expires_at)
+        if self._disk:
+            await asyncio.to_thread(self._disk.put, key, value, expires_at)
+
+    def claim(self, key: str) -> Optional["PendingResult"]:
+        """Register the caller as the one computing `key`, or None if someone already is.
+
+        Concurrent get_or_compute() calls for the key wait for the claim
+        instead of computing it again. The caller must end it with
+        complete(), or release() if it produced no value.
+        """
+        if key in self._inflight:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return PendingResult(self, key, future)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """Return the cached value, or compute it once for all concurrent callers."""
+        while True:
+            value = await self.get_async(key)
+            if value is not None:
+                return value
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                # The value may have landed while the disk tier was being read
+                value = self._memory_get(key)
+                if value is not None:
+                    return value
+                claim = self.claim(key)
+                break
+            self.shared += 1
+            # asyncio.wait never cancels `pending`, even if this caller is cancelled
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                return pending.result()
+            # The request doing the work was cancelled (client went away); take over
+
+        try:
+            value = await compute()
+        except BaseException as e:
+            claim.fail(e)
+            raise
+        await claim.complete(value)
+        return value
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_inflight": self.shared,
+                "disk_tier": bool(self._disk),
+            }
+
+
+# Global cache for deterministic document analyses
+analysis_cache = ResultCache()
@@ -1,33 +1,64 @@
-from typing import Optional
+import os
+import hashlib
+from typing import Optional, Union
 
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Response, Depends, HTTPException
 
+from config import BULK_INGEST_ROOT
 from deps import verify_admin
-from models import IngestResponse, TextIngestRequest
-from rag_utils import extract_text_from_upload, ingest_document
+from bulk_ingest import archive_suffix, bulk_ingest_status, checkpoint_path_for, start_bulk_ingest
+from ingest_jobs import ingest_jobs
+from models import IngestJobResponse, IngestResponse, TextIngestRequest
+from rag_utils import iter_upload_pages, ingest_document, sync_document_index, sync_lexical_index
+from rate_limiter import budget_metrics
+from pdf_extraction import UploadTooLarge, spill_to_file
+from result_cache import analysis_cache
+from document_cache import hot_documents
+from context_packing import packing_stats
+from summarizer import summary_cache
+from chat_sessions import chat_sessions
+from embedding_cache import query_embeddings
+from local_embeddings import local_embedding_service
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
 
-@router.post("/ingest-file", response_model=IngestResponse)
+@router.post("/ingest-file", response_model=Union[IngestResponse, IngestJobResponse])
 def admin_ingest_file(
+    response: Response,
     file: UploadFile = File(...),
     uploader_id: Optional[str] = Form(None),
+    background: bool = Form(False),
+    previous_document_id: Optional[str] = Form(None),
     _: bool = Depends(verify_admin),
 ):
-    text = extract_text_from_upload(file)
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="Could not read any text from uploaded file.")
+    if background:
+        # Return a job id right away; poll GET /jobs/{job_id} for progress
+        job = ingest_jobs.submit_upload(
+            file,
+            uploader_type="admin",
+            uploader_id=uploader_id,
+            extra_metadata={"source_filename": file.filename or "unknown"},
+            previous_document_id=previous_document_id,
+        )
+        response.status_code = 202
+        return IngestJobResponse(**job)
 
+    # Pages are chunked, embedded and stored while later pages are still being extracted
     try:
         result = ingest_document(
-            full_text=text,
+            pages=(page.text for page in iter_upload_pages(file)),
             uploader_type="admin",
             uploader_id=uploader_id,
             extra_metadata={"source_filename": file.filename or "unknown"},
+            previous_document_id=previous_document_id,
         )
         return IngestResponse(**result)
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Could not read any text from uploaded file.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to ingest document: {e}")
 
@@ -43,7 +74,117 @@ def admin_ingest_text(
             uploader_type="admin",
             uploader_id=payload.uploader_id,
             extra_metadata={"source": "admin_text"},
+            previous_document_id=payload.previous_document_id,
         )
         return IngestResponse(**result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to ingest document: {e}")
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@router.post("/bulk-ingest", status_code=202)
+def admin_bulk_ingest(
+    file: Optional[UploadFile] = File(None),
+    path: Optional[str] = Form(None),
+    uploader_id: Optional[str] = Form(None),
+    _: bool = Depends(verify_admin),
+):
+    """Load a whole corpus in the background (see bulk_ingest.py); poll GET /admin/bulk-ingest/{run_id}.
+
+    Send either an archive upload or the `path` of a directory or archive
+    under BULK_INGEST_ROOT. Posting the same source again resumes from its
+    checkpoint.
+    """
+    if (file is None) == (path is None):
+        raise HTTPException(status_code=400, detail="Send either an archive file or a server-side path.")
+
+    on_finish = None
+    if path is not None:
+        if not BULK_INGEST_ROOT:
+            raise HTTPException(status_code=400, detail="Server-side paths are disabled; set BULK_INGEST_ROOT.")
+        root = os.path.realpath(BULK_INGEST_ROOT)
+        source = os.path.realpath(os.path.join(root, path))
+        if source != root and not source.startswith(root + os.sep):
+            raise HTTPException(status_code=400, detail="Path is outside BULK_INGEST_ROOT.")
+        if not os.path.exists(source):
+            raise HTTPException(status_code=404, detail="Path not found.")
+        checkpoint_key = source
+    else:
+        suffix = archive_suffix(file.filename or "")
+        if not suffix:
+            raise HTTPException(status_code=400, detail="Upload a .zip, .tar, .tar.gz or .tgz archive.")
+        try:
+            source = spill_to_file(file.file, suffix=suffix)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        # The same archive uploaded again resumes from the same checkpoint
+        checkpoint_key = f"upload:{_file_sha256(source)}"
+        on_finish = lambda: os.unlink(source)
+
+    try:
+        run_id = start_bulk_ingest(source, checkpoint_path_for(checkpoint_key), uploader_id, on_finish=on_finish)
+    except RuntimeError as e:
+        if on_finish:
+            on_finish()
+        raise HTTPException(status_code=409, detail=str(e))
+    return bulk_ingest_status(run_id)
+
+
+@router.get("/bulk-ingest/{run_id}")
+def admin_bulk_ingest_status(run_id: str, _: bool = Depends(verify_admin)):
+    """Progress and throughput (docs/sec, chunks/sec) of a bulk load"""
+    status = bulk_ingest_status(run_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Bulk ingest run not found.")
+    return status
+
+
+@router.get("/rate-limits")
+def admin_rate_limits(_: bool = Depends(verify_admin)):
+    """Wait-time and rejection metrics for each provider budget"""
+    return budget_metrics()
+
+
+@router.get("/cache-stats")
+def admin_cache_stats(_: bool = Depends(verify_admin)):
+    """Hit/miss counters for the analysis result, hot document, query embedding and summary partial caches,
+    plus the prompt tokens saved by context packing"""
+    return {
+        **analysis_cache.stats(),
+        "hot_documents": hot_documents.stats(),
+        "query_embeddings": query_embeddings.stats(),
+        "summary_partials": summary_cache.stats(),
+        "context_packing": packing_stats.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "local_embeddings": local_embedding_service.stats(),
+    }
+
+
+
+@router.post("/document-index/rebuild")
+def admin_rebuild_document_index(_: bool = Depends(verify_admin)):
+    """Refill the local doc_hash / chunk fingerprint index from the vector store"""
+    try:
+        sync_document_index(force=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to rebuild document index: {e}")
+    return {"status": "ok"}
+
+
+@router.post("/lexical-index/sync")
+def admin_sync_lexical_index(_: bool = Depends(verify_admin)):
+    """Add stored documents missing from the BM25 index"""
+    try:
+        sync_lexical_index(force=True)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to ingest document: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to sync lexical index: {e}")
+    return {"status": "ok"}
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, HTTPException
+
+from ingest_jobs import ingest_jobs
+from models import IngestJobResponse
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/{job_id}", response_model=IngestJobResponse)
+def get_job(job_id: str):
+    job = ingest_jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return IngestJobResponse(**job)
@@ -1,136 +1,498 @@
-from fastapi import APIRouter, HTTPException
+import json
+import asyncio
+import inspect
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
-from models import RAGRequest, CompareRequest, GenericResponse, ChatRequest
-from rag_utils import retrieve_context, build_legal_prompt, call_llm
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from config import GROQ_MODEL_NAME, RESULT_CACHE_ENABLED, RELEVANCE_LLM_FALLBACK, ANALYSIS_MAX_CONCURRENCY
+from models import (
+    RAGRequest,
+    CompareRequest,
+    GenericResponse,
+    ChatRequest,
+    ChatResponse,
+    BatchAnalysisRequest,
+    BatchAnalysisResponse,
+)
+from rag_utils import (
+    retrieve_chunks_async,
+    embed_query_async,
+    embed_queries_async,
+    query_chunks_async,
+    query_chunks_multi_async,
+    current_embedding_model,
+    build_legal_prompt,
+    call_llm_async,
+    stream_llm_async,
+    get_doc_hash_async,
+    get_document_chunks,
+    run_chroma,
+    PROMPT_TEMPLATE_VERSION,
+)
+from relevance import relevance_score, classify_relevance, RELEVANT, IRRELEVANT, BORDERLINE
+from result_cache import analysis_cache, make_result_key
+from summarizer import document_summarizer, SUMMARY_PROMPT_VERSION
+from chat_sessions import chat_sessions, compact_in_background
+from document_versions import revision_order, revision_hunks
 
 router = APIRouter(tags=["tasks"])
 
-@router.get("/")
-def root():
-    return {"message": "LegalEase RAG API is running. "}
+# Fixed questions of the analysis routes; their embeddings are precomputed at startup
+TASK_QUESTIONS = {
+    "simplify": "Simplify this legal document and explain the key points in simple language.",
+    "summary": "Summarize this legal document clearly in bullet points and short paragraphs.",
+    "key_terms": "Extract and explain the key legal terms, clauses, and obligations in this document.",
+    "risk_analysis": (
+        "Identify potential risks, unfavorable clauses, and points the user should "
+        "negotiate or be careful about in this legal document."
+    ),
+    "contract_comparison": (
+        "Compare these two contracts.  Highlight similarities, key differences, risks, "
+        "and which clauses are more favorable to the user in each contract."
+    ),
+}
 
+# /contract-comparison between two versions of one document; the context is only what changed
+REVISION_COMPARISON_QUESTION = (
+    "Compare these two versions of the same contract. Each passage shows a change with its earlier "
+    "and revised wording. Explain what changed, and whether each change is more or less favorable to the user."
+)
 
-@router.post("/simplify", response_model=GenericResponse)
-def simplify_document(payload: RAGRequest):
-    question = "Simplify this legal document and explain the key points in simple language."
-    context = retrieve_context([payload.document_id], question)
-    if not context:
-        raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
+# Modes of POST /analyze -> the prompt mode of the single-analysis route with the same question
+ANALYSIS_MODES = {
+    "simplify": "Simplify Language",
+    "summary": "Document Summary",
+    "key_terms": "Key Terms Extraction",
+    "risk_analysis": "Risk Analysis",
+}
+# Modes that honour full_document
+FULL_DOCUMENT_MODES = ("simplify", "summary")
 
-    prompt = build_legal_prompt(
-        mode="Simplify Language",
-        question=question,
-        context_chunks=context,
-        output_language=payload.output_language or "English",
-    )
-    answer = call_llm(prompt)
-    return GenericResponse(
-        result=answer,
-        note="Processing complete!"
+# /chat questions containing any of these are refused before retrieval
+OFF_TOPIC_KEYWORDS = [
+    "c++", "python", "java", "javascript", "coding", "programming",
+    "math", "algebra", "calculus", "physics", "chemistry",
+    "history", "geography", "biology", "astronomy",
+    "joke", "funny", "game", "movie", "music", "weather",
+    "recipe", "cooking", "sports", "football", "basketball"
+]
+
+OFF_TOPIC_MESSAGE = (
+    "I'm specifically designed to answer questions about this document. Please ask me about the "
+    "document's clauses, terms, obligations, payment terms, risks, or any other legal aspects "
+    "contained in the document."
+)
+
+
+# ------------- response helpers -------------
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Event. Payloads are JSON so newlines in tokens survive."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def _sse_events(
+    request: Request,
+    deltas: AsyncIterator[str],
+    note: str,
+    on_complete: Optional[Callable[[str], Any]] = None,
+    extra: Optional[dict] = None,
+) -> AsyncIterator[str]:
+    """Forward LLM deltas as `data:` events, then a final `done` event with the full result.
+
+    If the client goes away we stop reading and close the upstream completion,
+    so no more tokens are generated for it. `on_complete` only sees full answers,
+    and is awaited if it is a coroutine function.
+    """
+    parts = []
+    try:
+        async for delta in deltas:
+            if await request.is_disconnected():
+                print("⚠️ Client disconnected; cancelling LLM stream")
+                return
+            parts.append(delta)
+            yield _sse({"delta": delta})
+        result = "".join(parts)
+        if on_complete:
+            completed = on_complete(result)
+            if inspect.isawaitable(completed):
+                await completed
+        yield _sse({"result": result, "note": note, **(extra or {})}, event="done")
+    except Exception as e:
+        yield _sse({"detail": f"LLM streaming failed: {e}"}, event="error")
+    finally:
+        await deltas.aclose()
+
+
+class _SSEResponse(StreamingResponse):
+    """A StreamingResponse that calls `on_close` once it is over, however it ended.
+
+    Unlike a `finally` in the event generator, this also runs when the client
+    disconnects before the first event is sent.
+    """
+
+    def __init__(self, content, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.on_close:
+                self.on_close()
+
+
+def _sse_response(events: AsyncIterator[str], on_close: Optional[Callable[[], None]] = None) -> StreamingResponse:
+    return _SSEResponse(
+        events,
+        on_close=on_close,
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser as they are produced
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@router.post("/summary", response_model=GenericResponse)
-def summarize_document(payload: RAGRequest):
-    question = "Summarize this legal document clearly in bullet points and short paragraphs."
-    context = retrieve_context([payload.document_id], question)
-    if not context:
+async def _respond(
+    request: Request,
+    prompt: str,
+    stream: Optional[bool],
+    note: str,
+    on_complete: Optional[Callable[[str], None]] = None,
+    response_model=GenericResponse,
+    extra: Optional[dict] = None,
+):
+    """Answer `prompt` either as a `response_model` or as an SSE stream of tokens.
+
+    `extra` fields go into the response model / the final `done` event, and
+    `on_complete` sees the full answer either way.
+    """
+    if not stream:
+        answer = await call_llm_async(prompt)
+        if on_complete:
+            on_complete(answer)
+        return response_model(
+            result=answer,
+            note=note,
+            **(extra or {})
+        )
+
+    deltas = await stream_llm_async(prompt)
+    return _sse_response(_sse_events(request, deltas, note, on_complete=on_complete, extra=extra))
+
+
+def _fixed_response(result: str, stream: Optional[bool], note: str, response_model=GenericResponse, extra: Optional[dict] = None):
+    """A response that needs no LLM call, in the same shape as _respond()."""
+    if not stream:
+        return response_model(
+            result=result,
+            note=note,
+            **(extra or {})
+        )
+
+    async def events():
+        yield _sse({"delta": result})
+        yield _sse({"result": result, "note": note, **(extra or {})}, event="done")
+
+    return _sse_response(events())
+
+
+# ------------- cached document analyses -------------
+
+async def _document_prompt(document_id: str, mode: str, question: str, output_language: str) -> str:
+    retrieved = await retrieve_chunks_async([document_id], question)
+    if not retrieved.texts:
         raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
 
-    prompt = build_legal_prompt(
-        mode="Document Summary",
+    return build_legal_prompt(
+        mode=mode,
         question=question,
-        context_chunks=context,
-        output_language=payload.output_language or "English",
-    )
-    answer = call_llm(prompt)
-    return GenericResponse(
-        result=answer,
-        note="Processing complete!"
+        context_chunks=retrieved.texts,
+        output_language=output_language,
+        metadatas=retrieved.metadatas,
     )
 
 
-@router.post("/key-terms", response_model=GenericResponse)
-@router.post("/keyterms", response_model=GenericResponse)  # optional alias
-def extract_key_terms(payload: RAGRequest):
-    question = "Extract and explain the key legal terms, clauses, and obligations in this document."
-    context = retrieve_context([payload.document_id], question)
-    if not context:
+async def _full_document_prompt(document_id: str, mode: str, question: str, output_language: str) -> str:
+    """Map-reduce summaries of every chunk, then the task question over them (see summarizer)"""
+    chunks = await run_chroma(get_document_chunks, document_id)
+    if not chunks:
         raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
 
-    prompt = build_legal_prompt(
-        mode="Key Terms Extraction",
-        question=question,
-        context_chunks=context,
-        output_language=payload.output_language or "English",
+    return await document_summarizer.final_prompt(chunks, mode, question, output_language)
+
+
+async def _analysis_cache_key(document_id: str, mode: str, output_language: str) -> Optional[str]:
+    if not RESULT_CACHE_ENABLED:
+        return None
+    doc_hash = await get_doc_hash_async(document_id)
+    if not doc_hash:
+        return None
+    return make_result_key(doc_hash, mode, output_language, PROMPT_TEMPLATE_VERSION, GROQ_MODEL_NAME)
+
+
+def _analysis_cache_mode(mode: str, full_document: bool) -> str:
+    if full_document:
+        return f"{mode} (full document, summaries v{SUMMARY_PROMPT_VERSION})"
+    return mode
+
+
+async def _analyze(request: Request, payload: RAGRequest, mode: str, question: str, full_document: bool = False):
+    """Run a fixed-question analysis of one document, served from the result cache when possible.
+
+    The answer only depends on the document content, mode, language, prompt
+    template and model, so identical requests share one retrieval + LLM call.
+    With `full_document`, the answer is built from summaries of the whole
+    document instead of the top retrieved chunks.
+    """
+    output_language = payload.output_language or "English"
+    note = "Processing complete!"
+    build_prompt = _full_document_prompt if full_document else _document_prompt
+    key = await _analysis_cache_key(payload.document_id, _analysis_cache_mode(mode, full_document), output_language)
+
+    async def compute() -> str:
+        prompt = await build_prompt(payload.document_id, mode, question, output_language)
+        return await call_llm_async(prompt)
+
+    if key is None:
+        prompt = await build_prompt(payload.document_id, mode, question, output_language)
+        return await _respond(request, prompt, payload.stream, note=note)
+
+    claim = analysis_cache.claim(key) if payload.stream and await analysis_cache.get_async(key) is None else None
+    if claim is not None:
+        # Stream a fresh answer. Identical requests meanwhile wait for it in get_or_compute
+        # below; if the stream ends without an answer, one of them computes it instead.
+        try:
+            prompt = await build_prompt(payload.document_id, mode, question, output_language)
+            deltas = await stream_llm_async(prompt)
+        except BaseException as e:
+            claim.fail(e)
+            raise
+        events = _sse_events(request, deltas, note, on_complete=claim.complete)
+        return _sse_response(events, on_close=claim.release)
+
+    answer = await analysis_cache.get_or_compute(key, compute)
+    return _fixed_response(answer, payload.stream, note=note)
+
+
+async def _batch_prompts(document_id: str, modes: List[str], output_language: str, full_document: bool) -> Dict[str, str]:
+    """Prompts for several analyses of one document, built from one shared retrieval.
+
+    The retrieval-based modes' questions are embedded in one batch and
+    retrieved with one vector store query; chunks picked by several modes are
+    fetched once. Full-document modes share one fetch of the document's
+    chunks (and the summarizer's cached summaries).
+    """
+    prompts = {}
+    retrieved_modes = [m for m in modes if not (full_document and m in FULL_DOCUMENT_MODES)]
+    if retrieved_modes:
+        questions = [TASK_QUESTIONS[m] for m in retrieved_modes]
+        query_embeddings = await embed_queries_async(questions)
+        contexts = await query_chunks_multi_async([document_id], query_embeddings, query_texts=questions)
+        if not any(ctx.texts for ctx in contexts):
+            raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
+        total = sum(len(ctx.texts) for ctx in contexts)
+        unique = len({(m.get("document_id"), m.get("chunk_index")) for ctx in contexts for m in ctx.metadatas})
+        print(f"♻ Retrieved {total} chunks ({unique} unique) for {len(retrieved_modes)} analyses in one query")
+
+        for mode, ctx in zip(retrieved_modes, contexts):
+            prompts[mode] = build_legal_prompt(
+                mode=ANALYSIS_MODES[mode],
+                question=TASK_QUESTIONS[mode],
+                context_chunks=ctx.texts,
+                output_language=output_language,
+                metadatas=ctx.metadatas,
+            )
+
+    full_modes = [m for m in modes if m not in prompts]
+    if full_modes:
+        chunks = await run_chroma(get_document_chunks, document_id)
+        if not chunks:
+            raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
+        # Concurrent final_prompt calls share their chunk summaries through the analysis cache
+        finals = await asyncio.gather(*(
+            document_summarizer.final_prompt(chunks, ANALYSIS_MODES[m], TASK_QUESTIONS[m], output_language)
+            for m in full_modes
+        ))
+        prompts.update(zip(full_modes, finals))
+    return prompts
+
+
+def _analysis_modes(requested: Optional[List[str]]) -> List[str]:
+    """Requested modes, normalized ("key-terms" -> "key_terms") and deduplicated; all of them by default"""
+    modes = list(dict.fromkeys(m.strip().lower().replace("-", "_") for m in requested or ANALYSIS_MODES))
+    unknown = [m for m in modes if m not in ANALYSIS_MODES]
+    if unknown or not modes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown analysis mode(s): {', '.join(unknown) or '(none)'}. Expected any of {', '.join(ANALYSIS_MODES)}.",
+        )
+    return modes
+
+
+# ------------- routes -------------
+
+@router.get("/")
+def root():
+    return {"message": "LegalEase RAG API is running. "}
+
+
+@router.post("/simplify", response_model=GenericResponse)
+async def simplify_document(payload: RAGRequest, request: Request):
+    question = TASK_QUESTIONS["simplify"]
+    return await _analyze(
+        request, payload, mode="Simplify Language", question=question, full_document=bool(payload.full_document)
     )
-    answer = call_llm(prompt)
-    return GenericResponse(
-        result=answer,
-        note="Processing complete!"
+
+
+@router.post("/summary", response_model=GenericResponse)
+async def summarize_document(payload: RAGRequest, request: Request):
+    question = TASK_QUESTIONS["summary"]
+    return await _analyze(
+        request, payload, mode="Document Summary", question=question, full_document=bool(payload.full_document)
     )
 
 
+@router.post("/key-terms", response_model=GenericResponse)
+@router.post("/keyterms", response_model=GenericResponse)  # optional alias
+async def extract_key_terms(payload: RAGRequest, request: Request):
+    question = TASK_QUESTIONS["key_terms"]
+    return await _analyze(request, payload, mode="Key Terms Extraction", question=question)
+
+
 @router.post("/risk-analysis", response_model=GenericResponse)
-def risk_analysis(payload: RAGRequest):
-    question = (
-        "Identify potential risks, unfavorable clauses, and points the user should "
-        "negotiate or be careful about in this legal document."
-    )
-    context = retrieve_context([payload.document_id], question)
-    if not context:
-        raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
+async def risk_analysis(payload: RAGRequest, request: Request):
+    question = TASK_QUESTIONS["risk_analysis"]
+    return await _analyze(request, payload, mode="Risk Analysis", question=question)
 
-    prompt = build_legal_prompt(
-        mode="Risk Analysis",
-        question=question,
-        context_chunks=context,
-        output_language=payload.output_language or "English",
-    )
-    answer = call_llm(prompt)
-    return GenericResponse(
-        result=answer,
-        note="Processing complete!"
-    )
+
+@router.post("/analyze", response_model=BatchAnalysisResponse)
+async def analyze_document(payload: BatchAnalysisRequest, request: Request):
+    """Run several analyses of one document in one request.
+
+    Cached answers are returned as they are. The rest share a single
+    retrieval (one embedding batch, one vector store query) and their LLM
+    calls run concurrently, at most ANALYSIS_MAX_CONCURRENCY at a time. A
+    failing mode is reported in `errors` without failing the others. With
+    `stream`, each mode is sent as a `result` (or `error`) event as soon as it
+    finishes, followed by a `done` event.
+    """
+    modes = _analysis_modes(payload.modes)
+    output_language = payload.output_language or "English"
+    full_document = bool(payload.full_document)
+
+    keys = dict(zip(modes, await asyncio.gather(*(
+        _analysis_cache_key(
+            payload.document_id,
+            _analysis_cache_mode(ANALYSIS_MODES[m], full_document and m in FULL_DOCUMENT_MODES),
+            output_language,
+        )
+        for m in modes
+    ))))
+    cached = dict(zip(
+        [m for m in modes if keys[m]],
+        await asyncio.gather(*(analysis_cache.get_async(keys[m]) for m in modes if keys[m])),
+    ))
+    results: Dict[str, str] = {m: answer for m, answer in cached.items() if answer is not None}
+    pending = [m for m in modes if m not in results]
+    prompts = await _batch_prompts(payload.document_id, pending, output_language, full_document) if pending else {}
+
+    semaphore = asyncio.Semaphore(ANALYSIS_MAX_CONCURRENCY)
+
+    async def run(mode: str):
+        """(mode, answer, error) so results can be reported in completion order"""
+        async def compute() -> str:
+            async with semaphore:
+                return await call_llm_async(prompts[mode])
+
+        try:
+            key = keys[mode]
+            return mode, await (analysis_cache.get_or_compute(key, compute) if key else compute()), None
+        except Exception as e:
+            return mode, None, f"LLM call failed: {e}"
+
+    if not payload.stream:
+        errors: Dict[str, str] = {}
+        for mode, answer, error in await asyncio.gather(*(run(m) for m in pending)):
+            if error:
+                errors[mode] = error
+            else:
+                results[mode] = answer
+        return BatchAnalysisResponse(results={m: results[m] for m in modes if m in results}, errors=errors)
+
+    async def events():
+        tasks = [asyncio.ensure_future(run(m)) for m in pending]
+        try:
+            for mode in modes:
+                if mode in results:
+                    yield _sse({"mode": mode, "result": results[mode]}, event="result")
+            for finished in asyncio.as_completed(tasks):
+                mode, answer, error = await finished
+                if await request.is_disconnected():
+                    print("⚠️ Client disconnected; cancelling remaining analyses")
+                    return
+                if error:
+                    yield _sse({"mode": mode, "detail": error}, event="error")
+                else:
+                    yield _sse({"mode": mode, "result": answer}, event="result")
+            yield _sse({"modes": modes, "note": "Processing complete!"}, event="done")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return _sse_response(events())
 
 
 @router.post("/contract-comparison", response_model=GenericResponse)
-def contract_comparison(payload: CompareRequest):
-    question = (
-        "Compare these two contracts.  Highlight similarities, key differences, risks, "
-        "and which clauses are more favorable to the user in each contract."
-    )
-    context = retrieve_context(
+async def contract_comparison(payload: CompareRequest, request: Request):
+    revisions = await run_chroma(revision_order, payload.document_id_1, payload.document_id_2)
+    if revisions is not None:
+        return await _compare_revisions(request, payload, *revisions)
+
+    question = TASK_QUESTIONS["contract_comparison"]
+    retrieved = await retrieve_chunks_async(
         [payload.document_id_1, payload.document_id_2],
         question,
     )
-    if not context:
+    if not retrieved.texts:
         raise HTTPException(status_code=404, detail="No chunks found for these document_ids.")
 
     prompt = build_legal_prompt(
         mode="Contract Comparison",
         question=question,
-        context_chunks=context,
+        context_chunks=retrieved.texts,
         output_language=payload.output_language or "English",
+        metadatas=retrieved.metadatas,
     )
-    answer = call_llm(prompt)
-    return GenericResponse(
-        result=answer,
-        note="Processing complete!"
+    return await _respond(request, prompt, payload.stream, note="Processing complete!")
+
+
+async def _compare_revisions(request: Request, payload: CompareRequest, older: str, newer: str):
+    """Compare two versions of one document from their chunk-level diff instead of retrieval"""
+    old_chunks, new_chunks = await asyncio.gather(
+        run_chroma(get_document_chunks, older), run_chroma(get_document_chunks, newer)
     )
+    if not old_chunks or not new_chunks:
+        raise HTTPException(status_code=404, detail="No chunks found for these document_ids.")
+    changes = revision_hunks(old_chunks, new_chunks)
+    print(f"♻ Comparing versions from their diff: {len(changes)} changed passages")
+    if not changes:
+        return _fixed_response("The two versions have the same content.", payload.stream, note="Processing complete!")
 
+    prompt = build_legal_prompt(
+        mode="Contract Comparison",
+        question=REVISION_COMPARISON_QUESTION,
+        context_chunks=changes,
+        output_language=payload.output_language or "English",
+    )
+    return await _respond(request, prompt, payload.stream, note="Processing complete!")
 
-@router.post("/chat", response_model=GenericResponse)
-def chat_with_document(payload: ChatRequest):
-    """Chat endpoint for asking questions about a specific document"""
-    user_question = payload.message
-    
-    # Retrieve context from the document
-    context = retrieve_context([payload.document_id], user_question)
-    if not context:
-        raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
-    
-    # Validate that the question is related to the document content
+
+async def _llm_relevance_check(user_question: str, context) -> bool:
+    """Ask the LLM whether a question is about the document (used for borderline scores)."""
     relevance_check_prompt = f"""You are a strict document relevance validator. Your only job is to determine if a user's question is asking about the document content.
 
 User Question: "{user_question}"
@@ -146,44 +508,102 @@ STRICT RULES:
 
 Output ONLY one word: RELEVANT or IRRELEVANT
 Do not explain or add any other text."""
+
+    relevance_result = (await call_llm_async(relevance_check_prompt)).strip().upper()
+    return "IRRELEVANT" not in relevance_result
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat_with_document(payload: ChatRequest, request: Request):
+    """Chat endpoint for asking questions about a specific document.
+
+    Send back the returned `session_id` to continue a conversation: earlier
+    turns are then part of the prompt, and a follow-up on the same topic
+    reuses the previous turn's chunks instead of querying the vector store.
+    """
+    user_question = payload.message
+    session = chat_sessions.get_or_create(payload.session_id, payload.document_id)
+    extra = {"session_id": session.session_id}
     
-    relevance_result = call_llm(relevance_check_prompt).strip().upper()
-    
-    # Check if the question is relevant
-    if "IRRELEVANT" in relevance_result:
-        return GenericResponse(
-            result="I'm specifically designed to answer questions about this document. Please ask me about the document's clauses, terms, obligations, payment terms, risks, or any other legal aspects contained in the document.",
-            note="Question is not related to document content"
+    # Cheap pattern check first: obviously off-topic questions skip retrieval entirely
+    question_lower = user_question.lower()
+    if any(keyword in question_lower for keyword in OFF_TOPIC_KEYWORDS):
+        return _fixed_response(
+            OFF_TOPIC_MESSAGE,
+            payload.stream,
+            note="Question is not related to document content",
+            response_model=ChatResponse,
+            extra=extra,
         )
     
-    # Additional safety check: if LLM says RELEVANT but the question seems off-topic based on patterns
-    off_topic_keywords = [
-        "c++", "python", "java", "javascript", "coding", "programming",
-        "math", "algebra", "calculus", "physics", "chemistry",
-        "history", "geography", "biology", "astronomy",
-        "joke", "funny", "game", "movie", "music", "weather",
-        "recipe", "cooking", "sports", "football", "basketball"
-    ]
+    # Retrieve context from the document. Follow-ups like "and what about the deposit?" are
+    # embedded together with the previous question so they stay on topic. The relevance gate
+    # scores the new question on its own, or any question would pass after an on-topic turn.
+    previous_question = session.last_question
+    if previous_question:
+        query = f"{previous_question}\n{user_question}"
+        question_embedding, query_embedding = await embed_queries_async([user_question, query])
+    else:
+        query = user_question
+        question_embedding = query_embedding = await embed_query_async(query)
+    reused, similarity = session.reusable_retrieval(query_embedding)
+    if reused is not None:
+        print(f"♻ Reusing retrieved chunks from the previous turn (similarity {similarity:.3f})")
+        retrieved = reused._replace(query_embedding=query_embedding)
+    else:
+        retrieved = await query_chunks_async([payload.document_id], query_embedding, query_text=query)
+        session.remember_retrieval(query_embedding, retrieved)
+    context = retrieved.texts
+    if not context:
+        raise HTTPException(status_code=404, detail="No chunks found for this document_id.")
     
-    question_lower = user_question.lower()
-    if any(keyword in question_lower for keyword in off_topic_keywords):
-        return GenericResponse(
-            result="I'm specifically designed to answer questions about this document. Please ask me about the document's clauses, terms, obligations, payment terms, risks, or any other legal aspects contained in the document.",
-            note="Question is not related to document content"
+    # Validate that the question is related to the document content. The question and
+    # chunk embeddings are already here, so score locally and only ask the LLM when unsure.
+    score = relevance_score(question_embedding, retrieved.embeddings)
+    verdict = classify_relevance(score, current_embedding_model())
+    if verdict == BORDERLINE and RELEVANCE_LLM_FALLBACK:
+        verdict = RELEVANT if await _llm_relevance_check(user_question, context) else IRRELEVANT
+    print(f"Relevance score {score if score is None else round(score, 3)} -> {verdict}")
+    
+    # Check if the question is relevant
+    if verdict == IRRELEVANT:
+        return _fixed_response(
+            OFF_TOPIC_MESSAGE,
+            payload.stream,
+            note="Question is not related to document content",
+            response_model=ChatResponse,
+            extra=extra,
         )
     
-    # Build a prompt that includes the user's question and document context
+    # Build a prompt that includes the conversation so far, the user's question and document context
     prompt = build_legal_prompt(
         mode="Document Q&A",
         question=user_question,
         context_chunks=context,
         output_language=payload.output_language or "English",
+        metadatas=retrieved.metadatas,
+        history=session.history_text(),
     )
+
+    def remember(answer: str):
+        session.add_turn(user_question, answer)
+        compact_in_background(session, call_llm_async)
     
     # Get response from LLM
-    answer = call_llm(prompt)
-    
-    return GenericResponse(
-        result=answer,
-        note="Chat response generated!"
+    return await _respond(
+        request,
+        prompt,
+        payload.stream,
+        note="Chat response generated!",
+        on_complete=remember,
+        response_model=ChatResponse,
+        extra=extra,
     )
+
+
+@router.delete("/chat/{session_id}")
+def end_chat_session(session_id: str):
+    """Forget a conversation's history"""
+    if not chat_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found.")
+    return {"session_id": session_id, "deleted": True}
@@ -1,30 +1,49 @@
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Response, HTTPException
 
-from models import IngestResponse, TextIngestRequest
-from rag_utils import extract_text_from_upload, ingest_document
+from ingest_jobs import ingest_jobs
+from document_index import get_document_index
+from models import DocumentVersionsResponse, IngestJobResponse, IngestResponse, TextIngestRequest
+from rag_utils import iter_upload_pages, ingest_document, get_doc_hash
 
 router = APIRouter(prefix="/user", tags=["user"])
 
 
-@router.post("/upload-file", response_model=IngestResponse)
+@router.post("/upload-file", response_model=Union[IngestResponse, IngestJobResponse])
 def user_upload_file(
+    response: Response,
     file: UploadFile = File(...),
     user_id: Optional[str] = Form(None),
+    background: bool = Form(False),
+    previous_document_id: Optional[str] = Form(None),
 ):
-    text = extract_text_from_upload(file)
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="Could not read any text from uploaded file.")
+    if background:
+        # Return a job id right away; poll GET /jobs/{job_id} for progress
+        job = ingest_jobs.submit_upload(
+            file,
+            uploader_type="user",
+            uploader_id=user_id,
+            extra_metadata={"source_filename": file.filename or "unknown"},
+            previous_document_id=previous_document_id,
+        )
+        response.status_code = 202
+        return IngestJobResponse(**job)
 
+    # Pages are chunked, embedded and stored while later pages are still being extracted
     try:
         result = ingest_document(
-            full_text=text,
+            pages=(page.text for page in iter_upload_pages(file)),
             uploader_type="user",
             uploader_id=user_id,
             extra_metadata={"source_filename": file.filename or "unknown"},
+            previous_document_id=previous_document_id,
         )
         return IngestResponse(**result)
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Could not read any text from uploaded file.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to ingest document: {e}")
 
@@ -39,7 +58,24 @@ def user_upload_text(
             uploader_type="user",
             uploader_id=payload.uploader_id,
             extra_metadata={"source": "user_text"},
+            previous_document_id=payload.previous_document_id,
         )
         return IngestResponse(**result)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to ingest document: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to ingest document: {e}")
+
+
+@router.get("/documents/{document_id}/versions", response_model=DocumentVersionsResponse)
+def document_versions(document_id: str):
+    """Every version of a document, oldest first, with what each one changed.
+
+    Upload a revision with `previous_document_id` to add a version.
+    """
+    history = get_document_index().history(document_id)
+    if not history:
+        if get_doc_hash(document_id) is None:
+            raise HTTPException(status_code=404, detail="Document not found.")
+        history = [{"document_id": document_id, "version": 1}]
+    return DocumentVersionsResponse(document_id=document_id, versions=history)
@@ -0,0 +1,66 @@
+"""Cold-start import benchmark.
+
+    python startup_timing.py [--runs 5] [--top 15]
+
+Imports `main` in fresh interpreters with `-X importtime` and reports the
+median total import time and the modules with the largest cumulative import
+times, so a heavy top-level import shows up before it reaches a deploy.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+def import_times(module: str = "main") -> Dict[str, int]:
+    """Cumulative import time in microseconds per module, from one fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Keep the first (outermost) entry for a module name
+        times.setdefault(name.strip(), int(cumulative))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    per_module: Dict[str, List[int]] = defaultdict(list)
+    totals = []
+    for _ in range(args.runs):
+        times = import_times(args.module)
+        totals.append(times.get(args.module, 0))
+        for name, us in times.items():
+            per_module[name].append(us)
+
+    print(f"import {args.module}: median {statistics.median(totals) / 1e6:.3f}s "
+          f"(min {min(totals) / 1e6:.3f}s, max {max(totals) / 1e6:.3f}s, {args.runs} runs)")
+    ranked: List[Tuple[str, float]] = sorted(
+        ((name, statistics.median(values)) for name, values in per_module.items() if name != args.module),
+        key=lambda item: -item[1],
+    )
+    for name, us in ranked[: args.top]:
+        print(f"  {us / 1e3:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Embedding storage benchmark: recall vs. size for float16/int8 and truncated dimensions.
+
+    python storage_benchmark.py --cache-file embedding_cache/models_gemini-embedding-001_3072.vec
+    python storage_benchmark.py --npy vectors.npy --dims 3072,1536,768,256 --k 10
+
+Holds out `--queries` rows as queries, takes their exact float32 top-k
+neighbours among the remaining rows as ground truth, and reports for every
+(dimension, dtype) pair the bytes per vector, recall@k, and the time of a
+flat scan per query. Truncated dimensions are Matryoshka prefixes,
+re-normalized, as GEMINI_EMBED_DIM produces them.
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from embedding_cache import HASH_SIZE, HEADER_SIZE, MAGIC
+from vector_ops import STORAGE_DTYPES, quantize, row_sq_norms, squared_l2_distances, top_k_smallest, truncate_dims
+
+
+def _read_cache_file(path: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+        if header[:8] != MAGIC:
+            raise SystemExit(f"Not an embedding cache file: {path}")
+        dim = int(np.frombuffer(header[8:12], dtype="<u4")[0])
+        record = np.dtype([("hash", f"V{HASH_SIZE}"), ("vec", "<f4", (dim,))])
+        data = f.read()
+    rows = len(data) // record.itemsize
+    return np.frombuffer(data, dtype=record, count=rows)["vec"].copy()
+
+
+def _top_k(queries: np.ndarray, matrix: np.ndarray, k: int, scales=None) -> List[np.ndarray]:
+    sq_norms = row_sq_norms(matrix, scales)
+    return [top_k_smallest(squared_l2_distances(q, matrix, sq_norms, scales), k) for q in queries]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--cache-file", help="an embedding cache .vec file")
+    source.add_argument("--npy", help="a (rows, dim) float array saved with numpy.save")
+    parser.add_argument("--dims", default="3072,1536,768,256", help="dimensions to try (larger than the data are skipped)")
+    parser.add_argument("--dtypes", default=",".join(STORAGE_DTYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = _read_cache_file(args.cache_file) if args.cache_file else np.load(args.npy).astype(np.float32)
+    if len(vectors) <= args.queries + args.k:
+        raise SystemExit(f"Need more than {args.queries + args.k} vectors, got {len(vectors)}")
+    order = np.random.default_rng(args.seed).permutation(len(vectors))
+    queries, corpus = vectors[order[: args.queries]], vectors[order[args.queries:]]
+    full_dim = vectors.shape[1]
+    k = args.k
+    print(f"{len(corpus)} vectors of dim {full_dim}, {len(queries)} queries, recall@{k} against float32 at dim {full_dim}\n")
+
+    truth = _top_k(queries, corpus, k)
+    print(f"{'dim':>5} {'dtype':>8} {'bytes/vec':>10} {'size':>7} {'recall@' + str(k):>10} {'ms/query':>9}")
+    for dim in [int(d) for d in args.dims.split(",") if d.strip()]:
+        if dim > full_dim:
+            continue
+        q = truncate_dims(queries, dim)
+        c = truncate_dims(corpus, dim)
+        for dtype in [d.strip() for d in args.dtypes.split(",") if d.strip()]:
+            codes, scales = quantize(c, dtype)
+            per_vector = codes.itemsize * dim + (4 if scales is not None else 0)
+            started = time.perf_counter()
+            found = _top_k(q, codes, k, scales)
+            per_query = 1000 * (time.perf_counter() - started) / len(q)
+            recall = float(np.mean([len(set(a.tolist()) & set(b.tolist())) / k for a, b in zip(truth, found)]))
+            print(f"{dim:5d} {dtype:>8} {per_vector:10d} {per_vector / (4 * full_dim):7.1%} {recall:10.3f} {per_query:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Sequence
+
+from config import (
+    GROQ_MODEL_NAME,
+    RESULT_CACHE_ENABLED,
+    CONTEXT_TOKEN_BUDGET,
+    SUMMARY_GROUP_CHUNKS,
+    SUMMARY_GROUP_TOKENS,
+    SUMMARY_MAX_CONCURRENCY,
+    SUMMARY_CACHE_MAX_ENTRIES,
+)
+from rag_utils import build_legal_prompt, call_llm_async
+from result_cache import ResultCache, make_result_key
+from tokens import count_tokens
+
+# Bump whenever the map / reduce prompts change so cached partials are not reused
+SUMMARY_PROMPT_VERSION = "1"
+
+MAP_PROMPT = """You are LegalEase, summarizing one part of a longer legal document. Your summary will be combined with summaries of the other parts.
+Keep the parties, obligations, rights, payment terms, amounts, dates and deadlines, termination, liability, and anything unusual or risky. Keep clause numbers. Do not add facts that are not in the text.
+Write at most 200 words in English.
+
+Document part:
+{text}
+"""
+
+REDUCE_PROMPT = """You are LegalEase. Below are summaries of consecutive parts of one legal document, in order.
+Combine them into a single summary of those parts, in the same order. Keep the parties, obligations, rights, payment terms, amounts, dates and deadlines, termination, liability, and anything unusual or risky. Keep clause numbers. Do not add facts.
+Write at most 300 words in English.
+
+{text}
+"""
+
+
+class Partial(NamedTuple):
+    key: str  # content hash of everything this summary covers
+    text: str
+    tokens: int
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def group_boundaries(keys: Sequence[str], sizes: Sequence[int], mean_items: int, max_tokens: int) -> List[range]:
+    """Split items into consecutive groups at content-defined boundaries.
+
+    A group ends after an item whose hash is 0 mod `mean_items`, or before
+    an item that would take it past `max_tokens`. Boundaries depend on the
+    items' content, not their positions, so editing one item changes only
+    the group around it. Groups after it are the same as before.
+    """
+    groups: List[range] = []
+    start, tokens = 0, 0
+    for i, (key, size) in enumerate(zip(keys, sizes)):
+        if i > start and tokens + size > max_tokens:
+            groups.append(range(start, i))
+            start, tokens = i, 0
+        tokens += size
+        if int(key[:8], 16) % mean_items == 0:
+            groups.append(range(start, i + 1))
+            start, tokens = i + 1, 0
+    if start < len(keys):
+        groups.append(range(start, len(keys)))
+    return groups
+
+
+class MapReduceSummarizer:
+    """Hierarchical summaries of whole documents.
+
+    Map: chunks are grouped (see group_boundaries) and each group is
+    summarized by the LLM. Reduce: partial summaries are grouped the same
+    way and combined, level by level, until they fit `final_tokens`. The
+    caller then asks the final question over them. At most
+    `max_concurrency` LLM calls run at once.
+
+    Every partial is cached under a hash of the chunk texts it covers,
+    through all reduce levels. A re-summarized document, or a new version of
+    it, only calls the LLM for the groups whose chunks changed and the
+    branches above them.
+    """
+
+    def __init__(
+        self,
+        llm: Callable[[str], Awaitable[str]],
+        cache: Optional[ResultCache] = None,
+        max_concurrency: int = SUMMARY_MAX_CONCURRENCY,
+        group_chunks: int = SUMMARY_GROUP_CHUNKS,
+        group_tokens: int = SUMMARY_GROUP_TOKENS,
+        final_tokens: int = CONTEXT_TOKEN_BUDGET,
+        model_name: str = GROQ_MODEL_NAME,
+    ):
+        self.llm = llm
+        self.cache = cache
+        self.group_chunks = max(2, group_chunks)
+        self.group_tokens = group_tokens
+        self.final_tokens = final_tokens
+        self.model_name = model_name
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.llm_calls = 0
+
+    async def _summarize(self, key: str, prompt: str) -> Partial:
+        async def compute() -> str:
+            async with self._semaphore:
+                self.llm_calls += 1
+                return await self.llm(prompt)
+
+        if self.cache is None:
+            text = await compute()
+        else:
+            cache_key = make_result_key("summary-partial", key, SUMMARY_PROMPT_VERSION, self.model_name)
+            text = await self.cache.get_or_compute(cache_key, compute)
+        return Partial(key, text, count_tokens(text))
+
+    async def map(self, chunks: Sequence[str]) -> List[Partial]:
+        keys = [_digest(chunk) for chunk in chunks]
+        sizes = [count_tokens(chunk) for chunk in chunks]
+        groups = group_boundaries(keys, sizes, self.group_chunks, self.group_tokens)
+        return list(await asyncio.gather(*(
+            self._summarize(
+                _digest("map", *(keys[i] for i in group)),
+                MAP_PROMPT.format(text="\n\n".join(chunks[i] for i in group)),
+            )
+            for group in groups
+        )))
+
+    async def reduce(self, partials: List[Partial]) -> List[Partial]:
+        """Combine partials level by level until they fit `final_tokens` (or one is left)"""
+        while len(partials) > 1 and sum(p.tokens for p in partials) > self.final_tokens:
+            groups = group_boundaries(
+                [p.key for p in partials], [p.tokens for p in partials], self.group_chunks, self.group_tokens
+            )
+            if len(groups) == len(partials):
+                # No boundary merged anything (unlucky hashes); fall back to pairs so the tree shrinks
+                groups = [range(i, min(i + 2, len(partials))) for i in range(0, len(partials), 2)]
+            partials = list(await asyncio.gather(*(self._reduce_group([partials[i] for i in group]) for group in groups)))
+        return partials
+
+    async def _reduce_group(self, group: List[Partial]) -> Partial:
+        if len(group) == 1:
+            return group[0]
+        text = "\n\n---\n\n".join(f"Part {n}:\n{p.text}" for n, p in enumerate(group, start=1))
+        return await self._summarize(_digest("reduce", *(p.key for p in group)), REDUCE_PROMPT.format(text=text))
+
+    async def final_prompt(self, chunks: Sequence[str], mode: str, question: str, output_language: str) -> str:
+        """Map and reduce `chunks`, then build the task prompt over the remaining summaries"""
+        partials = await self.reduce(await self.map(chunks))
+        return build_legal_prompt(
+            mode=mode,
+            question=question,
+            context_chunks=[p.text for p in partials],
+            output_language=output_language,
+        )
+
+
+# Partial summaries get their own cache so they do not evict finished analyses
+summary_cache = ResultCache(max_entries=SUMMARY_CACHE_MAX_ENTRIES)
+
+document_summarizer = MapReduceSummarizer(call_llm_async, summary_cache if RESULT_CACHE_ENABLED else None)
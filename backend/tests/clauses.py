@@ -0,0 +1,26 @@
+"""Contract clauses whose variants change meaning but stay within 3 SimHash bits of the original."""
+
+_INDEMNITY = (
+    "{X} shall indemnify, defend and hold harmless {Y} and its officers, directors, employees and agents from and "
+    "against any and all claims, actions, losses, damages, liabilities, judgments, settlements, penalties, costs and "
+    "expenses, including reasonable attorneys' fees and court costs, arising out of or relating to any negligent act "
+    "or omission, wilful misconduct or breach of this Lease, any injury to persons or damage to property occurring on "
+    "the Premises, any violation of applicable law, regulation or ordinance, and any claim by a third party in "
+    "connection with the use or occupation of the Premises during the Term. The indemnified party shall give prompt "
+    "written notice of any claim, shall allow the indemnifying party to control the defence and settlement of the "
+    "claim, and shall provide reasonable cooperation at the indemnifying party's expense. This indemnity survives the "
+    "expiry or earlier termination of this Lease. The indemnifying party shall not settle any claim in a manner that "
+    "imposes any obligation or admission of liability on the indemnified party without its prior written consent, "
+    "which shall not be unreasonably withheld or delayed. The obligations in this clause are in addition to, and do "
+    "not limit, any other rights or remedies available at law or in equity, and apply whether the claim arises in "
+    "contract, tort, including negligence, breach of statutory duty or otherwise. Any amount payable under this "
+    "clause shall be paid within thirty days of a written demand accompanied by reasonable supporting evidence of the "
+    "loss claimed. Notices under this clause shall be given in writing to the address set out at the head of this "
+    "Lease or to such other address as a party may notify from time to time."
+)
+
+TENANT_INDEMNITY = _INDEMNITY.format(X="The Tenant", Y="the Landlord")
+# The same clause with the parties swapped
+LANDLORD_INDEMNITY = _INDEMNITY.format(X="The Landlord", Y="the Tenant")
+# The same clause with one obligation negated (also within 3 bits as a legal_chunker chunk)
+NEGATED_INDEMNITY = TENANT_INDEMNITY.replace("which shall not be unreasonably", "which shall be unreasonably")
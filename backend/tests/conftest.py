@@ -0,0 +1,51 @@
+"""Test settings: every store and cache under a temporary directory, and
+Gemini pointed at a local fake server (config reads both at import time,
+so this runs before any backend module is imported)."""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BACKEND_DIR, TESTS_DIR]
+
+from fake_gemini import FakeGeminiServer  # noqa: E402
+
+_tmp = tempfile.mkdtemp(prefix="legal_rag_tests_")
+_fake_gemini = FakeGeminiServer().start()
+
+os.environ.update({
+    "ADMIN_API_KEY": "test-admin",
+    "GROQ_API_KEY": "test-groq",
+    "GEMINI_API_KEY": "test-gemini",
+    "GEMINI_API_ENDPOINT": _fake_gemini.endpoint,
+    "GEMINI_EMBED_CALLS_PER_MINUTE": "600000",
+    "GEMINI_EMBED_BURST": "1000",
+    "GROQ_CALLS_PER_MINUTE": "600000",
+    "GROQ_BURST": "1000",
+    "USE_LOCAL_EMBEDDINGS": "false",
+    "STARTUP_WARMUP": "off",
+    "VECTOR_STORE_BACKEND": "local",
+    "LOCAL_VECTOR_STORE_DIR": os.path.join(_tmp, "vector_store"),
+    "EMBEDDING_CACHE_DIR": os.path.join(_tmp, "embedding_cache"),
+    "DOCUMENT_INDEX_PATH": os.path.join(_tmp, "document_index", "index.sqlite3"),
+    "LEXICAL_INDEX_PATH": os.path.join(_tmp, "lexical_index", "index.sqlite3"),
+    "INGEST_JOBS_DIR": os.path.join(_tmp, "ingest_jobs"),
+    "BULK_INGEST_DIR": os.path.join(_tmp, "bulk_checkpoints"),
+})
+for _name in ("CHROMA_API_KEY", "CHROMA_TENANT", "CHROMA_DATABASE", "RESULT_CACHE_DISK_PATH"):
+    os.environ.pop(_name, None)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    _fake_gemini.stop()
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture
+def fake_gemini() -> FakeGeminiServer:
+    _fake_gemini.reset()
+    return _fake_gemini
@@ -0,0 +1,89 @@
+"""A local stand-in for the Gemini embedding API.
+
+Answers embedContent / batchEmbedContents over plain HTTP with a
+deterministic unit vector per text (see `fake_embedding`), records every
+request, and can be told to fail the next few requests with a given status.
+"""
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+DIM = 3072
+
+
+def fake_embedding(text: str) -> List[float]:
+    """The embedding the fake server returns for `text`: one-hot at a position derived from its hash"""
+    vec = [0.0] * DIM
+    vec[int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % DIM] = 1.0
+    return vec
+
+
+def _text_of(content: dict) -> str:
+    return "".join(part.get("text", "") for part in content.get("parts", []))
+
+
+class FakeGeminiServer:
+    def __init__(self):
+        self.requests: List[dict] = []
+        self._failures: List[int] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-gemini", daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self._failures.clear()
+
+    def fail_next(self, count: int, status: int = 503):
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def batch_sizes(self) -> List[int]:
+        with self._lock:
+            return [len(r["body"].get("requests", [r["body"]])) for r in self.requests]
+
+    def _respond(self, path: str, body: dict):
+        with self._lock:
+            self.requests.append({"path": path, "body": body})
+            status = self._failures.pop(0) if self._failures else None
+        if status is not None:
+            return status, {"error": {"code": status, "message": "injected failure", "status": "UNAVAILABLE"}}
+        if "requests" in body:
+            return 200, {"embeddings": [{"values": fake_embedding(_text_of(r["content"]))} for r in body["requests"]]}
+        return 200, {"embedding": {"values": fake_embedding(_text_of(body["content"]))}}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+                status, payload = fake._respond(self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
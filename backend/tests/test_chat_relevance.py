@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from rag_utils import RetrievedContext
+from routes import task_routes
+
+DIM = 8
+ON_TOPIC = np.eye(DIM, dtype=np.float32)[0]
+OFF_TOPIC = np.eye(DIM, dtype=np.float32)[1]
+
+
+def _embedding(text: str) -> np.ndarray:
+    # A stand-in for a real model: anything mentioning the lease is close to the document
+    return ON_TOPIC if ("rent" in text or "deposit" in text) else OFF_TOPIC
+
+
+@pytest.fixture
+def client(monkeypatch):
+    llm_prompts = []
+
+    async def embed_query(question, task_type="retrieval_query"):
+        return _embedding(question)
+
+    async def embed_queries(questions, task_type="retrieval_query"):
+        return [_embedding(q) for q in questions]
+
+    async def query_chunks(document_ids, query_embedding, k=8, query_text=None):
+        texts = ["The monthly rent is 1,000 EUR.", "The deposit is two months' rent.", "Rent is due on the 1st."]
+        metadatas = [{"document_id": document_ids[0], "chunk_index": i} for i in range(len(texts))]
+        return RetrievedContext(texts, metadatas, np.stack([ON_TOPIC] * len(texts)), query_embedding)
+
+    async def call_llm(prompt):
+        llm_prompts.append(prompt)
+        return "answer"
+
+    monkeypatch.setattr(task_routes, "embed_query_async", embed_query)
+    monkeypatch.setattr(task_routes, "embed_queries_async", embed_queries)
+    monkeypatch.setattr(task_routes, "query_chunks_async", query_chunks)
+    monkeypatch.setattr(task_routes, "call_llm_async", call_llm)
+    monkeypatch.setattr(task_routes, "current_embedding_model", lambda: "all-MiniLM-L6-v2")
+
+    app = FastAPI()
+    app.include_router(task_routes.router)
+    with TestClient(app) as test_client:
+        test_client.llm_prompts = llm_prompts
+        yield test_client
+
+
+def _chat(client, message, session_id=None):
+    response = client.post("/chat", json={"document_id": "lease", "message": message, "session_id": session_id})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_on_topic_follow_up_is_answered(client):
+    first = _chat(client, "What is the rent?")
+    follow_up = _chat(client, "And the deposit?", first["session_id"])
+
+    assert first["result"] == follow_up["result"] == "answer"
+
+
+def test_off_topic_follow_up_after_on_topic_turn_is_rejected(client):
+    first = _chat(client, "What is the rent?")
+    assert first["result"] == "answer"
+
+    # Combined with the previous question this would look on-topic; on its own it is not
+    off_topic = _chat(client, "Who won the election in 1990?", first["session_id"])
+
+    assert off_topic["result"] == task_routes.OFF_TOPIC_MESSAGE
+    assert len(client.llm_prompts) == 1
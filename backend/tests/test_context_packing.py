@@ -0,0 +1,65 @@
+from clauses import LANDLORD_INDEMNITY, NEGATED_INDEMNITY, TENANT_INDEMNITY
+from context_packing import pack_context
+
+CLAUSE = (
+    "The Supplier shall indemnify and hold harmless the Customer, its affiliates, officers, directors and employees "
+    "against all losses, damages, liabilities, costs and expenses, including reasonable legal fees, arising out of "
+    "or in connection with any breach of this Agreement by the Supplier, its employees, agents or subcontractors, "
+    "any negligent act or omission of the Supplier, or any claim that the deliverables infringe the intellectual "
+    "property rights of a third party. This indemnity survives termination or expiry of this Agreement."
+)
+# One word apart: SimHash within 3 bits, and neither text contains the other
+VARIANT = CLAUSE.replace("directors and employees", "directors or employees")
+
+
+def test_duplicates_within_a_document_are_dropped():
+    respaced = CLAUSE.replace(", ", ",\n")
+    packed = pack_context(
+        [CLAUSE, respaced, CLAUSE[:200], "Payment is due within thirty days of the invoice date."],
+        [
+            {"document_id": "a", "chunk_index": 3},
+            {"document_id": "a", "chunk_index": 9},
+            {"document_id": "a", "chunk_index": 10},
+            {"document_id": "a", "chunk_index": 12},
+        ],
+        token_budget=1000,
+    )
+
+    assert packed.duplicates == 2
+    assert packed.chunks_used == 2
+
+
+def test_mirrored_and_negated_clauses_of_a_document_are_kept():
+    # Both variants are within 3 SimHash bits of the first clause, but each says something different
+    texts = [TENANT_INDEMNITY, LANDLORD_INDEMNITY, NEGATED_INDEMNITY]
+    packed = pack_context(
+        texts,
+        [{"document_id": "lease", "chunk_index": i} for i in (2, 5, 8)],
+        token_budget=2000,
+    )
+
+    assert packed.duplicates == 0
+    assert packed.sections == texts
+
+
+def test_near_identical_clauses_from_different_documents_both_survive():
+    # /contract-comparison: the same clause in both contracts, differing in one word
+    packed = pack_context(
+        [CLAUSE, VARIANT],
+        [{"document_id": "contract-1", "chunk_index": 4}, {"document_id": "contract-2", "chunk_index": 7}],
+        token_budget=1000,
+    )
+
+    assert packed.duplicates == 0
+    assert packed.sections == [CLAUSE, VARIANT]
+
+
+def test_identical_clause_in_two_documents_is_kept_for_each():
+    packed = pack_context(
+        [CLAUSE, CLAUSE],
+        [{"document_id": "contract-1", "chunk_index": 0}, {"document_id": "contract-2", "chunk_index": 0}],
+        token_budget=1000,
+    )
+
+    assert packed.duplicates == 0
+    assert len(packed.sections) == 2
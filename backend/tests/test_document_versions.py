@@ -0,0 +1,48 @@
+import numpy as np
+
+import rag_utils
+from clauses import LANDLORD_INDEMNITY, NEGATED_INDEMNITY, TENANT_INDEMNITY
+from fake_gemini import fake_embedding
+from vector_store import get_vector_store
+
+RENT = (
+    "The Tenant shall pay the monthly rent of 1,450 USD in advance on the first day of each month by bank transfer "
+    "to the account named by the Landlord. Rent received after the fifth day of the month incurs a late fee of 75 USD, "
+    "plus 10 USD for each further day of delay, and the Landlord may apply any payment first to unpaid fees."
+)
+
+
+def _lease(indemnity: str) -> str:
+    return (
+        f"1. RENT\n1.1 {RENT}\n"
+        f"2. INDEMNITY BY TENANT\n2.1 {indemnity}\n"
+        f"3. INDEMNITY BY LANDLORD\n3.1 {LANDLORD_INDEMNITY}\n"
+    )
+
+
+def _stored(document_id: str):
+    """(text, embedding) of every chunk of a document"""
+    found = get_vector_store().get(where={"document_id": document_id}, include=["documents", "embeddings"])
+    return list(zip(found["documents"], found["embeddings"]))
+
+
+def test_revised_clause_gets_a_new_embedding(fake_gemini, monkeypatch):
+    monkeypatch.setattr(rag_utils, "NEAR_DUPLICATE_REUSE", True)
+    first = rag_utils.ingest_document(full_text=_lease(TENANT_INDEMNITY))
+    before = _stored(first["document_id"])
+    fake_gemini.reset()
+
+    second = rag_utils.ingest_document(
+        full_text=_lease(NEGATED_INDEMNITY), previous_document_id=first["document_id"]
+    )
+    after = _stored(second["document_id"])
+
+    before_texts = {text for text, _ in before}
+    revised = [(text, emb) for text, emb in after if text not in before_texts]
+    assert revised and all("which shall be unreasonably" in text for text, _ in revised)
+    for text, emb in revised:
+        np.testing.assert_array_equal(emb, fake_embedding(text))
+        assert not any(np.array_equal(emb, old) for _, old in before)
+    # Only the revised chunks reached the embedding API; the rest came from the first version
+    assert sum(fake_gemini.batch_sizes()) == len(revised)
+    assert second["changes"]["embeddings_reused"] == len(after) - len(revised)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import rag_utils
+from clauses import LANDLORD_INDEMNITY, NEGATED_INDEMNITY, TENANT_INDEMNITY
+from fake_gemini import DIM, fake_embedding
+from vector_store import LocalVectorStore
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_utils, "NEAR_DUPLICATE_REUSE", True)
+    store = LocalVectorStore(str(tmp_path / "store"))
+    stored = np.zeros(DIM, dtype=np.float32)
+    stored[0] = 1.0
+    metadata = {"document_id": "lease-v1", "chunk_index": 0, "embedding_model": rag_utils.current_embedding_model()}
+    rag_utils.write_chunks(store, [TENANT_INDEMNITY], [metadata], [stored])
+    yield store
+    store.close()
+
+
+def test_respaced_chunk_reuses_the_stored_embedding(collection, fake_gemini):
+    respaced = TENANT_INDEMNITY.replace(". ", ".\n  ")
+
+    (embedding,) = rag_utils.embed_document_chunks(collection, [respaced])
+
+    assert embedding[0] == 1.0
+    assert fake_gemini.requests == []
+
+
+def test_edited_chunks_within_a_few_simhash_bits_are_embedded_again(collection, fake_gemini):
+    # Both are within 3 SimHash bits of the stored clause but mean something else
+    texts = [LANDLORD_INDEMNITY, NEGATED_INDEMNITY]
+
+    embeddings = rag_utils.embed_document_chunks(collection, texts)
+
+    for text, embedding in zip(texts, embeddings):
+        np.testing.assert_array_equal(embedding, fake_embedding(text))
@@ -0,0 +1,36 @@
+from legal_chunker import CLAUSE, HEADING, classify_line, iter_legal_chunks
+
+DOCUMENT = """1. DEFINITIONS
+1.1 "Agreement" means this services agreement together with its schedules, as amended from time to time by the parties in writing.
+1.2 "Services" means the consulting services described in Schedule 1, including any deliverables produced by the Supplier.
+2. TERM
+2.1 This Agreement starts on the Effective Date and continues for an initial term of twenty four months unless terminated earlier.
+2.2 Either party may renew the Agreement for a further twelve months by written notice given at least sixty days before expiry.
+3. Fees and Payment
+3.1 The Customer shall pay the fees set out in Schedule 2 within thirty days of receiving a valid invoice from the Supplier.
+"""
+
+
+def test_numbered_titles_are_headings():
+    assert classify_line("1. DEFINITIONS") == HEADING
+    assert classify_line("3. Fees and Payment") == HEADING
+    assert classify_line("Article 5 - Termination") == HEADING
+    assert classify_line("1.1 The Supplier shall provide the Services with reasonable care.") == CLAUSE
+    assert classify_line("2. The Customer shall pay the fees on time.") == CLAUSE
+    assert classify_line("(a) Confidential Information") == CLAUSE
+
+
+def test_numbered_heading_is_carried_to_the_next_chunk():
+    chunks = list(iter_legal_chunks([DOCUMENT], max_tokens=60, min_tokens=20))
+
+    for title in ("1. DEFINITIONS", "2. TERM", "3. Fees and Payment"):
+        (chunk,) = [c for c in chunks if title in c.text]
+        # The title opens the chunk with its clauses instead of trailing the previous one
+        assert chunk.text.startswith(title)
+        assert chunk.section == title
+        assert chunk.text != title
+
+
+def test_offsets_point_into_the_document():
+    for chunk in iter_legal_chunks([DOCUMENT], max_tokens=60, min_tokens=20):
+        assert DOCUMENT[chunk.char_start:chunk.char_end].split() == chunk.text.split()
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_limiter import RateLimitExceeded, TokenBucket
+
+
+@pytest.mark.parametrize("calls_per_minute", [0, -5, float("nan")])
+def test_rate_must_be_positive(calls_per_minute):
+    with pytest.raises(ValueError, match="calls_per_minute"):
+        TokenBucket("test", calls_per_minute)
+
+
+def test_burst_is_free_then_calls_are_spaced():
+    bucket = TokenBucket("test", calls_per_minute=600, burst=3)  # one token per 0.1s
+
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    started = time.monotonic()
+    waited = bucket.acquire()
+    assert 0.05 < waited <= 0.1
+    assert time.monotonic() - started >= waited * 0.9
+    assert bucket.metrics()["waited_calls"] == 1
+
+
+def test_max_wait_rejects_instead_of_waiting():
+    bucket = TokenBucket("test", calls_per_minute=1, burst=1, max_wait=1.0)
+    bucket.acquire()
+
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        bucket.acquire()
+    assert exc_info.value.retry_after > 1.0
+    assert bucket.metrics()["rejected_calls"] == 1
+
+
+def test_cancelled_async_wait_gives_the_token_back():
+    bucket = TokenBucket("test", calls_per_minute=60, burst=1)  # one token per second
+
+    async def run():
+        await bucket.acquire_async()
+        waiting = asyncio.ensure_future(bucket.acquire_async())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(run())
+    # Only the first call's token is spent: the bucket is back to roughly empty, not in debt
+    assert bucket._tokens > -0.1
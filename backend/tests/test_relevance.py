@@ -0,0 +1,45 @@
+import pytest
+
+from relevance import BORDERLINE, IRRELEVANT, RELEVANT, classify_relevance, gate_metrics
+from relevance_benchmark import load_question_set
+from routes.task_routes import OFF_TOPIC_KEYWORDS
+
+
+def test_classify_relevance_uses_the_model_thresholds():
+    assert classify_relevance(0.40, "all-MiniLM-L6-v2") == RELEVANT
+    assert classify_relevance(0.25, "all-MiniLM-L6-v2@int8") == BORDERLINE
+    assert classify_relevance(0.10, "all-MiniLM-L6-v2") == IRRELEVANT
+    assert classify_relevance(None, "all-MiniLM-L6-v2") == BORDERLINE
+
+
+def test_gate_metrics():
+    scores = [0.9, 0.8, 0.6, 0.3, 0.7, 0.2, 0.1, 0.5]
+    labels = [True, True, True, True, False, False, False, False]
+    metrics = gate_metrics(scores, labels, reject=0.4, accept=0.7)
+
+    # accepted: 0.9, 0.8 (relevant), 0.7 (irrelevant); rejected: 0.3 (relevant), 0.2, 0.1
+    assert metrics["accept_precision"] == pytest.approx(2 / 3)
+    assert metrics["accept_recall"] == pytest.approx(2 / 4)
+    assert metrics["reject_precision"] == pytest.approx(2 / 3)
+    assert metrics["reject_recall"] == pytest.approx(2 / 4)
+    assert metrics["borderline_rate"] == pytest.approx(2 / 8)
+    assert metrics["relevant_refused"] == 1
+    assert metrics["irrelevant_answered"] == 1
+
+
+def test_gate_metrics_without_accepted_questions():
+    metrics = gate_metrics([0.1, 0.2], [True, False], reject=0.5, accept=0.9)
+    assert metrics["accept_precision"] is None
+    assert metrics["accept_recall"] == 0.0
+
+
+def test_question_set_is_labeled_and_reaches_the_gate():
+    documents = load_question_set()
+    assert documents
+    for document in documents:
+        assert document["chunks"]
+        labels = [q["relevant"] for q in document["questions"]]
+        assert True in labels and False in labels
+        for q in document["questions"]:
+            # The keyword filter would refuse these before the gate ever scores them
+            assert not any(keyword in q["question"].lower() for keyword in OFF_TOPIC_KEYWORDS), q["question"]
@@ -0,0 +1,77 @@
+import asyncio
+
+import numpy as np
+from google.generativeai import protos
+
+from fake_gemini import fake_embedding
+from rate_limiter import TokenBucket
+from remote_embeddings import RemoteEmbeddingEngine
+
+
+def _engine(**kwargs) -> RemoteEmbeddingEngine:
+    kwargs.setdefault("bucket", TokenBucket("test_embed", calls_per_minute=600000, burst=1000))
+    return RemoteEmbeddingEngine(**kwargs)
+
+
+def test_async_embed_with_custom_endpoint(fake_gemini):
+    # A custom endpoint uses the REST transport, whose embed_content_async result can't be awaited
+    texts = [f"clause {i}" for i in range(7)]
+    result = asyncio.run(_engine(batch_size=3).embed_async(texts))
+
+    assert result.ok
+    assert sorted(fake_gemini.batch_sizes()) == [1, 3, 3]
+    for text, emb in zip(texts, result.embeddings):
+        np.testing.assert_array_equal(emb, fake_embedding(text))
+
+
+def test_sync_embed_batches_in_order(fake_gemini):
+    texts = [f"clause {i}" for i in range(10)]
+    result = _engine(batch_size=4, concurrency=3).embed(texts)
+
+    assert result.ok
+    assert sorted(fake_gemini.batch_sizes()) == [2, 4, 4]
+    for text, emb in zip(texts, result.embeddings):
+        np.testing.assert_array_equal(emb, fake_embedding(text))
+
+
+def test_query_task_type_is_sent(fake_gemini):
+    _engine().embed(["what is the notice period?"], task_type="retrieval_query")
+
+    (request,) = fake_gemini.requests
+    assert ":batchEmbedContents" in request["path"]
+    # The REST transport sends enums as integers
+    assert request["body"]["requests"][0]["taskType"] == protos.TaskType.RETRIEVAL_QUERY
+
+
+def test_retryable_errors_are_retried(fake_gemini):
+    fake_gemini.fail_next(2, status=503)
+    texts = ["first", "second"]
+
+    sync_result = _engine(backoff_base=0.01).embed(texts)
+    assert sync_result.ok
+
+    fake_gemini.fail_next(2, status=429)
+    async_result = asyncio.run(_engine(backoff_base=0.01).embed_async(texts))
+    assert async_result.ok
+    for emb_sync, emb_async, text in zip(sync_result.embeddings, async_result.embeddings, texts):
+        np.testing.assert_array_equal(emb_sync, fake_embedding(text))
+        np.testing.assert_array_equal(emb_async, fake_embedding(text))
+
+
+def test_failed_batches_are_reported_not_zero_filled(fake_gemini):
+    # One batch at a time, so the injected failure hits the first batch
+    fake_gemini.fail_next(1, status=400)
+    texts = ["a", "b", "c", "d"]
+    result = _engine(batch_size=2, concurrency=1).embed(texts)
+
+    assert not result.ok
+    assert sorted(result.failures) == [0, 1]
+    assert result.embeddings[0] is None and result.embeddings[1] is None
+    np.testing.assert_array_equal(result.embeddings[2], fake_embedding("c"))
+
+    fake_gemini.fail_next(1, status=400)
+    result = asyncio.run(_engine(batch_size=2, concurrency=1).embed_async(texts))
+    assert sorted(result.failures) == [0, 1]
+    assert result.embeddings[0] is None and result.embeddings[1] is None
+    np.testing.assert_array_equal(result.embeddings[3], fake_embedding("d"))
+
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+
+import httpx
+import result_cache
+from rag_utils import RetrievedContext
+from result_cache import ResultCache
+from routes import task_routes
+
+
+def _cache(**kwargs) -> ResultCache:
+    kwargs.setdefault("disk_path", None)
+    return ResultCache(**kwargs)
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = _cache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.get("k") == "value"
+
+
+def test_waiters_attach_to_a_claimed_computation():
+    cache = _cache()
+
+    async def compute():
+        raise AssertionError("the claim holder provides the value")
+
+    async def run():
+        claim = cache.claim("k")
+        assert cache.claim("k") is None
+        waiter = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        await claim.complete("streamed")
+        return await waiter
+
+    assert asyncio.run(run()) == "streamed"
+    assert cache.get("k") == "streamed"
+
+
+def test_released_claim_is_taken_over_by_a_waiter():
+    cache = _cache()
+
+    async def compute():
+        return "computed"
+
+    async def run():
+        claim = cache.claim("k")
+        waiter = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        claim.release()  # e.g. the streaming client disconnected
+        return await waiter
+
+    assert asyncio.run(run()) == "computed"
+
+
+def test_disk_tier_runs_off_the_event_loop(tmp_path, monkeypatch):
+    cache = _cache(disk_path=str(tmp_path / "results.sqlite3"))
+    threads = []
+    for name in ("get", "put"):
+        original = getattr(result_cache._DiskTier, name)
+
+        def record(self, *args, _original=original):
+            threads.append(threading.get_ident())
+            return _original(self, *args)
+
+        monkeypatch.setattr(result_cache._DiskTier, name, record)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await cache.put_async("k", "value")
+        cache._memory.clear()  # force a read from the disk tier
+        value = await cache.get_async("k")
+        return loop_thread, value
+
+    loop_thread, value = asyncio.run(run())
+    assert value == "value"
+    assert len(threads) == 2 and loop_thread not in threads
+
+
+# ------------- streamed analyses -------------
+
+@pytest.fixture
+def analysis_app(monkeypatch):
+    llm = {"streams": 0, "calls": 0}
+
+    async def retrieve(document_ids, question, k=8):
+        texts = ["The rent is 1,000 EUR per month."]
+        return RetrievedContext(texts, [{"document_id": document_ids[0], "chunk_index": 0}], np.ones((1, 4)), [1.0] * 4)
+
+    async def get_doc_hash(document_id):
+        return f"hash-{document_id}"
+
+    async def stream_llm(prompt):
+        llm["streams"] += 1
+
+        async def deltas():
+            for token in ("The ", "rent ", "is ", "1,000 EUR."):
+                await asyncio.sleep(0.02)
+                yield token
+
+        return deltas()
+
+    async def call_llm(prompt):
+        llm["calls"] += 1
+        return "computed answer"
+
+    monkeypatch.setattr(task_routes, "analysis_cache", _cache())
+    monkeypatch.setattr(task_routes, "retrieve_chunks_async", retrieve)
+    monkeypatch.setattr(task_routes, "get_doc_hash_async", get_doc_hash)
+    monkeypatch.setattr(task_routes, "stream_llm_async", stream_llm)
+    monkeypatch.setattr(task_routes, "call_llm_async", call_llm)
+
+    app = FastAPI()
+    app.include_router(task_routes.router)
+    app.state.llm = llm
+    return app
+
+
+async def _post(app, stream: bool):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/summary", json={"document_id": "lease", "stream": stream})
+
+
+def test_requests_during_a_streamed_miss_share_its_answer(analysis_app):
+    async def run():
+        streamed = asyncio.ensure_future(_post(analysis_app, stream=True))
+        await asyncio.sleep(0.01)  # the stream has claimed the key
+        others = await asyncio.gather(_post(analysis_app, stream=False), _post(analysis_app, stream=True))
+        return await streamed, others
+
+    streamed, (plain, second_stream) = asyncio.run(run())
+
+    assert streamed.status_code == 200 and '"result": "The rent is 1,000 EUR."' in streamed.text
+    assert plain.json()["result"] == "The rent is 1,000 EUR."
+    assert '"result": "The rent is 1,000 EUR."' in second_stream.text
+    assert analysis_app.state.llm == {"streams": 1, "calls": 0}
+    assert task_routes.analysis_cache._inflight == {}
+
+
+def test_failed_stream_releases_its_claim(analysis_app, monkeypatch):
+    async def broken_stream(prompt):
+        async def deltas():
+            yield "partial "
+            raise RuntimeError("upstream closed")
+
+        return deltas()
+
+    monkeypatch.setattr(task_routes, "stream_llm_async", broken_stream)
+
+    async def run():
+        streamed = asyncio.ensure_future(_post(analysis_app, stream=True))
+        await asyncio.sleep(0)
+        plain = await _post(analysis_app, stream=False)
+        return await streamed, plain
+
+    streamed, plain = asyncio.run(run())
+
+    assert "event: error" in streamed.text
+    assert plain.json()["result"] == "computed answer"
+    assert task_routes.analysis_cache._inflight == {}
@@ -0,0 +1,124 @@
+import asyncio
+import re
+
+from result_cache import ResultCache
+from summarizer import MapReduceSummarizer, group_boundaries
+
+
+def _key(value: int) -> str:
+    # group_boundaries only looks at the first 8 hex digits
+    return f"{value:08x}" + "0" * 56
+
+
+class StubLLM:
+    """Answers every prompt with a summary of `words` words and records the prompts"""
+
+    def __init__(self, words: int = 20):
+        self.words = words
+        self.prompts = []
+
+    async def __call__(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return f"summary {len(self.prompts)} " + "word " * self.words
+
+    def reduce_prompts(self):
+        return [p for p in self.prompts if "Below are summaries" in p]
+
+
+def _chunks(n: int, words: int = 30):
+    return [f"Clause {i}. " + " ".join(f"term{i}x{j}" for j in range(words)) for i in range(n)]
+
+
+def _summarizer(llm, **kwargs) -> MapReduceSummarizer:
+    kwargs.setdefault("cache", ResultCache(max_entries=1000, disk_path=None))
+    return MapReduceSummarizer(llm, **kwargs)
+
+
+# ------------- group boundaries -------------
+
+def test_groups_end_after_a_boundary_hash():
+    # 0 mod 4 is a boundary
+    keys = [_key(v) for v in (1, 2, 4, 5, 6, 7, 8, 9)]
+    assert group_boundaries(keys, [1] * 8, mean_items=4, max_tokens=100) == [range(0, 3), range(3, 7), range(7, 8)]
+
+
+def test_groups_split_before_exceeding_the_token_budget():
+    keys = [_key(v) for v in (1, 2, 3, 5, 6)]
+    assert group_boundaries(keys, [40, 40, 40, 40, 40], mean_items=4, max_tokens=100) == [
+        range(0, 2), range(2, 4), range(4, 5)
+    ]
+
+
+def test_boundaries_are_content_defined():
+    keys = [_key(v) for v in (1, 2, 4, 5, 6, 8, 9, 10, 12, 13)]
+    before = group_boundaries(keys, [1] * len(keys), mean_items=4, max_tokens=100)
+    # An edited item (5 -> 7) in the second group leaves every other group alone
+    edited = keys[:3] + [_key(7)] + keys[4:]
+    after = group_boundaries(edited, [1] * len(keys), mean_items=4, max_tokens=100)
+    assert before == after
+
+    # An inserted item only shifts the positions of later groups, not their members
+    inserted = keys[:1] + [_key(3)] + keys[1:]
+    groups = group_boundaries(inserted, [1] * len(inserted), mean_items=4, max_tokens=100)
+    assert [[inserted[i] for i in g] for g in groups][1:] == [[keys[i] for i in g] for g in before][1:]
+
+
+# ------------- cached partials -------------
+
+def test_resummarizing_reuses_cached_partials():
+    llm = StubLLM()
+    summarizer = _summarizer(llm, group_chunks=3, group_tokens=10_000, final_tokens=50)
+    chunks = _chunks(12)
+
+    first = asyncio.run(summarizer.final_prompt(chunks, "Document Summary", "Summarize.", "English"))
+    calls = len(llm.prompts)
+    assert calls > 1
+
+    second = asyncio.run(summarizer.final_prompt(chunks, "Document Summary", "Summarize.", "English"))
+    assert len(llm.prompts) == calls
+    assert second == first
+
+
+def test_editing_one_chunk_only_resummarizes_its_branch():
+    llm = StubLLM()
+    summarizer = _summarizer(llm, group_chunks=3, group_tokens=10_000, final_tokens=50)
+    chunks = _chunks(24)
+    partials = asyncio.run(summarizer.map(chunks))
+    calls = len(llm.prompts)
+
+    edited = list(chunks)
+    edited[5] = edited[5].replace("term5x0", "amended")
+    asyncio.run(summarizer.map(edited))
+
+    new_prompts = llm.prompts[calls:]
+    # The edited chunk's group, plus the next one if the edit removed a boundary hash
+    assert 1 <= len(new_prompts) <= 2 < len(partials)
+    assert any("amended" in p for p in new_prompts)
+
+
+# ------------- reduce -------------
+
+def test_reduce_falls_back_to_pairs_when_no_group_fits():
+    # Each chunk and each summary is too large to share a group with another, so
+    # group_boundaries only returns single items and reduce has to pair them up
+    llm = StubLLM(words=100)
+    summarizer = _summarizer(llm, group_chunks=1000, group_tokens=150, final_tokens=150)
+
+    partials = asyncio.run(summarizer.reduce(asyncio.run(summarizer.map(_chunks(4, words=110)))))
+
+    assert len(partials) == 1
+    reduce_prompts = llm.reduce_prompts()
+    # 4 partials -> 2 pairs -> 1
+    assert len(reduce_prompts) == 3
+    for prompt in reduce_prompts:
+        assert re.findall(r"^Part \d+:", prompt, re.MULTILINE) == ["Part 1:", "Part 2:"]
+
+
+def test_reduce_stops_once_partials_fit():
+    llm = StubLLM(words=10)
+    summarizer = _summarizer(llm, group_chunks=1000, group_tokens=150, final_tokens=1000)
+
+    partials = asyncio.run(summarizer.reduce(asyncio.run(summarizer.map(_chunks(4, words=110)))))
+
+    assert len(partials) == 4
+    assert llm.reduce_prompts() == []
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from vector_store import LocalVectorStore, VectorStoreLocked
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "store"))
+    rng = np.random.default_rng(0)
+    store.upsert(
+        ids=[f"{doc}_{i}" for doc in ("a", "b") for i in range(3)],
+        embeddings=rng.standard_normal((6, 16)).astype(np.float32),
+        metadatas=[{"document_id": doc, "chunk_index": i} for doc in ("a", "b") for i in range(3)],
+        documents=[f"{doc} chunk {i}" for doc in ("a", "b") for i in range(3)],
+    )
+    yield store
+    store.close()
+
+
+def test_query_filtered_to_documents(store):
+    result = store.query([np.ones(16)], n_results=5, where={"document_id": {"$in": ["b"]}}, include=["metadatas"])
+
+    assert len(result["ids"][0]) == 3
+    assert {m["document_id"] for m in result["metadatas"][0]} == {"b"}
+
+
+def test_empty_in_filter_matches_nothing(store):
+    where = {"document_id": {"$in": []}}
+    result = store.query(
+        [np.ones(16), np.zeros(16)], n_results=5, where=where, include=["documents", "metadatas", "embeddings"]
+    )
+
+    assert result["ids"] == [[], []]
+    assert result["documents"] == [[], []]
+    assert store.get(where=where)["ids"] == []
+
+
+def test_second_owner_is_refused_until_close(store):
+    with pytest.raises(VectorStoreLocked):
+        LocalVectorStore(store.directory)
+
+    store.close()
+    reopened = LocalVectorStore(store.directory)
+    assert reopened.count() == 6
+    reopened.close()
+
+
+def test_bulk_ingest_refuses_a_store_the_server_owns(store, tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "lease.txt").write_text("1. RENT\\n1.1 The rent is 1,000 EUR per month.", encoding="utf-8")
+    env = dict(os.environ, VECTOR_STORE_BACKEND="local", LOCAL_VECTOR_STORE_DIR=store.directory)
+
+    done = subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, "bulk_ingest.py"), str(corpus), "--workers", "1"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+
+    assert done.returncode == 1
+    assert "in use by another process" in done.stdout
+    assert store.count() == 6
@@ -0,0 +1,24 @@
+import re
+
+try:
+    import tiktoken  # optional: exact BPE counts
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Token count used to size chunks and prompts.
+
+    Exact (cl100k_base) when tiktoken is installed. Otherwise an estimate:
+    one token per word or punctuation mark, or one per 4 characters for text
+    with long words, whichever is larger.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(len(_PIECES.findall(text)), len(text) // 4)
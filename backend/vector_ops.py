@@ -0,0 +1,119 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+# Matrices may be stored as float32, float16, or int8 with one float32 scale per row
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_BLOCK_FLOATS = 1 << 17  # compact rows are converted to float32 in blocks of about 512 KB, which stay in cache
+
+
+def as_matrix(vectors) -> np.ndarray:
+    """Stack embeddings (lists, arrays or a 2D array) into a contiguous float32 matrix"""
+    return np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def cosine_similarities(query: Sequence[float], matrix) -> np.ndarray:
+    """Cosine similarity of one query vector against every row of `matrix`"""
+    m = as_matrix(matrix)
+    if m.size == 0:
+        return np.zeros(0, dtype=np.float32)
+    q = normalize_rows(as_matrix(query))
+    return normalize_rows(m) @ q
+
+
+def truncate_dims(vectors, dim: Optional[int]) -> np.ndarray:
+    """Keep the first `dim` components of each row and re-normalize.
+
+    Matryoshka-trained embeddings (Gemini's among them) put the most
+    information in the leading dimensions, so a prefix is still a usable,
+    smaller embedding once it is scaled back to unit length.
+    """
+    m = as_matrix(vectors)
+    if not dim or m.shape[-1] <= dim:
+        return m
+    return np.ascontiguousarray(normalize_rows(m[..., :dim]), dtype=np.float32)
+
+
+def quantize(vectors, dtype: str = "float32") -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(codes, per-row scales) for storage; scales is None except for int8.
+
+    int8 is symmetric scalar quantization: each row is divided by
+    max(|row|) / 127 and rounded, so it costs a quarter of float32 plus one
+    float per row.
+    """
+    m = as_matrix(vectors)
+    if dtype == "int8":
+        scales = np.abs(m).max(axis=-1) / 127.0 if m.size else np.zeros(m.shape[:-1], dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(m / scales[..., None]), -127, 127).astype(np.int8)
+        return codes, scales
+    return m.astype(STORAGE_DTYPES[dtype], copy=False), None
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    m = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        m = m * np.asarray(scales, dtype=np.float32)[..., None]
+    return np.ascontiguousarray(m)
+
+
+def dot_products(query: Sequence[float], matrix: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """row . query for every row of a float32, float16 or int8 matrix.
+
+    float32 goes straight to BLAS. Compact matrices are converted into a
+    small reused float32 buffer block by block, so scoring never holds a
+    full float32 copy of them.
+    """
+    q = as_matrix(query)
+    if matrix.dtype == np.float32:
+        out = matrix @ q
+    else:
+        out = np.empty(len(matrix), dtype=np.float32)
+        rows = max(16, _BLOCK_FLOATS // max(1, matrix.shape[1]))
+        buffer = np.empty((min(rows, len(matrix)), matrix.shape[1]), dtype=np.float32)
+        for start in range(0, len(matrix), rows):
+            block = matrix[start:start + rows]
+            np.copyto(buffer[: len(block)], block, casting="unsafe")
+            out[start:start + len(block)] = buffer[: len(block)] @ q
+    if scales is not None:
+        out *= scales
+    return out
+
+
+def row_sq_norms(matrix: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """||row||^2 of the (dequantized) rows"""
+    out = np.empty(len(matrix), dtype=np.float32)
+    rows = max(16, _BLOCK_FLOATS // max(1, matrix.shape[1])) if matrix.ndim == 2 else 1
+    for start in range(0, len(matrix), rows):
+        block = np.asarray(matrix[start:start + rows], dtype=np.float32)
+        out[start:start + rows] = np.einsum("ij,ij->i", block, block)
+    if scales is not None:
+        out *= np.square(scales)
+    return out
+
+
+def squared_l2_distances(
+    query: Sequence[float],
+    matrix: np.ndarray,
+    sq_norms: Optional[np.ndarray] = None,
+    scales: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """||row - query||^2 for every row, the metric Chroma ranks by by default"""
+    q = as_matrix(query)
+    if sq_norms is None:
+        sq_norms = row_sq_norms(matrix, scales)
+    return np.maximum(sq_norms - 2.0 * dot_products(q, matrix, scales) + float(q @ q), 0.0)
+
+
+def top_k_smallest(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest values, in ascending order"""
+    k = min(k, len(values))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(values, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    return top[np.argsort(values[top], kind="stable")]
@@ -0,0 +1,596 @@
+import os
+import re
+import json
+import atexit
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_ops import STORAGE_DTYPES, dequantize, quantize, row_sq_norms, squared_l2_distances, top_k_smallest
+from config import (
+    VECTOR_STORE_BACKEND,
+    EMBEDDING_STORAGE_DTYPE,
+    LOCAL_VECTOR_STORE_DIR,
+    LOCAL_VECTOR_ANN_MIN_ROWS,
+    LOCAL_VECTOR_FLAT_MAX,
+    get_chroma_client,
+)
+
+try:
+    import hnswlib  # optional: approximate search for large local stores
+except ImportError:
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; ownership is not enforced there
+    fcntl = None
+
+_MIN_CAPACITY = 1024
+_VECTOR_FILES = {"float32": "vectors.f32", "float16": "vectors.f16", "int8": "vectors.i8"}
+_METADATA_KEY = re.compile(r"^[A-Za-z0-9_]+$")
+_SQL_OPS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _where_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate a Chroma-style `where` filter into a SQL condition on the chunks table"""
+    clauses, params = [], []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_sql(sub) for sub in cond]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, sub_params in parts:
+                params.extend(sub_params)
+            continue
+
+        if not _METADATA_KEY.match(key):
+            raise ValueError(f"Unsupported metadata key: {key!r}")
+        field = "document_id" if key == "document_id" else f"json_extract(metadata, '$.{key}')"
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, value in cond.items():
+            if op in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if op == "$in" else "1")
+                    continue
+                marks = ", ".join("?" for _ in values)
+                clauses.append(f"{field} {'IN' if op == '$in' else 'NOT IN'} ({marks})")
+                params.extend(values)
+            elif op in _SQL_OPS:
+                clauses.append(f"{field} {_SQL_OPS[op]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return " AND ".join(clauses) or "1", params
+
+
+def _document_ids_only(where: Dict[str, Any]) -> Optional[List[str]]:
+    """The document_ids a filter selects, if it filters on nothing else"""
+    if list(where) != ["document_id"]:
+        return None
+    cond = where["document_id"]
+    if isinstance(cond, str):
+        return [cond]
+    if isinstance(cond, dict) and list(cond) == ["$eq"]:
+        return [cond["$eq"]]
+    if isinstance(cond, dict) and list(cond) == ["$in"]:
+        return list(cond["$in"])
+    return None
+
+
+class VectorStoreLocked(RuntimeError):
+    """Raised when another process already owns a local vector store directory"""
+
+
+def _lock_directory(directory: str):
+    """Take the store's owner lock; it is held for as long as the returned file stays open"""
+    fh = open(os.path.join(directory, "owner.lock"), "a+")
+    if fcntl:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fh.seek(0)
+            owner = fh.read().strip() or "unknown"
+            fh.close()
+            raise VectorStoreLocked(f"Local vector store {directory} is in use by another process (pid {owner})")
+        fh.seek(0)
+        fh.truncate()
+        fh.write(str(os.getpid()))
+        fh.flush()
+    return fh
+
+
+class LocalVectorStore:
+    """In-process vector store with the same get/query/upsert/update/delete API
+    as the Chroma collection, so it can stand in for Chroma Cloud.
+
+    Vectors live in a memory-mapped matrix (one row per chunk slot) and
+    documents/metadata in SQLite next to it. The matrix is float32, float16,
+    or int8 with a float32 scale per row (`dtype`, fixed when the store is
+    created); searches score the compact rows directly and returned
+    embeddings are dequantized to float32. Queries filtered to a few
+    documents - every query the app makes - are exact: a matmul over just
+    those documents' rows, found through an in-memory document_id index.
+    Unfiltered or very broad queries on a large store use an HNSW index when
+    hnswlib is installed, and fall back to exact search otherwise.
+
+    Distances are squared L2, matching Chroma's default space. One process
+    owns a store directory at a time: it holds an exclusive flock on the
+    directory's owner.lock until close(), and a second process opening the
+    store gets VectorStoreLocked.
+    """
+
+    def __init__(
+        self,
+        directory: str = LOCAL_VECTOR_STORE_DIR,
+        ann_min_rows: int = LOCAL_VECTOR_ANN_MIN_ROWS,
+        flat_max: int = LOCAL_VECTOR_FLAT_MAX,
+        dtype: str = EMBEDDING_STORAGE_DTYPE,
+    ):
+        self.directory = directory
+        self.ann_min_rows = ann_min_rows
+        self.flat_max = flat_max
+        os.makedirs(directory, exist_ok=True)
+        self._owner_lock = _lock_directory(directory)
+        self._ann_path = os.path.join(directory, "index.hnsw")
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "chunks.sqlite3"), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                slot INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document_id TEXT,
+                document TEXT,
+                metadata TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_document_id ON chunks(document_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+        self.dim: Optional[int] = self._meta_int("dim")
+        self.dtype = self._stored_dtype(dtype)
+        self._vectors_path = os.path.join(directory, _VECTOR_FILES[self.dtype])
+        self._scales_path = os.path.join(directory, "scales.f32")
+        self._generation = self._meta_int("generation") or 0
+        self._rows = 0  # slots in use, including deleted ones
+        self._capacity = 0
+        self._matrix: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None  # int8 only
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._slots_by_doc: Dict[Optional[str], set] = {}
+        self._doc_by_slot: Dict[int, Optional[str]] = {}
+        self._doc_arrays: Dict[str, np.ndarray] = {}
+        self._slot_by_id: Dict[str, int] = {}
+        self._ann = None
+        self._load()
+
+    # ---- persistence ----
+
+    def _meta_int(self, key: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else None
+
+    def _set_meta(self, key: str, value: Any):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _stored_dtype(self, wanted: str) -> str:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dtype'").fetchone()
+        if row:
+            if row[0] != wanted:
+                print(f"⚠️ Local vector store {self.directory} holds {row[0]} vectors; ignoring EMBEDDING_STORAGE_DTYPE={wanted}")
+            return row[0]
+        if self.dim is not None:
+            return "float32"  # created before vectors could be stored compactly
+        if wanted not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported storage dtype: {wanted}")
+        self._set_meta("dtype", wanted)
+        return wanted
+
+    @staticmethod
+    def _grow_file(path: str, size: int):
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+
+    def _map(self, capacity: int):
+        """(Re)map the vector file with room for `capacity` rows"""
+        dtype = np.dtype(STORAGE_DTYPES[self.dtype])
+        self._grow_file(self._vectors_path, capacity * self.dim * dtype.itemsize)
+        # Readers may still hold the old map; it is released once they are done with it
+        self._matrix = np.memmap(self._vectors_path, dtype=dtype, mode="r+", shape=(capacity, self.dim))
+        if self.dtype == "int8":
+            self._grow_file(self._scales_path, capacity * 4)
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r+", shape=(capacity,))
+        grow = capacity - self._capacity
+        self._sq_norms = np.concatenate([self._sq_norms, np.zeros(grow, dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+        self._capacity = capacity
+
+    def _ensure_capacity(self, rows: int):
+        if rows > self._capacity:
+            self._map(max(_MIN_CAPACITY, self._capacity * 2, rows))
+
+    def _load(self):
+        max_slot = self._conn.execute("SELECT MAX(slot) FROM chunks").fetchone()[0]
+        self._rows = 0 if max_slot is None else max_slot + 1
+        if self.dim is None:
+            return
+
+        self._ensure_capacity(max(self._rows, 1))
+        for slot, chunk_id, document_id in self._conn.execute("SELECT slot, id, document_id FROM chunks"):
+            self._alive[slot] = True
+            self._index(chunk_id, slot, document_id)
+
+        scales = self._scales[: self._rows] if self._scales is not None else None
+        self._sq_norms[: self._rows] = row_sq_norms(self._matrix[: self._rows], scales)
+        print(f"✓ Local vector store: {len(self._slot_by_id)} {self.dtype} chunks loaded from {self.directory}")
+
+    def _vectors(self, slots, matrix=None, scales=None) -> np.ndarray:
+        """float32 copies of the rows in `slots`"""
+        matrix = self._matrix if matrix is None else matrix
+        if scales is None:
+            scales = self._scales
+        return dequantize(matrix[slots], scales[slots] if scales is not None else None)
+
+    def _bump_generation(self):
+        self._generation += 1
+        self._set_meta("generation", self._generation)
+
+    # ---- writes ----
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+        documents: Optional[Sequence[str]] = None,
+    ):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding per id")
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate ids in upsert")
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_meta("dim", self.dim)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            slots = []
+            for chunk_id in ids:
+                slot = self._slot_by_id.get(chunk_id)
+                if slot is None:
+                    slot = self._rows
+                    self._rows += 1
+                slots.append(slot)
+            self._ensure_capacity(self._rows)
+
+            # Vectors first: a row in SQLite always points at a written vector
+            index = np.asarray(slots)
+            codes, scales = quantize(vectors, self.dtype)
+            self._matrix[index] = codes
+            self._matrix.flush()
+            if scales is not None:
+                self._scales[index] = scales
+                self._scales.flush()
+
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (slot, id, document_id, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (slot, chunk_id, metadata.get("document_id"), document, json.dumps(metadata))
+                        for chunk_id, slot, document, metadata in zip(ids, slots, documents, metadatas)
+                    ],
+                )
+                self._bump_generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            for chunk_id, slot, metadata in zip(ids, slots, metadatas):
+                self._unindex(chunk_id)
+                self._index(chunk_id, slot, metadata.get("document_id"))
+            # Norms of what was stored, so distances to quantized rows are consistent
+            self._sq_norms[index] = row_sq_norms(codes, scales)
+            self._alive[index] = True
+            if self._ann is not None:
+                self._ann_reserve(self._rows)
+                self._ann.add_items(dequantize(codes, scales), index)
+
+    add = upsert
+
+    def update(
+        self,
+        ids: Sequence[str],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+        documents: Optional[Sequence[str]] = None,
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+    ):
+        """Update existing chunks. Metadata is merged into what is stored, like Chroma."""
+        with self._lock:
+            found = self.get(ids=list(ids), include=["metadatas", "documents", "embeddings"])
+            current = {
+                chunk_id: (metadata, document, embedding)
+                for chunk_id, metadata, document, embedding in zip(
+                    found["ids"], found["metadatas"], found["documents"], found["embeddings"]
+                )
+            }
+            new_ids, new_embs, new_metas, new_docs = [], [], [], []
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in current:
+                    continue
+                metadata, document, embedding = current[chunk_id]
+                if metadatas is not None:
+                    metadata = dict(metadata)
+                    for key, value in metadatas[i].items():
+                        if value is None:
+                            metadata.pop(key, None)
+                        else:
+                            metadata[key] = value
+                new_ids.append(chunk_id)
+                new_metas.append(metadata)
+                new_docs.append(documents[i] if documents is not None else document)
+                new_embs.append(embeddings[i] if embeddings is not None else embedding)
+            if new_ids:
+                self.upsert(new_ids, new_embs, new_metas, new_docs)
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            rows = self._select("slot, id", ids=ids, where=where)
+            if not rows:
+                return
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM chunks WHERE slot = ?", [(slot,) for slot, _ in rows])
+                self._bump_generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            for slot, chunk_id in rows:
+                self._unindex(chunk_id)
+                self._alive[slot] = False
+                if self._ann is not None:
+                    self._ann.mark_deleted(slot)
+
+    def _index(self, chunk_id: str, slot: int, document_id: Optional[str]):
+        self._slot_by_id[chunk_id] = slot
+        self._doc_by_slot[slot] = document_id
+        self._slots_by_doc.setdefault(document_id, set()).add(slot)
+        self._doc_arrays.pop(document_id, None)
+
+    def _unindex(self, chunk_id: str):
+        slot = self._slot_by_id.pop(chunk_id, None)
+        if slot is None:
+            return
+        document_id = self._doc_by_slot.pop(slot)
+        slots = self._slots_by_doc[document_id]
+        slots.discard(slot)
+        self._doc_arrays.pop(document_id, None)
+        if not slots:
+            del self._slots_by_doc[document_id]
+
+    # ---- reads ----
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._slot_by_id)
+
+    def _select(
+        self,
+        columns: str,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> List[tuple]:
+        clauses, params = [], []
+        if ids is not None:
+            if not ids:
+                return []
+            clauses.append(f"id IN ({', '.join('?' for _ in ids)})")
+            params.extend(ids)
+        if where:
+            sql, where_params = _where_sql(where)
+            clauses.append(sql)
+            params.extend(where_params)
+        query = f"SELECT {columns} FROM chunks"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY slot"
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([-1 if limit is None else limit, offset or 0])
+        return self._conn.execute(query, params).fetchall()
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Iterable[str] = ("metadatas", "documents"),
+    ) -> Dict[str, Any]:
+        include = set(include)
+        with self._lock:
+            rows = self._select("slot, id, document, metadata", ids=ids, where=where, limit=limit, offset=offset)
+            matrix, scales = self._matrix, self._scales
+        result: Dict[str, Any] = {"ids": [row[1] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row[2] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[3]) for row in rows]
+        if "embeddings" in include:
+            if rows:
+                result["embeddings"] = self._vectors([row[0] for row in rows], matrix, scales)
+            else:
+                result["embeddings"] = np.zeros((0, self.dim or 0), dtype=np.float32)
+        return result
+
+    def _candidate_slots(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Slots a filter allows (None = every live slot)"""
+        if not where:
+            return None
+        document_ids = _document_ids_only(where)
+        if document_ids is None:
+            return np.asarray([row[0] for row in self._select("slot", where=where)], dtype=np.int64)
+
+        arrays = []
+        for document_id in document_ids:
+            array = self._doc_arrays.get(document_id)
+            if array is None:
+                array = np.fromiter(sorted(self._slots_by_doc.get(document_id, ())), dtype=np.int64)
+                self._doc_arrays[document_id] = array
+            arrays.append(array)
+        if not arrays:
+            return np.zeros(0, dtype=np.int64)  # {"$in": []} matches nothing
+        return np.concatenate(arrays) if len(arrays) > 1 else arrays[0]
+
+    def _exact_search(self, query: np.ndarray, slots: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scales = self._scales[slots] if self._scales is not None else None
+        distances = squared_l2_distances(query, self._matrix[slots], self._sq_norms[slots], scales)
+        top = top_k_smallest(distances, k)
+        return slots[top], distances[top]
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Iterable[str] = ("metadatas", "documents", "distances"),
+    ) -> Dict[str, Any]:
+        include = set(include)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        with self._lock:
+            slots = self._candidate_slots(where)
+            if slots is None:
+                slots = np.flatnonzero(self._alive[: self._rows])
+            use_ann = len(slots) > self.flat_max and self._ann_ready()
+            hits = []
+            for query in queries:
+                k = min(n_results, len(slots))
+                if k == 0:
+                    hits.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)))
+                elif use_ann:
+                    hits.append(self._ann_search(query, k, slots if where else None))
+                else:
+                    hits.append(self._exact_search(query, slots, k))
+            matrix, scales = self._matrix, self._scales
+
+            wanted = sorted({int(s) for found, _ in hits for s in found})
+            rows = {}
+            if wanted:
+                marks = ", ".join("?" for _ in wanted)
+                for slot, chunk_id, document, metadata in self._conn.execute(
+                    f"SELECT slot, id, document, metadata FROM chunks WHERE slot IN ({marks})", wanted
+                ):
+                    rows[slot] = (chunk_id, document, metadata)
+
+        result: Dict[str, Any] = {"ids": []}
+        for key in ("documents", "metadatas", "distances", "embeddings"):
+            if key in include:
+                result[key] = []
+        for found, distances in hits:
+            result["ids"].append([rows[int(s)][0] for s in found])
+            if "documents" in include:
+                result["documents"].append([rows[int(s)][1] for s in found])
+            if "metadatas" in include:
+                result["metadatas"].append([json.loads(rows[int(s)][2]) for s in found])
+            if "distances" in include:
+                result["distances"].append(distances.tolist())
+            if "embeddings" in include:
+                result["embeddings"].append(
+                    self._vectors(found, matrix, scales) if matrix is not None else np.zeros((0, self.dim or 0), dtype=np.float32)
+                )
+        return result
+
+    # ---- approximate search ----
+
+    def _ann_ready(self) -> bool:
+        if hnswlib is None or len(self._slot_by_id) < self.ann_min_rows:
+            return False
+        if self._ann is None:
+            self._ann = self._load_or_build_ann()
+        return True
+
+    def _ann_reserve(self, rows: int):
+        if rows > self._ann.get_max_elements():
+            self._ann.resize_index(max(rows, self._ann.get_max_elements() * 2))
+
+    def _load_or_build_ann(self):
+        index = hnswlib.Index(space="l2", dim=self.dim)
+        if os.path.exists(self._ann_path) and self._meta_int("ann_generation") == self._generation:
+            index.load_index(self._ann_path, max_elements=self._capacity, allow_replace_deleted=True)
+            index.set_ef(64)
+            return index
+
+        print(f"Building HNSW index over {len(self._slot_by_id)} chunks...")
+        index.init_index(max_elements=self._capacity, ef_construction=200, M=16, allow_replace_deleted=True)
+        live = np.flatnonzero(self._alive[: self._rows])
+        for start in range(0, len(live), 65536):
+            batch = live[start:start + 65536]
+            index.add_items(self._vectors(batch), batch)
+        index.set_ef(64)
+        self.save_ann(index)
+        return index
+
+    def save_ann(self, index=None):
+        """Write the HNSW index to disk so the next start does not rebuild it"""
+        index = index or self._ann
+        if index is None:
+            return
+        with self._lock:
+            index.save_index(self._ann_path)
+            self._set_meta("ann_generation", self._generation)
+
+    def close(self):
+        """Save the HNSW index, close the database and release the directory"""
+        self.save_ann()
+        with self._lock:
+            self._conn.close()
+            self._owner_lock.close()
+
+    def _ann_search(self, query: np.ndarray, k: int, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        allowed_set = set(allowed.tolist()) if allowed is not None else None
+        labels, distances = self._ann.knn_query(
+            query, k=k, filter=(lambda label: label in allowed_set) if allowed_set is not None else None
+        )
+        return labels[0].astype(np.int64), distances[0]
+
+
+# ---------- backend selection ----------
+
+_local_store: Optional[LocalVectorStore] = None
+_local_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """The collection chunks are stored in: Chroma Cloud or the local store (VECTOR_STORE_BACKEND)"""
+    global _local_store
+    if VECTOR_STORE_BACKEND == "local":
+        with _local_store_lock:
+            if _local_store is None:
+                _local_store = LocalVectorStore()
+                atexit.register(_local_store.save_ann)
+            return _local_store
+
+    client, collection = get_chroma_client()
+    return collection
@@ -0,0 +1,109 @@
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from config import GEMINI_API_KEY, get_genai, get_groq_client
+from vector_store import get_vector_store
+from local_embeddings import local_embedding_service
+import rag_utils
+
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """What the startup warm-up has loaded so far, for /ready.
+
+    Each step records its status ("pending", "ok", "failed" or "skipped"),
+    how long it took, and the error if it failed. The app is ready once every
+    required step is ok or skipped; an optional step (the local encoder, which
+    falls back to Gemini, or precomputed question embeddings) failing is
+    reported but does not hold readiness back.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
+        self.import_seconds: Optional[float] = None
+        self.finished = False
+
+    def run(self, name: str, fn: Callable[[], Any], required: bool = True) -> bool:
+        with self._lock:
+            self._steps[name] = {"status": "pending", "required": required}
+        started = time.perf_counter()
+        try:
+            fn()
+            status, error = "ok", None
+        except Exception as e:
+            status, error = "failed", str(e)
+            print(f"✗ Warm-up step '{name}' failed: {e}")
+        self.record(name, status, time.perf_counter() - started, error, required)
+        return status == "ok"
+
+    def record(self, name: str, status: str, seconds: float = 0.0, error: Optional[str] = None, required: bool = True):
+        with self._lock:
+            self._steps[name] = {"status": status, "required": required, "seconds": round(seconds, 3)}
+            if error:
+                self._steps[name]["error"] = error
+
+    def skip(self, name: str, reason: str):
+        with self._lock:
+            self._steps[name] = {"status": "skipped", "required": False, "reason": reason}
+
+    def mark_finished(self):
+        with self._lock:
+            self.finished = True
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            required = [s for s in self._steps.values() if s["required"]]
+            if any(s["status"] == "failed" for s in required):
+                return FAILED
+            if self.finished and all(s["status"] in ("ok", "skipped") for s in required):
+                return READY
+            return WARMING
+
+    def as_dict(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                "status": state,
+                "import_seconds": self.import_seconds,
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "steps": {name: dict(step) for name, step in self._steps.items()},
+            }
+
+
+readiness = Readiness()
+
+
+def _warm_local_encoder():
+    if rag_utils.get_local_encoder() is None:
+        raise RuntimeError(f"could not load '{rag_utils.LOCAL_EMBED_MODEL_NAME}'")
+    # The first encode() call allocates buffers and compiles kernels; pay for it here, not in a
+    # request. Going through the service also starts its worker thread.
+    local_embedding_service.embed(["warm-up"])
+
+
+def run_warmup():
+    """Load clients, the vector store and the local encoder, recording each step in `readiness`"""
+    started = time.perf_counter()
+    readiness.run("groq_client", get_groq_client)
+    if GEMINI_API_KEY:
+        # Only a fallback when local embeddings are on
+        readiness.run("gemini_client", get_genai, required=not rag_utils.USE_LOCAL_EMBEDDINGS)
+    else:
+        readiness.skip("gemini_client", "GEMINI_API_KEY not set")
+    if rag_utils.USE_LOCAL_EMBEDDINGS:
+        readiness.run("local_encoder", _warm_local_encoder, required=False)
+    else:
+        readiness.skip("local_encoder", "USE_LOCAL_EMBEDDINGS is off")
+    readiness.run("vector_store", get_vector_store)
+    readiness.mark_finished()
+
+    state = readiness.state
+    mark = "✓" if state == READY else "✗"
+    print(f"{mark} Warm-up finished in {time.perf_counter() - started:.1f}s ({state})")